@@ -1,64 +1,287 @@
+import argparse
+import csv
+import io
+import json
+import os
+import numpy as np
 import pandas as pd
 
-# Load the data
-btc_transactions = pd.read_csv('btc_transactions.csv')
-btc_energy = pd.read_csv('btc_energy.csv', skiprows=1)
-eth_transactions = pd.read_csv('eth_transactions.csv')
-eth1_energy = pd.read_csv('eth1_energy.csv', skiprows=1)
-eth2_energy = pd.read_csv('eth2_energy.csv', skiprows=0)
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+MASTER_FILE = 'master_transactions_per_kw.csv'
+INGEST_STATE_FILE = 'ingest_state.json'
+MASTER_COLUMNS = ['Date', 'Bitcoin Transactions per kW', 'Ethereum Transactions per kW']
+END_DATE = '2024-03-29'
 
-# Convert 'Date' column to datetime
-btc_transactions['Date'] = pd.to_datetime(btc_transactions['Date'])
-btc_energy['Date'] = pd.to_datetime(btc_energy['Date and Time'])
-btc_energy.drop(['Timestamp', 'Date and Time'], axis=1, inplace=True)
-eth_transactions['Date'] = pd.to_datetime(eth_transactions['Date(UTC)'], format='%m/%d/%Y')
-eth1_energy['Date'] = pd.to_datetime(eth1_energy['Date and Time'])
-eth1_energy.drop('Date and Time', axis=1, inplace=True)
-eth2_energy['Date'] = pd.to_datetime(eth2_energy['Date and Time'])
-eth2_energy.drop('Date and Time', axis=1, inplace=True)
+# Last proof-of-work day served by eth1_energy; eth2_energy takes over the next day
+ETH_MERGE_LAST_POW = '2022-09-14'
+ETH_MERGE_FIRST_POS = '2022-09-15'
 
-# Ensure all data is in the expected format
-btc_transactions['Transactions'] = btc_transactions['Transactions'].astype(float)
-eth_transactions['Value'] = eth_transactions['Value'].astype(float)
+# CCAF power estimates: lower bound, best guess, upper bound
+ENERGY_BOUNDS = ['MIN', 'GUESS', 'MAX']
 
-# Convert Bitcoin's energy consumption from GW to kW
-btc_energy['Energy Consumption (kW)'] = btc_energy['power GUESS, GW'] * 1e6
+# Factor from each declared unit to the unit used in the master (energy in kW)
+UNITS = {'count': 1.0, 'USD': 1.0, 'kW': 1.0, 'GW': 1e6}
 
-# Convert energy consumption from GW to kW for eth1_energy
-eth1_energy['Energy Consumption (kW)'] = eth1_energy['power GUESS, GW'] * 1e6
+# How a source value is carried onto the master dates: 'exact' only fills dates the source
+# has a row for; 'ffill' carries the latest row forward for up to max_gap_days
+GAP_POLICIES = ['exact', 'ffill']
 
-# Delete entries after 2022-09-14 from eth1_energy
-eth1_energy = eth1_energy[eth1_energy['Date'] <= '2022-09-14']
+# Source registry. For each raw export: header lines before the first data row, the date
+# column and its format, the value column read (energy sources name one per bound through
+# {bound}) and its unit, the gap policy, an optional validity window, whether its dates
+# define master rows, and whether the file may be absent. Only the date and value columns
+# are read, all values as float64.
+SOURCES = {
+    'btc_transactions': {'file': 'btc_transactions.csv', 'header_lines': 1, 'date_column': 'Date',
+                         'date_format': '%Y-%m-%d', 'value': 'Transactions', 'unit': 'count'},
+    'btc_energy': {'file': 'btc_energy.csv', 'header_lines': 2, 'date_column': 'Date and Time',
+                   'date_format': '%Y-%m-%dT%H:%M:%S', 'value': 'power {bound}, GW', 'unit': 'GW'},
+    'eth_transactions': {'file': 'eth_transactions.csv', 'header_lines': 1, 'date_column': 'Date(UTC)',
+                         'date_format': '%m/%d/%Y', 'value': 'Value', 'unit': 'count'},
+    'eth1_energy': {'file': 'eth1_energy.csv', 'header_lines': 2, 'date_column': 'Date and Time',
+                    'date_format': '%Y-%m-%dT%H:%M:%S', 'value': 'power {bound}, GW', 'unit': 'GW',
+                    'until': ETH_MERGE_LAST_POW},
+    'eth2_energy': {'file': 'eth2_energy.csv', 'header_lines': 1, 'date_column': 'Date and Time',
+                    'date_format': '%Y-%m-%dT%H:%M:%S', 'value': 'power {bound}, kW', 'unit': 'kW',
+                    'from': ETH_MERGE_FIRST_POS},
+    # CoinGecko market chart exports (snapped_at, price, market_cap, total_volume)
+    'btc_market_cap': {'file': 'btc_market_cap.csv', 'header_lines': 1, 'date_column': 'snapped_at',
+                       'date_format': '%Y-%m-%d %H:%M:%S UTC', 'value': 'market_cap', 'unit': 'USD',
+                       'gap': 'ffill', 'max_gap_days': 3, 'defines_rows': False, 'optional': True},
+    'eth_market_cap': {'file': 'eth_market_cap.csv', 'header_lines': 1, 'date_column': 'snapped_at',
+                       'date_format': '%Y-%m-%d %H:%M:%S UTC', 'value': 'market_cap', 'unit': 'USD',
+                       'gap': 'ffill', 'max_gap_days': 3, 'defines_rows': False, 'optional': True},
+}
+RAW_FILES = [source['file'] for source in SOURCES.values() if not source.get('optional')]
 
-# Filter eth2_energy to only include data from 2022-09-15 onwards
-eth2_energy = eth2_energy[eth2_energy['Date'] >= '2022-09-15']
+# Sources behind each master column: transactions over energy (the energy sources in
+# order of precedence) for transactions per kW, and an optional market cap
+CHAINS = {
+    'Bitcoin': {'transactions': 'btc_transactions', 'energy': ['btc_energy'], 'market_cap': 'btc_market_cap'},
+    'Ethereum': {'transactions': 'eth_transactions', 'energy': ['eth1_energy', 'eth2_energy'],
+                 'market_cap': 'eth_market_cap'},
+}
 
-#Quest
-eth2_energy['Energy Consumption (kW)'] = eth2_energy['power GUESS, kW']
+def _source_path(data_dir, name):
+    return os.path.join(data_dir, SOURCES[name]['file'])
 
+# Sources whose files are present; a missing required file is an error
+def available_sources(data_dir=DATA_DIR):
+    names = []
+    for name, source in SOURCES.items():
+        if os.path.exists(_source_path(data_dir, name)):
+            names.append(name)
+        elif not source.get('optional'):
+            raise FileNotFoundError(_source_path(data_dir, name))
+    return names
 
-# Combine eth1_energy and eth2_energy
-eth_energy = pd.concat([eth1_energy, eth2_energy])
+# Raw files the master is built from, for cache keys
+def raw_files(data_dir=DATA_DIR):
+    return [SOURCES[name]['file'] for name in available_sources(data_dir)]
 
-# Merge the datasets on the date column
-btc_data = pd.merge(btc_transactions, btc_energy, on='Date', how='outer')
-eth_data = pd.merge(eth_transactions, eth_energy, on='Date', how='outer')
+def _value_columns(source):
+    if '{bound}' in source['value']:
+        return [source['value'].format(bound=bound) for bound in ENERGY_BOUNDS]
+    return [source['value']]
 
-# Calculate transactions per kW for both cryptocurrencies
-btc_data['Transactions per kW'] = btc_data['Transactions'] / btc_data['Energy Consumption (kW)']
-eth_data['Transactions per kW'] = eth_data['Value'] / eth_data['Energy Consumption (kW)']
+# Read the data rows of a source starting at a byte offset. Returns the rows with a parsed
+# 'Date' column and the byte offset just past each row; a trailing partial line is left
+# unread so the next call picks it up once it is complete.
+def read_source_rows(data_dir, name, offset=0):
+    source = SOURCES[name]
+    with open(_source_path(data_dir, name), 'rb') as f:
+        header = [f.readline() for _ in range(source['header_lines'])]
+        columns = next(csv.reader([header[-1].decode()]))
+        f.seek(max(offset, f.tell()))
+        start = f.tell()
+        lines = f.read().splitlines(keepends=True)
+    if lines and not lines[-1].endswith(b'\n'):
+        lines.pop()
+    ends = start + np.cumsum([len(line) for line in lines], dtype=np.int64)
+    keep = [bool(line.strip()) for line in lines]
+    lines = [line for line, k in zip(lines, keep) if k]
+    value_columns = _value_columns(source)
+    usecols = [source['date_column']] + value_columns
+    if lines:
+        rows = pd.read_csv(io.BytesIO(b''.join(lines)), names=columns, header=None, usecols=usecols,
+                           dtype={**dict.fromkeys(value_columns, np.float64), source['date_column']: str})
+    else:
+        rows = pd.DataFrame({column: pd.Series(dtype=np.float64 if column in value_columns else str) for column in usecols})
+    rows['Date'] = pd.to_datetime(rows[source['date_column']], format=source['date_format'])
+    return rows, ends[np.array(keep, dtype=bool)]
 
-# Merge Bitcoin and Ethereum data into a master DataFrame
-master_data = btc_data[['Date', 'Transactions per kW']].copy()
-master_data.rename(columns={'Transactions per kW': 'Bitcoin Transactions per kW'}, inplace=True)
-master_data = pd.merge(master_data, eth_data[['Date', 'Transactions per kW']], on='Date', how='outer')
+# Dates and values (in master units) of one source, limited to its validity window and
+# sorted by date; energy sources give the requested bound
+def source_series(rows, name, bound='GUESS'):
+    source = SOURCES[name]
+    dates = rows['Date'].to_numpy(dtype='datetime64[ns]')
+    values = rows[source['value'].format(bound=bound)].to_numpy(dtype=np.float64) * UNITS[source['unit']]
+    keep = np.ones(len(dates), dtype=bool)
+    if 'from' in source:
+        keep &= dates >= np.datetime64(source['from'])
+    if 'until' in source:
+        keep &= dates <= np.datetime64(source['until'])
+    order = np.argsort(dates[keep], kind='stable')
+    return dates[keep][order], values[keep][order]
 
-# Rename the 'Transactions per kW' column for Ethereum
-master_data.rename(columns={'Transactions per kW': 'Ethereum Transactions per kW'}, inplace=True)
+# As-of lookup of a sorted source on sorted master dates: the latest source row at or
+# before each date, kept if the gap policy allows its age (NaN otherwise)
+def asof_align(dates, source_dates, source_values, gap='exact', max_gap_days=0):
+    if gap not in GAP_POLICIES:
+        raise ValueError(f"Unknown gap policy {gap!r} (expected one of {GAP_POLICIES})")
+    aligned = np.full(len(dates), np.nan)
+    if not len(source_dates):
+        return aligned
+    positions = np.searchsorted(source_dates, dates, side='right') - 1
+    found = positions >= 0
+    age = dates[found] - source_dates[positions[found]]
+    tolerance = np.timedelta64(max_gap_days if gap == 'ffill' else 0, 'D')
+    fresh = np.flatnonzero(found)[age <= tolerance]
+    aligned[fresh] = source_values[positions[fresh]]
+    return aligned
 
+# Build the master frame from raw source rows ({name: rows}) in a single pass: the master
+# dates are the sorted union of the row-defining sources' dates, and every source is looked
+# up on them once with asof_align. No intermediate frames are merged; the result is
+# assembled once from the aligned columns. Market cap columns appear when their source does;
+# components=True also keeps each chain's transactions and energy ("{crypto} Transactions",
+# "{crypto} kW") that the ratio is made of.
+def combine_sources(rows, end_date=END_DATE, bound='GUESS', components=False):
+    series = {name: source_series(source_rows, name, bound) for name, source_rows in rows.items()}
+    row_dates = [series[name][0] for name in series if SOURCES[name].get('defines_rows', True)]
+    dates = np.unique(np.concatenate(row_dates)) if row_dates else np.array([], dtype='datetime64[ns]')
 
-# Filter out dates from 2010-07-18 through 2011-09-01 and all dates after 2024-03-29
-master_data = master_data[((master_data['Date'] < '2010-07-18') | (master_data['Date'] > '2011-09-02')) & (master_data['Date'] <= '2024-03-29')]
+    # Filter out dates from 2010-07-18 through 2011-09-01 and all dates after the end date
+    dates = dates[((dates < np.datetime64('2010-07-18')) | (dates > np.datetime64('2011-09-02')))
+                  & (dates <= np.datetime64(pd.Timestamp(end_date)))]
 
-# Save the filtered master data to a new CSV file
-master_data.to_csv('master_transactions_per_kw.csv', index=False)
\ No newline at end of file
+    def aligned(name):
+        source = SOURCES[name]
+        return asof_align(dates, *series[name], source.get('gap', 'exact'), source.get('max_gap_days', 0))
+
+    columns = {'Date': dates}
+    component_columns = {}
+    for crypto, chain in CHAINS.items():
+        energy = np.full(len(dates), np.nan)
+        for name in chain['energy']:
+            energy = np.where(np.isnan(energy), aligned(name), energy)
+        transactions = aligned(chain['transactions'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns[f"{crypto} Transactions per kW"] = transactions / energy
+        component_columns[f"{crypto} Transactions"] = transactions
+        component_columns[f"{crypto} kW"] = energy
+    for crypto, chain in CHAINS.items():
+        if chain['market_cap'] in series:
+            columns[f"{crypto.lower()}_market_cap"] = aligned(chain['market_cap'])
+    if components:
+        columns.update(component_columns)
+    return pd.DataFrame(columns)
+
+# Daily transactions and energy (kW) of every chain on the master dates, indexed by date
+def build_component_frame(data_dir=DATA_DIR, end_date=END_DATE):
+    rows = {name: read_source_rows(data_dir, name)[0] for name in available_sources(data_dir)}
+    frame = combine_sources(rows, end_date, components=True).set_index('Date')
+    return frame[[column for crypto in CHAINS for column in (f"{crypto} Transactions", f"{crypto} kW")]]
+
+# Master frames with the energy taken at each CCAF bound ({bound: frame}); the GUESS
+# frame is the regular master. Each source is read once.
+def build_bound_masters(data_dir=DATA_DIR, end_date=END_DATE, bounds=ENERGY_BOUNDS):
+    rows = {name: read_source_rows(data_dir, name)[0] for name in available_sources(data_dir)}
+    return {bound: combine_sources(rows, end_date, bound) for bound in bounds}
+
+# Number of leading rows dated on or before the watermark (exports are in date order)
+def _rows_through(rows, watermark):
+    return int(np.searchsorted(rows['Date'].to_numpy(), np.datetime64(watermark), side='right'))
+
+# Per-source watermark state from source reads ({name: (rows, ends)}) once the master holds
+# every row through `watermark`: the offset and date of each source's last row by then
+def _ingest_state(reads, watermark):
+    sources = {}
+    for name, (rows, ends) in reads.items():
+        n = _rows_through(rows, watermark)
+        sources[name] = {'offset': int(ends[n - 1]) if n else 0,
+                         'last_date': str(rows['Date'].iloc[n - 1].date()) if n else None}
+    return {'watermark': str(pd.Timestamp(watermark).date()), 'sources': sources}
+
+# Latest date up to which both transactions and energy are available for each chain
+def _ready_through(last):
+    btc_ready = min(last['btc_transactions'], last['btc_energy'])
+    eth_energy_ready = max(min(last['eth1_energy'], pd.Timestamp(ETH_MERGE_LAST_POW)), last['eth2_energy'])
+    eth_ready = min(last['eth_transactions'], eth_energy_ready)
+    return min(btc_ready, eth_ready)
+
+# Date every chain is ready through, capped at the end date, from full source reads
+def _watermark(reads, end_date):
+    last = {name: rows['Date'].iloc[-1] if len(rows) else pd.Timestamp.min for name, (rows, _) in reads.items()}
+    return min(_ready_through(last), pd.Timestamp(end_date))
+
+# Parse only the source rows past each watermark, append the master rows that every chain
+# now covers to the master CSV, and return them. Rows a source has beyond the new watermark
+# stay unconsumed and are read again next time. Forward-filled sources are re-read from
+# the start so a value can carry over the watermark. The appended columns follow the
+# existing master header; a newly added source needs a full rebuild to get its column.
+def ingest_incremental(data_dir=DATA_DIR, end_date=END_DATE):
+    state_path = os.path.join(data_dir, INGEST_STATE_FILE)
+    with open(state_path) as f:
+        state = json.load(f)
+    old_watermark = pd.Timestamp(state['watermark'])
+
+    reads, last = {}, {}
+    for name in available_sources(data_dir):
+        source_state = state['sources'].get(name, {'offset': 0, 'last_date': None})
+        offset = 0 if SOURCES[name].get('gap') == 'ffill' else source_state['offset']
+        rows, ends = read_source_rows(data_dir, name, offset)
+        reads[name] = (rows, ends)
+        last_dates = [pd.Timestamp(source_state['last_date'])] if source_state['last_date'] else []
+        if len(rows):
+            last_dates.append(rows['Date'].iloc[-1])
+        last[name] = max(last_dates, default=pd.Timestamp.min)
+    watermark = min(_ready_through(last), pd.Timestamp(end_date))
+    if watermark <= old_watermark:
+        return pd.DataFrame(columns=MASTER_COLUMNS)
+
+    through = {}
+    for name, (rows, ends) in reads.items():
+        n = _rows_through(rows, watermark)
+        through[name] = rows.iloc[:n]
+        if n:
+            state['sources'][name] = {'offset': int(ends[n - 1]), 'last_date': str(rows['Date'].iloc[n - 1].date())}
+    new_rows = combine_sources(through, end_date)
+    new_rows = new_rows[new_rows['Date'] > old_watermark]
+
+    master_path = os.path.join(data_dir, MASTER_FILE)
+    with open(master_path) as f:
+        header = next(csv.reader([f.readline()]))
+    new_rows = new_rows.reindex(columns=header)
+    new_rows.to_csv(master_path, mode='a', header=False, index=False)
+    state['watermark'] = str(watermark.date())
+    with open(state_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    return new_rows
+
+# Rebuild the master CSV from scratch through the date every chain is ready through, and
+# reset the ingest watermarks to it. Rows a lagging source has not reached yet are left
+# to the incremental ingestion, which appends them once the source catches up.
+def rebuild_master(data_dir=DATA_DIR, end_date=END_DATE):
+    reads = {name: read_source_rows(data_dir, name) for name in available_sources(data_dir)}
+    watermark = _watermark(reads, end_date)
+    master_data = combine_sources({name: rows for name, (rows, _) in reads.items()}, end_date)
+    master_data = master_data[master_data['Date'] <= watermark]
+    master_data.to_csv(os.path.join(data_dir, MASTER_FILE), index=False)
+    with open(os.path.join(data_dir, INGEST_STATE_FILE), 'w') as f:
+        json.dump(_ingest_state(reads, watermark), f, indent=2)
+    return master_data
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge the raw exports into the master transactions-per-kW CSV')
+    parser.add_argument('--incremental', action='store_true', help='append only rows past the stored watermarks')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--end-date', default=END_DATE)
+    args = parser.parse_args()
+
+    if args.incremental:
+        new_rows = ingest_incremental(args.data_dir, args.end_date)
+        print(f"Appended {len(new_rows)} rows to {MASTER_FILE}")
+    else:
+        # Save the filtered master data to a new CSV file
+        rebuild_master(args.data_dir, args.end_date)
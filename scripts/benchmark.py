@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+HISTORY_FILE = os.path.join(BENCHMARK_DIR, 'history.jsonl')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+SIZES = [10**3, 10**4, 10**5]
+
+# Longest series generated at daily resolution; datetime64[ns] cannot hold 10^7 days,
+# so longer series use the coarsest of hourly or minute resolution that fits
+MAX_DAILY_POINTS = 50_000
+FREQUENCIES = [('D', 1), ('h', 24), ('min', 24 * 60)]
+
+# Slowdown (current / baseline) above which a benchmark is flagged as a regression
+TOLERANCE = 0.25
+
+# Chain names of synthetic data: the real chains first, then numbered ones
+def synthetic_chains(n_chains):
+    return (CRYPTOS + [f"Chain{i}" for i in range(len(CRYPTOS), n_chains)])[:n_chains]
+
+# Seeded synthetic master data: one transactions-per-kW series per chain (a lognormal random
+# walk with regime shifts), later chains starting progressively later, gap_fraction of the
+# remaining points missing in blocks of gap_length, and a matching market cap series
+def synthetic_master(n_points, n_chains=2, gap_fraction=0.0, gap_length=7, freq=None, seed=0):
+    rng = np.random.default_rng(seed)
+    freq = freq or next((f for f, per_day in FREQUENCIES if n_points <= MAX_DAILY_POINTS * per_day), 'min')
+    index = pd.date_range('2010-01-01', periods=n_points, freq=freq, name='Date')
+    df = pd.DataFrame(index=index)
+    for i, chain in enumerate(synthetic_chains(n_chains)):
+        shifts = np.repeat(rng.normal(0, 0.5, size=n_points // 500 + 1), 500)[:n_points]
+        log_values = np.cumsum(rng.normal(0, 0.05, size=n_points)) + shifts
+        values = np.exp(log_values - log_values.mean())
+        start = int(n_points * 0.3 * i / max(n_chains - 1, 1))
+        values[:start] = np.nan
+        n_gaps = int(gap_fraction * (n_points - start) / gap_length)
+        for gap_start in rng.integers(start, n_points, size=n_gaps):
+            values[gap_start:gap_start + gap_length] = np.nan
+        df[f"{chain} Transactions per kW"] = values
+        df[f"{chain.lower()}_market_cap"] = np.exp(np.cumsum(rng.normal(0, 0.03, size=n_points)) + 0.5 * log_values)
+    return df
+
+def _states(df, chains):
+    from state_calculations import apply_state_definitions
+    return apply_state_definitions(df.copy(), chains, STATE_PERCENTILES, STATE_LABELS)
+
+def _complexity(df, chains):
+    from complexity_store import TIME_SCALES, calculate_and_store_complexity_measures
+    return calculate_and_store_complexity_measures(_states(df, chains), chains, TIME_SCALES)
+
+# Hot paths: each setup prepares its inputs (untimed) and returns the call to time
+def _bench_define_states(df, chains):
+    from state_calculations import apply_state_definitions
+    return lambda: apply_state_definitions(df.copy(), chains, STATE_PERCENTILES, STATE_LABELS)
+
+def _bench_cumulative_complexity(df, chains):
+    from complexity import calculate_cumulative_complexity
+    states = _states(df, chains)
+    return lambda: [calculate_cumulative_complexity(states, chain) for chain in chains]
+
+def _bench_scale_complexity(df, chains):
+    from complexity import TIME_SCALES, calculate_complexity_measures
+    states = _states(df, chains)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [calculate_complexity_measures(states, chain, TIME_SCALES) for chain in chains]
+    return run
+
+def _bench_store_complexity(df, chains):
+    from complexity_store import TIME_SCALES, calculate_and_store_complexity_measures
+    states = _states(df, chains)
+    return lambda: calculate_and_store_complexity_measures(states.copy(), chains, TIME_SCALES)
+
+def _bench_plot_periods(df, chains):
+    from plots import (calculate_monthly_complexity, calculate_monthly_complexity_marketcap,
+                       calculate_weekly_complexity, calculate_weekly_complexity_marketcap)
+    states = _states(df, chains)
+
+    def run():
+        for chain in chains:
+            marketcap_col = f"{chain.lower()}_market_cap"
+            calculate_weekly_complexity(states, chain)
+            calculate_monthly_complexity(states, chain)
+            calculate_weekly_complexity_marketcap(states, chain, marketcap_col)
+            calculate_monthly_complexity_marketcap(states, chain, marketcap_col)
+    return run
+
+def _bench_correlations(df, chains):
+    from correlation_table import analyze_correlations
+    complexity = _complexity(df, chains)
+    return lambda: analyze_correlations(complexity, chains, 'cumulative')
+
+def _bench_lag_scan(df, chains):
+    from lag_scan import analyze_lags
+    complexity = _complexity(df, chains)
+    return lambda: analyze_lags(complexity, chains, max_lag=min(365, len(df) - 1))
+
+def _bench_wide_complexity(df, chains):
+    from complexity_store import TIME_SCALES
+    from multichain import calculate_wide_complexity
+    return lambda: calculate_wide_complexity(df, chains, STATE_PERCENTILES, STATE_LABELS, TIME_SCALES)
+
+BENCHMARKS = {
+    'define_states': _bench_define_states,
+    'cumulative_complexity': _bench_cumulative_complexity,
+    'scale_complexity': _bench_scale_complexity,
+    'store_complexity': _bench_store_complexity,
+    'plot_periods': _bench_plot_periods,
+    'correlations': _bench_correlations,
+    'lag_scan': _bench_lag_scan,
+    'wide_complexity': _bench_wide_complexity,
+}
+
+# Best and median wall time over `repeat` calls, then the peak traced allocation of one
+# more call (tracemalloc slows the call down, so it is kept out of the timings)
+def measure(func, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': statistics.median(times), 'peak_bytes': peak}
+
+def run_benchmarks(names=tuple(BENCHMARKS), sizes=SIZES, n_chains=2, gap_fraction=0.05, repeat=3, seed=0):
+    results = []
+    for size in sizes:
+        df = synthetic_master(size, n_chains, gap_fraction, seed=seed)
+        chains = synthetic_chains(n_chains)
+        for name in names:
+            result = {'benchmark': name, 'size': size, 'chains': n_chains, 'gap_fraction': gap_fraction}
+            try:
+                result.update(measure(BENCHMARKS[name](df, chains), repeat))
+            except ImportError as error:
+                result['skipped'] = str(error)
+            results.append(result)
+            print(_format_result(result), flush=True)
+    return results
+
+def _format_result(result):
+    label = f"{result['benchmark']:<24}{result['size']:>10}"
+    if 'skipped' in result:
+        return f"{label}  skipped ({result['skipped']})"
+    return f"{label}  {result['seconds']:10.4f} s  {result['peak_bytes'] / 2**20:10.1f} MiB"
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_record(results):
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': _git_commit(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'results': results}
+
+def append_history(record, path=HISTORY_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def save_baseline(record, path=BASELINE_FILE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+
+def _result_key(result):
+    return result['benchmark'], result['size'], result['chains'], result['gap_fraction']
+
+# Current / baseline ratios of time and peak memory for every benchmark present in both,
+# flagging ratios above 1 + tolerance
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    previous = {_result_key(result): result for result in baseline['results'] if 'skipped' not in result}
+    rows = []
+    for result in results:
+        base = previous.get(_result_key(result))
+        if base is None or 'skipped' in result:
+            continue
+        time_ratio = result['seconds'] / base['seconds'] if base['seconds'] else np.nan
+        memory_ratio = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else np.nan
+        rows.append({'Benchmark': result['benchmark'], 'Size': result['size'],
+                     'Seconds': result['seconds'], 'Baseline Seconds': base['seconds'], 'Time Ratio': time_ratio,
+                     'Memory Ratio': memory_ratio,
+                     'Regression': bool(time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance)})
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile the complexity hot paths on synthetic data')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='points per series, e.g. 1000 ... 10000000')
+    parser.add_argument('--chains', type=int, default=2)
+    parser.add_argument('--gap-fraction', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.benchmarks, args.sizes, args.chains, args.gap_fraction, args.repeat, args.seed)
+    record = run_record(results)
+    append_history(record, args.history)
+
+    regressed = False
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            comparison = compare_to_baseline(results, json.load(f), args.tolerance)
+        if not comparison.empty:
+            print(comparison.to_string(index=False))
+            regressed = comparison['Regression'].any()
+    if args.save_baseline:
+        save_baseline(record, args.baseline)
+    if regressed:
+        raise SystemExit('Benchmarks regressed against the baseline')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+
+import numpy as np
+
+# Adaptive discretizers, all solved exactly by dynamic programming over one sort:
+# - 'entropy': the n_states bins whose histogram density has the highest likelihood, i.e.
+#   the lowest cross-entropy against the data (fixed number of states)
+# - 'bayesian-blocks': Scargle's Bayesian blocks, the same fitness with a prior penalty
+#   per bin, so the number of states follows from the data
+# - 'bic' / 'aic': the 'entropy' partition with the number of states (up to max_states)
+#   chosen by the information criterion
+METHODS = ['entropy', 'bayesian-blocks', 'bic', 'aic']
+
+# Candidate bin boundaries: bins are made of whole cells of about n / MAX_CANDIDATES
+# sorted values, which keeps the DP at O(MAX_CANDIDATES^2) however long the history is
+MAX_CANDIDATES = 1024
+
+# Smallest share of the observations a bin may hold; without it the likelihood is
+# maximised by ever narrower bins around clusters of nearly equal values
+MIN_BIN_FRACTION = 0.01
+
+# Largest number of states the information criteria consider
+MAX_STATES = 16
+
+# False-alarm probability behind the Bayesian blocks prior (Scargle et al. 2013, eq. 21)
+FALSE_ALARM = 0.05
+
+# Boundary positions into the sorted values (0 = start, n = end) of the candidate cells,
+# and the coordinate of each boundary: the data range at the ends and the midpoint
+# between neighbouring values inside. Boundaries never split runs of equal values.
+def _candidates(sorted_values, max_candidates=MAX_CANDIDATES):
+    n = len(sorted_values)
+    positions = np.unique(np.round(np.linspace(0, n, min(n, max_candidates) + 1)).astype(np.int64))
+    inner = positions[(positions > 0) & (positions < n)]
+    inner = inner[sorted_values[inner - 1] < sorted_values[inner]]
+    positions = np.r_[0, inner, n]
+    edges = np.r_[sorted_values[0], (sorted_values[inner - 1] + sorted_values[inner]) / 2, sorted_values[-1]]
+    return positions, edges
+
+# Log-likelihood fitness n * ln(n / width) of the bin between every pair of boundaries
+# (i < j), from the boundary positions (prefix counts of the sorted values) and edges;
+# -inf where the bin is empty, too small or not a bin at all
+def _fitness_matrix(positions, edges, min_count):
+    counts = (positions[None, :] - positions[:, None]).astype(float)
+    widths = edges[None, :] - edges[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fitness = counts * np.log(counts / widths)
+    return np.where((counts >= max(min_count, 1)) & (widths > 0), fitness, -np.inf)
+
+# Best total fitness of partitions of all cells into exactly 1..max_bins bins, and the
+# boundary indices of each, from one layered DP over the fitness matrix
+def _optimal_partitions(fitness, max_bins):
+    m = fitness.shape[0] - 1
+    best = fitness[0].copy()
+    scores, back = [best[m]], []
+    for _ in range(1, max_bins):
+        candidates = best[:, None] + fitness
+        back.append(np.argmax(candidates, axis=0))
+        best = candidates[back[-1], np.arange(m + 1)]
+        scores.append(best[m])
+    partitions = []
+    for k in range(1, max_bins + 1):
+        bounds, j = [m], m
+        for layer in range(k - 2, -1, -1):
+            j = back[layer][j]
+            bounds.append(j)
+        partitions.append(bounds[::-1][:-1])
+    return np.array(scores), partitions
+
+# Bayesian blocks over the candidate cells: best[j] = max_i best[i] + fitness(i, j) - prior,
+# one vectorised step per cell; returns the inner boundary indices
+def _bayesian_blocks(fitness, prior):
+    m = fitness.shape[0] - 1
+    best = np.zeros(m + 1)
+    last = np.zeros(m + 1, dtype=np.int64)
+    for j in range(1, m + 1):
+        totals = best[:j] + fitness[:j, j] - prior
+        last[j] = np.argmax(totals)
+        best[j] = totals[last[j]]
+    bounds, j = [], last[m]
+    while j > 0:
+        bounds.append(j)
+        j = last[j]
+    return bounds[::-1]
+
+# Thresholds for define_state_codes from one chain's values: one sort, prefix counts at
+# the candidate boundaries and a DP for the chosen method. With log=True (the default)
+# positive data is binned by log value, where transactions per kW are far less skewed.
+def adaptive_thresholds(values, method='entropy', n_states=5, log=True,
+                        max_states=MAX_STATES, min_bin_fraction=MIN_BIN_FRACTION,
+                        max_candidates=MAX_CANDIDATES, false_alarm=FALSE_ALARM):
+    if method not in METHODS:
+        raise ValueError(f"Unknown binning method {method!r} (expected one of {METHODS})")
+    values = np.asarray(values, dtype=float)
+    values = np.sort(values[~np.isnan(values)])
+    log = log and len(values) > 0 and values[0] > 0
+    if log:
+        values = np.log(values)
+    if len(values) < 2 or values[0] == values[-1]:
+        return np.array([])
+
+    n = len(values)
+    positions, edges = _candidates(values, max_candidates)
+    fitness = _fitness_matrix(positions, edges, min_bin_fraction * n)
+    if method == 'bayesian-blocks':
+        prior = 4 - np.log(73.53 * false_alarm * n ** -0.478)
+        bounds = _bayesian_blocks(fitness, prior)
+    else:
+        max_bins = n_states if method == 'entropy' else max_states
+        scores, partitions = _optimal_partitions(fitness, min(max_bins, len(positions) - 1))
+        if method == 'entropy':
+            feasible = np.flatnonzero(np.isfinite(scores))
+            bounds = partitions[feasible[-1]]
+        else:
+            # Log-likelihood of the histogram density and 2k - 2 free parameters (the inner
+            # edges and the bin probabilities)
+            log_likelihood = scores - n * np.log(n)
+            parameters = 2 * np.arange(len(scores))
+            penalty = np.log(n) if method == 'bic' else 2.0
+            criterion = np.where(np.isfinite(scores), -2 * log_likelihood + penalty * parameters, np.inf)
+            bounds = partitions[int(np.argmin(criterion))]
+    thresholds = edges[np.asarray(bounds, dtype=np.int64)]
+    return np.exp(thresholds) if log else thresholds
+
+# Labels for a number of states: the usual labels when the count matches, numbered otherwise
+def state_labels(n_states, labels):
+    labels = list(labels)
+    return labels if len(labels) == n_states else [f"State {i + 1}" for i in range(n_states)]
+
+def main():
+    from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+    from state_calculations import CRYPTOS, STATE_LABELS
+    parser = argparse.ArgumentParser(description='Data-driven state thresholds for each chain')
+    parser.add_argument('--master-csv', default=DEFAULT_MASTER_CSV)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+    parser.add_argument('--n-states', type=int, default=len(STATE_LABELS), help='states for the entropy method')
+    args = parser.parse_args()
+
+    df = load_and_prepare_data(args.master_csv)
+    for crypto in args.cryptos:
+        values = df[f"{crypto} Transactions per kW"].to_numpy(dtype=float)
+        for method in args.methods:
+            thresholds = adaptive_thresholds(values, method, args.n_states)
+            # Share of the observations below each threshold, comparable to STATE_PERCENTILES
+            observed = np.sort(values[~np.isnan(values)])
+            shares = 100 * np.searchsorted(observed, thresholds) / len(observed)
+            print(f"{crypto} {method}: {len(thresholds) + 1} states, thresholds "
+                  + ', '.join(f"{threshold:.4g} (P{share:.0f})" for threshold, share in zip(thresholds, shares)))
+
+if __name__ == "__main__":
+    main()
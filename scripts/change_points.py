@@ -0,0 +1,219 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.special import gammaln
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+from complexity_engine import prefix_state_counts, state_codes, window_measures
+
+# Prior probability of a change point on any observed day (1 / expected regime length)
+HAZARD = 1 / 365
+
+# Run-length hypotheses kept, so every update costs O(MAX_RUN); the oldest one stands for
+# every run of MAX_RUN - 1 days or more
+MAX_RUN = 400
+
+# Segments shorter than this are not reported; each new day may move the most probable
+# segment start back and forth by a few days before it settles
+MIN_SEGMENT = 30
+
+# Symmetric Dirichlet prior on the state distribution of a segment
+DIRICHLET_ALPHA = 1.0
+
+# Normal-gamma prior on the log values of a segment; the prior mean is the first value seen.
+# The prior variance beta / alpha = 1 (log units) carries the weight of about 2 * alpha = 20
+# observations, so a few noisy days do not open a new segment on their own.
+VALUE_PRIOR = {'kappa': 0.1, 'alpha': 10.0, 'beta': 10.0}
+
+MODELS = ['states', 'values', 'both']
+
+# Online Bayesian change-point detection (Adams & MacKay) over one chain's daily state
+# codes and/or log values: a posterior over the length of the current run is updated once
+# per observed day with bounded work (MAX_RUN hypotheses). Within a run, states are
+# categorical with a Dirichlet prior and log values normal with a normal-gamma prior, so
+# both predictive densities come from running sufficient statistics. A change point is
+# reported when the most probable run start moves forward by at least min_segment days.
+class ChangePointDetector:
+    def __init__(self, n_states, model='both', hazard=HAZARD, max_run=MAX_RUN, min_segment=MIN_SEGMENT,
+                 dirichlet_alpha=DIRICHLET_ALPHA, value_prior=VALUE_PRIOR):
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model!r} (expected one of {MODELS})")
+        self.n_states = n_states
+        self.model = model
+        self.max_run = max_run
+        self.min_segment = min_segment
+        self.hazard = hazard
+        self.dirichlet_alpha = dirichlet_alpha
+        self.value_prior = dict(value_prior)
+
+        # Run hypotheses live in buffers ordered by start, oldest first, in the slots
+        # [lo, hi): the newest run (length 0) is at hi - 1 and a run's slot never moves, so
+        # each update only touches the active slice. Per-length constants are read reversed.
+        capacity = 2 * max_run
+        self.lo = self.hi = 0
+        self.run = np.zeros(capacity)
+        self.counts = np.zeros((n_states, capacity))
+        self.mean = np.zeros(capacity)
+        self.beta = np.zeros(capacity)
+        lengths = np.arange(max_run)
+        kappa = value_prior['kappa'] + lengths
+        alpha = value_prior['alpha'] + lengths / 2
+        self._log_state_norm = np.log(lengths + n_states * dirichlet_alpha)
+        self._alpha_half = alpha + 0.5
+        self._log_t_norm = gammaln(alpha + 0.5) - gammaln(alpha) - 0.5 * np.log(2 * np.pi * (kappa + 1) / kappa)
+        # kappa / (2 (kappa + 1)) scales a squared deviation both into the Student-t predictive
+        # and into the beta update; 1 / (kappa + 1) is the weight of a new value in the mean
+        self._deviation_scale = kappa / (2 * (kappa + 1))
+        self._mean_weight = 1 / (kappa + 1)
+
+        self.t = 0
+        # Start of the most probable run folded into the oldest slot, once runs reach max_run
+        self.oldest_start = None
+        self.segment_start = 0
+        self.change_points = []
+
+    # Start a run of length 0 with the prior statistics in the next free slot
+    def _open_run(self, probability, log_value):
+        if self.hi == len(self.run):
+            m = self.hi - self.lo
+            for buffer in (self.run, self.mean, self.beta):
+                buffer[:m] = buffer[self.lo:self.hi]
+            self.counts[:, :m] = self.counts[:, self.lo:self.hi]
+            self.lo, self.hi = 0, m
+        self.run[self.hi] = probability
+        self.counts[:, self.hi] = 0
+        self.mean[self.hi] = log_value
+        self.beta[self.hi] = self.value_prior['beta']
+        self.hi += 1
+
+    # Log predictive density of the observation under every active run (oldest first), and
+    # the scaled squared deviations that also update the value statistics
+    def _log_predictive(self, code, log_value):
+        lo, hi = self.lo, self.hi
+        m = hi - lo
+        log_prob, deviation = 0.0, None
+        if self.model != 'values':
+            log_prob = np.log(self.counts[code, lo:hi] + self.dirichlet_alpha) - self._log_state_norm[m - 1::-1]
+        if self.model != 'states':
+            beta = self.beta[lo:hi]
+            deviation = (log_value - self.mean[lo:hi]) ** 2 * self._deviation_scale[m - 1::-1]
+            log_prob = log_prob + (self._log_t_norm[m - 1::-1] - 0.5 * np.log(beta)
+                                   - self._alpha_half[m - 1::-1] * np.log1p(deviation / beta))
+        return log_prob, deviation
+
+    # Feed one observed day (state code >= 0 and positive value); returns the observation
+    # index where a newly detected segment starts, or None
+    def update(self, code, value):
+        log_value = np.log(value) if self.model != 'states' else 0.0
+        if self.t == 0:
+            self._open_run(1.0, log_value)
+        lo, hi = self.lo, self.hi
+        m = hi - lo
+        log_predictive, deviation = self._log_predictive(code, log_value)
+        # Predictive densities relative to the best one, so no exp underflows to all zeros;
+        # after normalising, the change-point mass is exactly the hazard
+        weighted = self.run[lo:hi] * np.exp(log_predictive - log_predictive.max())
+        self.run[lo:hi] = weighted * ((1 - self.hazard) / weighted.sum())
+
+        # Every active run absorbs the observation
+        self.counts[code, lo:hi] += 1
+        if deviation is not None:
+            self.beta[lo:hi] += deviation
+            self.mean[lo:hi] += (log_value - self.mean[lo:hi]) * self._mean_weight[m - 1::-1]
+
+        self._open_run(self.hazard, log_value)
+        self.t += 1
+        if self.hi - self.lo > self.max_run:
+            self._fold_oldest_run()
+
+        best = int(np.argmax(self.run[self.lo:self.hi]))
+        run = self.hi - 1 - (self.lo + best)
+        if run == 0:
+            return None
+        start = self.oldest_start if best == 0 and self.oldest_start is not None else self.t - run
+        if start - self.segment_start >= self.min_segment and self.t - start >= self.min_segment // 2:
+            self.segment_start = start
+            self.change_points.append(start)
+            return start
+        return None
+
+    # Merge the oldest run into the next oldest, keeping its probability mass: the merged
+    # slot is the "max_run - 1 days or more" hypothesis, with the statistics of the younger
+    # run and the start of whichever of the two was more probable
+    def _fold_oldest_run(self):
+        lo = self.lo
+        start = self.oldest_start if self.oldest_start is not None else self.t - (self.hi - 1 - lo)
+        if self.run[lo] < self.run[lo + 1]:
+            start = self.t - (self.hi - 2 - lo)
+        self.oldest_start = start
+        self.run[lo + 1] += self.run[lo]
+        self.lo += 1
+
+    # Posterior probability of every run length, 0 upwards; the last entry holds all runs of
+    # max_run - 1 days or more
+    @property
+    def run_length_posterior(self):
+        return self.run[self.lo:self.hi][::-1].copy()
+
+# Change points of one chain: the date each new segment starts and the date it was detected
+# on. Days without a state or value are skipped.
+def detect_change_points(states, values, model='both', **detector_args):
+    codes, n_states = state_codes(states)
+    values = np.asarray(values, dtype=float)
+    observed = np.flatnonzero((codes >= 0) & (values > 0))
+    detector = ChangePointDetector(n_states, model, **detector_args)
+    rows = []
+    for row in observed:
+        start = detector.update(codes[row], values[row])
+        if start is not None:
+            rows.append({'Change Date': states.index[observed[start]], 'Detected': states.index[row]})
+    changes = pd.DataFrame(rows, columns=['Change Date', 'Detected'])
+    changes['Delay (days)'] = (changes['Detected'] - changes['Change Date']).dt.days
+    return changes
+
+# Emergence, self-organization and complexity of the states in every segment between
+# consecutive change dates (from the first observation to the last)
+def segment_measures(states, change_dates):
+    codes, n_states = state_codes(states)
+    observed = np.flatnonzero(codes >= 0)
+    if not len(observed):
+        return pd.DataFrame(columns=['Start', 'End', 'Days', 'Emergence', 'Self-organization', 'Complexity'])
+    bounds = np.r_[observed[0], states.index.searchsorted(pd.DatetimeIndex(change_dates)), observed[-1] + 1]
+    prefix = prefix_state_counts(codes, n_states)
+    left, right = bounds[:-1], bounds[1:]
+    emergence, self_organization, complexity = window_measures(prefix, left, right)
+    return pd.DataFrame({'Start': states.index[left], 'End': states.index[right - 1],
+                         'Days': (prefix[right] - prefix[left]).sum(axis=1), 'Emergence': emergence,
+                         'Self-organization': self_organization, 'Complexity': complexity})
+
+# Change points and segment measures of every chain of a frame with state columns
+def detect_regimes(df, cryptos=CRYPTOS, model='both', **detector_args):
+    regimes = {}
+    for crypto in cryptos:
+        states = df[f"{crypto} Transactions per kW State"]
+        changes = detect_change_points(states, df[f"{crypto} Transactions per kW"], model, **detector_args)
+        regimes[crypto] = {'changes': changes, 'segments': segment_measures(states, changes['Change Date'])}
+    return regimes
+
+def main():
+    from pipeline import Pipeline
+    parser = argparse.ArgumentParser(description='Online change-point detection on the daily states and values')
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--model', default='both', choices=MODELS)
+    parser.add_argument('--hazard', type=float, default=HAZARD)
+    parser.add_argument('--max-run', type=int, default=MAX_RUN)
+    parser.add_argument('--min-segment', type=int, default=MIN_SEGMENT)
+    args = parser.parse_args()
+
+    states = Pipeline(cryptos=args.cryptos, percentiles=STATE_PERCENTILES, labels=STATE_LABELS)['states']
+    regimes = detect_regimes(states, args.cryptos, args.model, hazard=args.hazard, max_run=args.max_run,
+                             min_segment=args.min_segment)
+    for crypto, regime in regimes.items():
+        print(f"\n{crypto} change points:")
+        print(regime['changes'].to_string(index=False))
+        print(f"\n{crypto} segments:")
+        print(regime['segments'].to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -2,36 +2,35 @@ import os
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from result_cache import ResultCache
+from complexity_engine import build_count_pyramid, calculate_cumulative_measures, define_state_codes, make_state_column, modal_state_measures
+from instrumentation import disable as write_instrumentation_report, enable_from_env, instrumented
 
 # Constants for the script
-MASTER_CSV_PATH = '/Users/shingai/Desktop/cryptoeconomic_complexity/data/master_transactions_per_kw.csv'
+MASTER_CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'master_transactions_per_kw.csv')
 CRYPTOS = ['Bitcoin', 'Ethereum']
 TIME_SCALES = ['D', 'W', 'M', 'Y']  # D for daily, W for weekly, M for monthly, Y for yearly
 STATE_PERCENTILES = [10, 30, 70, 90]
 STATE_LABELS = ['Very Low', 'Low', 'High', 'Very High', 'Extremely High']
 
 # Load and prepare data
+@instrumented('load_csv')
 def load_and_prepare_data(csv_path):
     df = pd.read_csv(csv_path)
     df['Date'] = pd.to_datetime(df['Date'])
     df.set_index('Date', inplace=True)
     return df
 
-# Define states based on value and percentiles
-def define_states(value, percentiles, labels):
-    for i, percentile in enumerate(percentiles):
-        if value < percentile:
-            return labels[i]
-    return labels[-1]
-
-# Calculate percentiles and apply state definition for each cryptocurrency
+# Calculate percentiles and assign int8 state codes for each cryptocurrency
+@instrumented('states')
 def apply_state_definitions(df, cryptos, percentiles, labels):
     for crypto in cryptos:
         crypto_column = f"{crypto} Transactions per kW"
         state_column = f"{crypto} Transactions per kW State"
-        crypto_df = df[crypto_column].dropna()
-        percentile_values = np.percentile(crypto_df, percentiles)
-        df[state_column] = crypto_df.apply(lambda x: define_states(x, percentile_values, labels))
+        values = df[crypto_column].to_numpy(dtype=float)
+        percentile_values = np.percentile(values[~np.isnan(values)], percentiles)
+        codes = define_state_codes(values, percentile_values)
+        df[state_column] = make_state_column(codes, labels, df.index)
     return df
 
 # Calculate emergence measure
@@ -53,25 +52,24 @@ def calculate_complexity(emergence, self_organization):
     return 4 * emergence * self_organization
 
 # Calculate complexity measures for a cryptocurrency at different time scales
+@instrumented('scale_complexity')
 def calculate_complexity_measures(df, crypto, time_scales):
     state_column = f"{crypto} Transactions per kW State"
     complexities = {}
+    pyramid = build_count_pyramid(df[state_column], time_scales)
 
     for scale in time_scales:
         print(f"\nCalculating complexity for {crypto} Transactions per Watt at {scale} scale:")
-        resampled_series = df[state_column].resample(scale).apply(lambda x: x.value_counts().index[0] if not x.isnull().all() else np.nan)
-        state_probs = resampled_series.value_counts(normalize=True)
-        emergence = calculate_emergence(state_probs)
+        emergence, self_org, complexity = modal_state_measures(pyramid[scale])
         print(f"Emergence ({scale} scale): {emergence:.6f}")
-        self_org = calculate_self_organization(emergence)
         print(f"Self-organization ({scale} scale): {self_org:.6f}")
-        complexity = calculate_complexity(emergence, self_org)
         complexities[scale] = complexity
         print(f"Complexity ({scale} scale): {complexity:.6f}")
 
     return complexities
 
 # Plot complexity measures
+@instrumented('plot')
 def plot_complexity_measures(complexities, crypto, color):
     plt.figure(figsize=(8, 6))
     plt.bar(complexities.keys(), complexities.values(), color=color)
@@ -83,23 +81,15 @@ def plot_complexity_measures(complexities, crypto, color):
 
 
 # Calculate cumulative complexity up to each day
+@instrumented('cumulative_complexity')
 def calculate_cumulative_complexity(df, crypto):
     state_column = f"{crypto} Transactions per kW State"
-    cumulative_complexity = []
-    
-    for i in range(len(df)):
-        data_slice = df.iloc[:i+1][state_column]
-        state_probs = data_slice.value_counts(normalize=True)
-        emergence = calculate_emergence(state_probs)
-        self_org = calculate_self_organization(emergence)
-        complexity = calculate_complexity(emergence, self_org)
-        cumulative_complexity.append(complexity)
-    
-    return pd.Series(cumulative_complexity, index=df.index)
+    _, _, cumulative_complexity = calculate_cumulative_measures(df[state_column])
+    return cumulative_complexity
 
 # Plot cumulative complexity over time
-def plot_cumulative_complexity(df, crypto, color):
-    cumulative_complexity = calculate_cumulative_complexity(df, crypto)
+@instrumented('plot')
+def plot_cumulative_complexity(cumulative_complexity, crypto, color):
     plt.figure(figsize=(12, 6))
     plt.plot(cumulative_complexity, color=color, label=crypto)
     plt.xlabel('Date')
@@ -109,15 +99,20 @@ def plot_cumulative_complexity(df, crypto, color):
     plt.tight_layout()
     plt.show()
 
-# Main function to orchestrate the analysis
+# Main function to orchestrate the analysis; the master CSV, states and complexity come
+# from the pipeline stages and its on-disk cache. Set COMPLEXITY_INSTRUMENT=report.json to
+# record per-stage timings
 def main():
-    df = load_and_prepare_data(MASTER_CSV_PATH)
-    df = apply_state_definitions(df, CRYPTOS, STATE_PERCENTILES, STATE_LABELS)
-    
-    for crypto, color in zip(CRYPTOS, ['orange', 'blue']):
-        complexities = calculate_complexity_measures(df, crypto, TIME_SCALES)
-        plot_complexity_measures(complexities, crypto, color)
-        plot_cumulative_complexity(df, crypto, color)
+    from pipeline import Pipeline
+
+    enable_from_env()
+    pipeline = Pipeline(master_csv=MASTER_CSV_PATH, cache=ResultCache())
+    complexity = pipeline['complexity']
+
+    for crypto, color in zip(pipeline.cryptos, ['orange', 'blue']):
+        plot_complexity_measures(pipeline['scale_complexities'][crypto], crypto, color)
+        plot_cumulative_complexity(complexity[f"{crypto} Cumulative Complexity"], crypto, color)
+    write_instrumentation_report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,267 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# State code of each value: the number of thresholds at or below it (-1 for missing)
+def define_state_codes(values, thresholds):
+    values = np.asarray(values, dtype=float)
+    codes = np.searchsorted(thresholds, values, side='right').astype(np.int8)
+    codes[np.isnan(values)] = -1
+    return codes
+
+# Categorical state column: int8 codes with the labels as the lookup table
+def make_state_column(codes, labels, index=None):
+    return pd.Series(pd.Categorical.from_codes(codes, categories=labels), index=index)
+
+# State codes as floats with NaN for missing, for pandas code paths that skip NaN
+def state_code_series(states):
+    codes, _ = state_codes(states)
+    return pd.Series(np.where(codes >= 0, codes, np.nan), index=states.index)
+
+# Integer state codes (-1 for missing) and the number of states for a state column
+def state_codes(states):
+    if isinstance(states.dtype, pd.CategoricalDtype):
+        return states.cat.codes.to_numpy(), len(states.cat.categories)
+    codes, uniques = pd.factorize(states, sort=True)
+    return codes, len(uniques)
+
+# Running per-state counts: row i holds the state counts of observations 0..i
+def cumulative_state_counts(codes, n_states):
+    codes = np.asarray(codes)
+    counts = np.zeros((len(codes), n_states), dtype=np.int64)
+    valid = codes >= 0
+    counts[np.flatnonzero(valid), codes[valid]] = 1
+    return np.cumsum(counts, axis=0, out=counts)
+
+# Prefix counts with a leading zero row: counts of rows [a, b) are prefix[b] - prefix[a]
+def prefix_state_counts(codes, n_states):
+    counts = cumulative_state_counts(codes, n_states)
+    return np.vstack([np.zeros((1, n_states), dtype=counts.dtype), counts])
+
+# Emergence for every row of a (..., n_states) count array, normalised by the
+# number of states actually observed in that row (same as calculate_emergence)
+def emergence_from_counts(counts):
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=-1, keepdims=True)
+    observed = counts > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / totals
+        terms = np.where(observed, probabilities * np.log2(probabilities), 0.0)
+    entropy = -terms.sum(axis=-1)
+    n = observed.sum(axis=-1)
+    return np.where(n > 1, entropy / np.log2(np.maximum(n, 2)), 0.0)
+
+# Emergence, self-organization and complexity for every row of a count array
+def measures_from_counts(counts):
+    emergence = emergence_from_counts(counts)
+    self_organization = 1 - emergence
+    complexity = 4 * emergence * self_organization
+    return emergence, self_organization, complexity
+
+# Emergence, self-organization and complexity of every prefix of a state series
+def calculate_cumulative_measures(states):
+    codes, n_states = state_codes(states)
+    counts = cumulative_state_counts(codes, n_states)
+    emergence, self_organization, complexity = measures_from_counts(counts)
+    return (pd.Series(emergence, index=states.index),
+            pd.Series(self_organization, index=states.index),
+            pd.Series(complexity, index=states.index))
+
+# Measures of the windows [left, right) of a prefix count array; NaN where a window is empty
+def window_measures(prefix, left, right):
+    counts = prefix[right] - prefix[left]
+    emergence, self_organization, complexity = measures_from_counts(counts)
+    empty = counts.sum(axis=1) == 0
+    for measure in (emergence, self_organization, complexity):
+        measure[empty] = np.nan
+    return emergence, self_organization, complexity
+
+# Left edge of the trailing window of `days` days ending at each row of a sorted date index
+def rolling_window_starts(index, days):
+    dates = index.values
+    return np.searchsorted(dates, dates - np.timedelta64(days, 'D'), side='right')
+
+# Emergence, self-organization and complexity over a trailing window of `days` days,
+# aligned to the index; rows whose window reaches before the first date are NaN
+def calculate_rolling_measures(states, days):
+    codes, n_states = state_codes(states)
+    prefix = prefix_state_counts(codes, n_states)
+    left = rolling_window_starts(states.index, days)
+    right = np.arange(1, len(states) + 1)
+    measures = window_measures(prefix, left, right)
+    incomplete = states.index < states.index[0] + pd.Timedelta(days=days - 1)
+    series = []
+    for measure in measures:
+        measure[incomplete] = np.nan
+        series.append(pd.Series(measure, index=states.index))
+    return tuple(series)
+
+# Rolling complexity for many window lengths from one set of prefix counts
+def scan_rolling_complexity(states, windows=range(7, 366)):
+    codes, n_states = state_codes(states)
+    prefix = prefix_state_counts(codes, n_states)
+    right = np.arange(1, len(states) + 1)
+    scan = {}
+    for days in windows:
+        left = rolling_window_starts(states.index, days)
+        _, _, complexity = window_measures(prefix, left, right)
+        complexity[states.index < states.index[0] + pd.Timedelta(days=days - 1)] = np.nan
+        scan[days] = complexity
+    return pd.DataFrame(scan, index=states.index)
+
+# Calendar bucket number of every row (W, M, Q, Y, ...) and the bucket end dates
+def calendar_buckets(index, freq):
+    periods = index.to_period(freq)
+    bucket_ids, buckets = pd.factorize(periods, sort=True)
+    return bucket_ids, buckets.end_time.normalize()
+
+# Per-bucket state count matrix (n_buckets x n_states) and the bucket end dates
+def bucket_state_counts(states, freq):
+    codes, n_states = state_codes(states)
+    bucket_ids, bucket_ends = calendar_buckets(states.index, freq)
+    valid = codes >= 0
+    flat = bucket_ids[valid] * n_states + codes[valid]
+    counts = np.bincount(flat, minlength=len(bucket_ends) * n_states)
+    return counts.reshape(len(bucket_ends), n_states), bucket_ends
+
+# Row bounds [left, right) of inclusive date windows [start, end] on a sorted date index,
+# and which windows were kept. By default only windows whose start and end dates are both
+# rows are kept (as df.loc[start:end] over anchors that exist); keep_partial=True keeps
+# every window, bounded by the rows that fall inside it.
+def anchored_window_bounds(index, starts, ends, keep_partial=False):
+    starts, ends = pd.DatetimeIndex(starts), pd.DatetimeIndex(ends)
+    kept = np.ones(len(starts), dtype=bool) if keep_partial else starts.isin(index) & ends.isin(index)
+    left = np.searchsorted(index.values, starts[kept].values, side='left')
+    right = np.searchsorted(index.values, ends[kept].values, side='right')
+    return left, right, kept
+
+# Complexity of inclusive date windows [start, end], indexed by window end date, and the
+# number of windows dropped because their start or end is not a row (none with
+# keep_partial=True); windows without states are NaN
+def calculate_window_complexity(states, starts, ends, keep_partial=False):
+    codes, n_states = state_codes(states)
+    prefix = prefix_state_counts(codes, n_states)
+    left, right, kept = anchored_window_bounds(states.index, starts, ends, keep_partial)
+    _, _, complexity = window_measures(prefix, left, right)
+    return pd.Series(complexity, index=pd.DatetimeIndex(pd.DatetimeIndex(ends)[kept], name='Date')), int((~kept).sum())
+
+# Each scale of the count pyramid is summed from the finest level its buckets nest in
+PYRAMID_PARENTS = {'W': 'D', 'M': 'D', 'Q': 'M', 'Y': 'Q'}
+
+# One pyramid level: per-bucket state counts, and the position of each state's first
+# observation in the bucket (used to break modal ties the way value_counts does)
+PyramidLevel = namedtuple('PyramidLevel', ['counts', 'first_seen'])
+
+# Count and first-seen matrices of the day buckets of a state series
+def _day_level(states):
+    codes, n_states = state_codes(states)
+    counts, bucket_ends = bucket_state_counts(states, 'D')
+    bucket_ids, _ = calendar_buckets(states.index, 'D')
+    valid = np.flatnonzero(codes >= 0)
+    flat = bucket_ids[valid] * n_states + codes[valid]
+    first_seen = np.full(counts.size, len(codes), dtype=np.int64)
+    unique_flat, first_index = np.unique(flat, return_index=True)
+    first_seen[unique_flat] = valid[first_index]
+    return counts, first_seen.reshape(counts.shape), bucket_ends
+
+# Combine consecutive buckets of a level into coarser calendar buckets
+def aggregate_bucket_counts(counts, first_seen, bucket_ends, freq):
+    bucket_ids, coarse_ends = calendar_buckets(pd.DatetimeIndex(bucket_ends), freq)
+    starts = np.flatnonzero(np.r_[True, np.diff(bucket_ids) != 0])
+    return (np.add.reduceat(counts, starts, axis=0),
+            np.minimum.reduceat(first_seen, starts, axis=0),
+            coarse_ends)
+
+# Per-bucket state counts at every requested scale; only the day level touches the
+# raw states, coarser levels are reduced from finer ones
+def build_count_pyramid(states, scales):
+    return count_pyramid_from_days(*_day_level(states), scales)
+
+# Count pyramid from day-level count and first-seen matrices, however they were produced
+def count_pyramid_from_days(day_counts, day_first_seen, day_ends, scales):
+    levels = {'D': (day_counts, day_first_seen, day_ends)}
+
+    def level(scale):
+        if scale not in levels:
+            levels[scale] = aggregate_bucket_counts(*level(PYRAMID_PARENTS.get(scale, 'D')), scale)
+        return levels[scale]
+
+    pyramid = {}
+    for scale in scales:
+        counts, first_seen, bucket_ends = level(scale)
+        index = pd.DatetimeIndex(bucket_ends, name='Date')
+        pyramid[scale] = PyramidLevel(pd.DataFrame(counts, index=index), pd.DataFrame(first_seen, index=index))
+    return pyramid
+
+# Most frequent state of every bucket; ties go to the state observed first, -1 if empty
+def modal_states(level):
+    counts = level.counts.to_numpy()
+    first_seen = level.first_seen.to_numpy()
+    is_max = (counts == counts.max(axis=1, keepdims=True)) & (counts > 0)
+    modal = np.where(is_max, first_seen, np.iinfo(np.int64).max).argmin(axis=1)
+    return np.where(counts.sum(axis=1) > 0, modal, -1)
+
+# Modal state and measures of every bucket in a pyramid level
+def bucket_measures(level):
+    counts = level.counts.to_numpy()
+    emergence, self_organization, complexity = measures_from_counts(counts)
+    modal = modal_states(level)
+    measures = pd.DataFrame({'Modal State': np.where(modal >= 0, modal, np.nan), 'Emergence': emergence,
+                             'Self-organization': self_organization, 'Complexity': complexity},
+                            index=level.counts.index)
+    measures.loc[modal < 0, ['Emergence', 'Self-organization', 'Complexity']] = np.nan
+    return measures
+
+# Measures of the distribution of modal states across the buckets of a pyramid level
+def modal_state_measures(level):
+    modal = modal_states(level)
+    modal_counts = np.bincount(modal[modal >= 0], minlength=level.counts.shape[1])
+    emergence, self_organization, complexity = measures_from_counts(modal_counts)
+    return float(emergence), float(self_organization), float(complexity)
+
+# Streaming state histogram: add or remove one observation at a time and read the
+# measures back in O(1), keeping sum(c * log2(c)) up to date incrementally
+class StateHistogram:
+    def __init__(self, n_states):
+        self.counts = np.zeros(n_states, dtype=np.int64)
+        self.total = 0
+        self.observed = 0
+        self._count_log_count = 0.0
+
+    @staticmethod
+    def _clogc(count):
+        return count * np.log2(count) if count > 0 else 0.0
+
+    def _update(self, code, step):
+        count = self.counts[code]
+        self._count_log_count -= self._clogc(count)
+        self.observed -= count > 0
+        count += step
+        self._count_log_count += self._clogc(count)
+        self.observed += count > 0
+        self.counts[code] = count
+        self.total += step
+
+    def add(self, code):
+        if code >= 0:
+            self._update(code, 1)
+
+    def remove(self, code):
+        if code >= 0:
+            self._update(code, -1)
+
+    @property
+    def emergence(self):
+        if self.observed < 2:
+            return 0.0
+        entropy = np.log2(self.total) - self._count_log_count / self.total
+        return max(entropy, 0.0) / np.log2(self.observed)
+
+    @property
+    def self_organization(self):
+        return 1 - self.emergence
+
+    @property
+    def complexity(self):
+        return 4 * self.emergence * self.self_organization
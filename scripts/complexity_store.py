@@ -1,7 +1,11 @@
 import pandas as pd
 import numpy as np
-from data_preperation import data
-from state_calculations import data_with_states
+from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+from state_calculations import STATE_LABELS, STATE_PERCENTILES, apply_state_definitions
+from complexity_engine import calculate_cumulative_measures, state_code_series
+from transitions import calculate_cumulative_transition_measures, calculate_period_transition_measures
+from homeostasis import calculate_autopoiesis, calculate_homeostasis, percentile_states
+from instrumentation import disable as write_instrumentation_report, enable_from_env, instrumented
 
 def calculate_emergence(probabilities):
     probabilities = probabilities[probabilities > 0]  # Avoid log(0)
@@ -18,6 +22,7 @@ def calculate_self_organization(emergence):
 def calculate_complexity(emergence, self_organization):
     return 4 * emergence * self_organization
 
+@instrumented('resample')
 def calculate_and_store_complexity(df, crypto, time_scale):
     state_column = f"{crypto} Transactions per kW State"
     complexity_column = f"{crypto} {time_scale} Complexity"
@@ -32,33 +37,91 @@ def calculate_and_store_complexity(df, crypto, time_scale):
         else:
             return np.nan
     
-    df[complexity_column] = df[state_column].resample(time_scale).apply(calculate_complexity_for_period)
+    codes = state_code_series(df[state_column])
+    df[complexity_column] = codes.resample(time_scale).apply(calculate_complexity_for_period)
     
     return df
 
+@instrumented('cumulative_complexity')
 def calculate_cumulative_complexity(df, crypto):
     state_column = f"{crypto} Transactions per kW State"
     complexity_column = f"{crypto} Cumulative Complexity"
     
-    cumulative_complexity = []
-    for i in range(len(df)):
-        data_slice = df.iloc[:i+1][state_column]
-        state_probs = data_slice.value_counts(normalize=True)
-        emergence = calculate_emergence(state_probs)
-        self_org = calculate_self_organization(emergence)
-        complexity = calculate_complexity(emergence, self_org)
-        cumulative_complexity.append(complexity)
-    
+    _, _, cumulative_complexity = calculate_cumulative_measures(df[state_column])
     df[complexity_column] = cumulative_complexity
     
     return df
 
-def calculate_and_store_complexity_measures(df, cryptos, time_scales):
+# Order-aware counterpart of calculate_and_store_complexity: complexity of the state
+# transitions within each period, stored at the period end like the marginal measure
+@instrumented('transition_complexity')
+def calculate_and_store_transition_complexity(df, crypto, time_scale):
+    state_column = f"{crypto} Transactions per kW State"
+    complexity_column = f"{crypto} {time_scale} Transition Complexity"
+
+    measures = calculate_period_transition_measures(df[state_column], time_scale)
+    df[complexity_column] = measures['Transition Complexity']
+
+    return df
+
+@instrumented('cumulative_transition_complexity')
+def calculate_cumulative_transition_complexity(df, crypto):
+    state_column = f"{crypto} Transactions per kW State"
+
+    measures = calculate_cumulative_transition_measures(df[state_column])
+    df[f"{crypto} Cumulative Transition Complexity"] = measures['Transition Complexity']
+    df[f"{crypto} Cumulative Entropy Rate"] = measures['Entropy Rate']
+
+    return df
+
+# Homeostasis between consecutive periods, stored at the period end like the complexity;
+# all time scales are evaluated together from one count pyramid
+@instrumented('homeostasis')
+def calculate_and_store_homeostasis(df, crypto, time_scales):
+    state_column = f"{crypto} Transactions per kW State"
+
+    for time_scale, homeostasis in calculate_homeostasis(df[state_column], time_scales).items():
+        df[f"{crypto} {time_scale} Homeostasis"] = homeostasis
+
+    return df
+
+# Autopoiesis of each period: complexity of the chain's energy states relative to that of
+# its transaction states (the environment). components holds the "{crypto} kW" and
+# "{crypto} Transactions" columns, which get states the way the chain's own states were
+# defined: the same percentiles, or the same adaptive binning method when one is given.
+@instrumented('autopoiesis')
+def calculate_and_store_autopoiesis(df, crypto, time_scales, components,
+                                    percentiles=STATE_PERCENTILES, labels=STATE_LABELS, binning=None):
+    components = components.reindex(df.index)
+    energy = percentile_states(components[f"{crypto} kW"], percentiles, labels, binning)
+    transactions = percentile_states(components[f"{crypto} Transactions"], percentiles, labels, binning)
+
+    for time_scale, autopoiesis in calculate_autopoiesis(energy, transactions, time_scales).items():
+        df[f"{crypto} {time_scale} Autopoiesis"] = autopoiesis
+
+    return df
+
+# transitions=True adds the Markov transition measures next to the marginal ones,
+# homeostasis=True the homeostasis of every period, and a components frame (see
+# conversion.build_component_frame) the autopoiesis of every period, with component states
+# from the given percentiles and labels or binning method
+@instrumented('complexity')
+def calculate_and_store_complexity_measures(df, cryptos, time_scales, transitions=False, homeostasis=False,
+                                            components=None, percentiles=STATE_PERCENTILES, labels=STATE_LABELS,
+                                            binning=None):
     for crypto in cryptos:
         for time_scale in time_scales:
             df = calculate_and_store_complexity(df, crypto, time_scale)
+            if transitions:
+                df = calculate_and_store_transition_complexity(df, crypto, time_scale)
+        if homeostasis:
+            df = calculate_and_store_homeostasis(df, crypto, time_scales)
+        if components is not None:
+            df = calculate_and_store_autopoiesis(df, crypto, time_scales, components, percentiles, labels, binning)
         
         df = calculate_cumulative_complexity(df, crypto)
+        if transitions:
+            df = calculate_cumulative_transition_complexity(df, crypto)
     
     return df
 
@@ -66,7 +129,13 @@ def calculate_and_store_complexity_measures(df, cryptos, time_scales):
 CRYPTOS = ['Bitcoin', 'Ethereum']
 TIME_SCALES = ['W', 'M']  # W for weekly, M for monthly
 
-# Calculate and store complexity measures
-data_with_complexity = calculate_and_store_complexity_measures(data_with_states, CRYPTOS, TIME_SCALES)
+if __name__ == "__main__":
+    # Set COMPLEXITY_INSTRUMENT=report.json to record per-stage timings
+    enable_from_env()
+
+    # Calculate and store complexity measures
+    data_with_states = apply_state_definitions(load_and_prepare_data(DEFAULT_MASTER_CSV), CRYPTOS, STATE_PERCENTILES, STATE_LABELS)
+    data_with_complexity = calculate_and_store_complexity_measures(data_with_states, CRYPTOS, TIME_SCALES)
 
-print(data_with_complexity.head())
\ No newline at end of file
+    print(data_with_complexity.head())
+    write_instrumentation_report()
@@ -1,11 +1,20 @@
 import pandas as pd
 import numpy as np
 from scipy import stats
-from sklearn.metrics import mutual_info_score
-from complexity_store import data_with_complexity
-import dataframe_image as dfi
+from significance import correlation_significance, rowwise_mutual_info
 
-def calculate_correlations(data, crypto, complexity_col, marketcap_col, n_bins=10):
+COMPLEXITY_COLUMNS = {
+    'weekly': "{crypto} W Complexity",
+    'monthly': "{crypto} M Complexity",
+    'cumulative': "{crypto} Cumulative Complexity",
+}
+
+def complexity_column(crypto, complexity_type):
+    if complexity_type not in COMPLEXITY_COLUMNS:
+        raise ValueError("Invalid complexity type. Choose from 'weekly', 'monthly', or 'cumulative'.")
+    return COMPLEXITY_COLUMNS[complexity_type].format(crypto=crypto)
+
+def calculate_correlations(data, crypto, complexity_col, marketcap_col, n_bins=10, n_resamples=0, block_length=None, processes=None):
     # Extract the relevant columns from the data
     complexity = data[complexity_col]
     market_cap = data[marketcap_col]
@@ -26,7 +35,7 @@ def calculate_correlations(data, crypto, complexity_col, marketcap_col, n_bins=1
     market_cap_bins = pd.cut(market_cap, bins=n_bins, labels=False)
 
     # Calculate mutual information using the discretized values
-    mutual_info = mutual_info_score(complexity_bins, market_cap_bins)
+    mutual_info = rowwise_mutual_info(complexity_bins.to_numpy()[None], market_cap_bins.to_numpy()[None], n_bins)[0]
 
     # Create a DataFrame to store the correlation measures
     corr_data = {
@@ -37,41 +46,57 @@ def calculate_correlations(data, crypto, complexity_col, marketcap_col, n_bins=1
         'Spearman p-value': [spearman_p],
         'Mutual Information': [mutual_info]
     }
+
+    # Block-bootstrap confidence intervals and block-permutation p-values, which stay valid
+    # for autocorrelated daily series
+    if n_resamples:
+        significance = correlation_significance(complexity, market_cap, complexity_bins, market_cap_bins, n_bins,
+                                                n_resamples, block_length, processes=processes)
+        corr_data.update({column: [value] for column, value in significance.items()})
+
     corr_df = pd.DataFrame(corr_data)
 
     return corr_df
 
-def analyze_correlations(data, cryptos, complexity_type):
+def analyze_correlations(data, cryptos, complexity_type, n_resamples=0, processes=None):
     all_corr_df = pd.DataFrame()
     for crypto in cryptos:
-        if complexity_type == 'weekly':
-            complexity_col = f"{crypto} W Complexity"
-        elif complexity_type == 'monthly':
-            complexity_col = f"{crypto} M Complexity"
-        elif complexity_type == 'cumulative':
-            complexity_col = f"{crypto} Cumulative Complexity"
-        else:
-            raise ValueError("Invalid complexity type. Choose from 'weekly', 'monthly', or 'cumulative'.")
+        complexity_col = complexity_column(crypto, complexity_type)
         marketcap_col = f"{crypto.lower()}_market_cap"
 
         # Calculate correlations for the current cryptocurrency
-        corr_df = calculate_correlations(data, crypto, complexity_col, marketcap_col)
+        corr_df = calculate_correlations(data, crypto, complexity_col, marketcap_col, n_resamples=n_resamples, processes=processes)
 
         # Append the results to the overall DataFrame
         all_corr_df = pd.concat([all_corr_df, corr_df], ignore_index=True)
 
     return all_corr_df
 
+# Render the correlation results as a centred table image; dataframe_image is only
+# needed here, so the correlation and lag calculations import without it
+def export_correlation_table(correlation_results, path='correlation_table.png'):
+    import dataframe_image as dfi
+
+    correlation_results = correlation_results.copy()
+
+    # Format p-values to display in scientific notation
+    correlation_results['Pearson p-value'] = correlation_results['Pearson p-value'].apply(lambda x: '{:.2e}'.format(x))
+    correlation_results['Spearman p-value'] = correlation_results['Spearman p-value'].apply(lambda x: '{:.2e}'.format(x))
+    for column in correlation_results.columns:
+        if column.endswith('Permutation p-value'):
+            correlation_results[column] = correlation_results[column].apply(lambda x: '{:.2e}'.format(x))
+
+    styled_table = correlation_results.style.set_properties(**{'text-align': 'center'}).set_table_styles([dict(selector='th', props=[('text-align', 'center')])])
+    dfi.export(styled_table, path, table_conversion='matplotlib')
+
 # Constants
 CRYPTOS = ['Bitcoin', 'Ethereum']
 COMPLEXITY_TYPE = 'monthly' # Choose from 'weekly', 'monthly', or 'cumulative'
+N_RESAMPLES = 10000 # Bootstrap and permutation resamples per chain (0 to skip)
 
-# Calculate correlation results
-correlation_results = analyze_correlations(data_with_complexity, CRYPTOS, COMPLEXITY_TYPE)
-
-# Format p-values to display in scientific notation
-correlation_results['Pearson p-value'] = correlation_results['Pearson p-value'].apply(lambda x: '{:.2e}'.format(x))
-correlation_results['Spearman p-value'] = correlation_results['Spearman p-value'].apply(lambda x: '{:.2e}'.format(x))
+if __name__ == "__main__":
+    from pipeline import Pipeline
 
-styled_table = correlation_results.style.set_properties(**{'text-align': 'center'}).set_table_styles([dict(selector='th', props=[('text-align', 'center')])])
-dfi.export(styled_table, 'correlation_table.png', table_conversion='matplotlib')
\ No newline at end of file
+    # Calculate correlation results
+    pipeline = Pipeline(cryptos=CRYPTOS, complexity_type=COMPLEXITY_TYPE, n_resamples=N_RESAMPLES)
+    export_correlation_table(pipeline['correlations'])
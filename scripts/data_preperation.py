@@ -1,5 +1,11 @@
+import os
 import pandas as pd
+from instrumentation import instrumented
 
+# Master dataset written by data/conversion.py
+DEFAULT_MASTER_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'master_transactions_per_kw.csv')
+
+@instrumented('load_csv')
 def load_and_prepare_data(csv_path):
     # Read the CSV file
     df = pd.read_csv(csv_path)
@@ -14,8 +20,7 @@ def load_and_prepare_data(csv_path):
     
     return df
 
-# Example usage
-csv_path = '/Users/shingai/Desktop/cryptoeconomic_complexity/data/master_transactions_per_kw.csv'
-data = load_and_prepare_data(csv_path)
-print(data.head())
-
+if __name__ == "__main__":
+    # Example usage
+    data = load_and_prepare_data(DEFAULT_MASTER_CSV)
+    print(data.head())
@@ -0,0 +1,134 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+from complexity_store import TIME_SCALES
+from multichain import matrix_cumulative_measures, matrix_percentiles, matrix_period_measures, matrix_state_codes
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from conversion import DATA_DIR, END_DATE, build_bound_masters
+
+N_SAMPLES = 1000
+
+# Percentile bands reported for every complexity series
+BANDS = [5, 25, 50, 75, 95]
+
+# Day-to-day correlation of a trajectory's position within the CCAF bounds. The bounds
+# come from uncertainty about the hardware mix, which drifts slowly, so positions are
+# strongly persistent (0.99 is a correlation time of about 100 days); 1.0 keeps one
+# position per trajectory and 0.0 draws every day independently.
+PERSISTENCE = 0.99
+
+# Trajectories pushed through the 2D state and complexity computation at once; bounds
+# the size of the (samples x days x states) prefix count array
+CHUNK_SAMPLES = 250
+
+# Master frames at each energy bound, indexed by date like load_and_prepare_data
+def load_bound_masters(data_dir=DATA_DIR, end_date=END_DATE):
+    return {bound: master.set_index('Date') for bound, master in build_bound_masters(data_dir, end_date).items()}
+
+# Energy of the MIN and MAX bounds relative to GUESS for one crypto, from the
+# transactions-per-kW of the bound masters (the transactions cancel out). Days where a
+# bound is missing keep the GUESS energy.
+def energy_ratio_bounds(masters, crypto):
+    column = f"{crypto} Transactions per kW"
+    guess = masters['GUESS'][column].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lower = guess / masters['MIN'][column].to_numpy(dtype=float)
+        upper = guess / masters['MAX'][column].to_numpy(dtype=float)
+    lower = np.where(np.isfinite(lower), np.minimum(lower, 1.0), 1.0)
+    upper = np.where(np.isfinite(upper), np.maximum(upper, 1.0), 1.0)
+    return lower, upper
+
+# Standard normal paths (samples x days), AR(1) along the day axis with unit variance
+def _latent_paths(n_samples, n_days, persistence, rng):
+    paths = rng.standard_normal((n_samples, n_days))
+    innovation = np.sqrt(1 - persistence ** 2)
+    for day in range(1, n_days):
+        paths[:, day] = persistence * paths[:, day - 1] + innovation * paths[:, day]
+    return paths
+
+# Sampled energy / GUESS energy (samples x days): triangular between the lower and upper
+# ratio with its mode at 1 (the GUESS), driven by persistent latent Gaussian paths
+def sample_energy_ratios(lower, upper, n_samples, rng, persistence=PERSISTENCE):
+    u = ndtr(_latent_paths(n_samples, len(lower), persistence, rng))
+    width = upper - lower
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mode_quantile = np.where(width > 0, (1 - lower) / width, 0.5)
+    below = lower + np.sqrt(u * width * (1 - lower))
+    above = upper - np.sqrt((1 - u) * width * (upper - 1))
+    return np.where(u < mode_quantile, below, above)
+
+# State codes, period and cumulative complexity of a batch of trajectories of one crypto
+def _batch_complexity(values, dates, percentiles, n_states, time_scales):
+    mask = ~np.isnan(values)
+    thresholds = matrix_percentiles(values, mask, percentiles)
+    codes = matrix_state_codes(values, mask, thresholds)
+    periods = {}
+    for time_scale in time_scales:
+        (_, _, complexity), bucket_ends = matrix_period_measures(codes, dates, n_states, time_scale)
+        periods[time_scale] = (complexity.astype(np.float32), bucket_ends)
+    _, _, cumulative = matrix_cumulative_measures(codes, mask, n_states)
+    return periods, cumulative.astype(np.float32)
+
+# Percentiles across trajectories (rows) of every column; NaN columns stay NaN
+def _bands(samples, bands):
+    result = np.full((len(bands), samples.shape[1]), np.nan)
+    present = ~np.isnan(samples).any(axis=0)
+    result[:, present] = np.percentile(samples[:, present], bands, axis=0)
+    return result
+
+# Monte Carlo ensemble: n_samples energy trajectories per crypto within the CCAF MIN/MAX
+# bounds, each turned into transactions per kW, states and complexity as rows of 2D
+# arrays. Returns a date-indexed frame with the percentile bands of every complexity
+# series ("{crypto} {scale} Complexity P5", ..., "{crypto} Cumulative Complexity P95"),
+# period values on the period end dates as in complexity_store.
+def ensemble_complexity(masters, cryptos=CRYPTOS, n_samples=N_SAMPLES, percentiles=STATE_PERCENTILES,
+                        labels=STATE_LABELS, time_scales=TIME_SCALES, bands=BANDS, persistence=PERSISTENCE,
+                        seed=0, chunk_samples=CHUNK_SAMPLES):
+    index = masters['GUESS'].index
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for crypto in cryptos:
+        guess = masters['GUESS'][f"{crypto} Transactions per kW"].to_numpy(dtype=float)
+        lower, upper = energy_ratio_bounds(masters, crypto)
+        period_samples = {time_scale: [] for time_scale in time_scales}
+        cumulative_samples = []
+        for start in range(0, n_samples, chunk_samples):
+            ratios = sample_energy_ratios(lower, upper, min(chunk_samples, n_samples - start), rng, persistence)
+            values = (guess / ratios).astype(np.float32)
+            periods, cumulative = _batch_complexity(values, index, percentiles, len(labels), time_scales)
+            for time_scale, (complexity, bucket_ends) in periods.items():
+                period_samples[time_scale].append(complexity)
+            cumulative_samples.append(cumulative)
+
+        for time_scale in time_scales:
+            bucket_ends = periods[time_scale][1]
+            for band, values in zip(bands, _bands(np.concatenate(period_samples[time_scale]), bands)):
+                columns[f"{crypto} {time_scale} Complexity P{band}"] = pd.Series(values, index=bucket_ends).reindex(index)
+        for band, values in zip(bands, _bands(np.concatenate(cumulative_samples), bands)):
+            columns[f"{crypto} Cumulative Complexity P{band}"] = pd.Series(values, index=index)
+    return pd.DataFrame(columns, index=index)
+
+def main():
+    parser = argparse.ArgumentParser(description='Complexity percentile bands from the CCAF MIN/GUESS/MAX power bounds')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--samples', type=int, default=N_SAMPLES)
+    parser.add_argument('--persistence', type=float, default=PERSISTENCE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='complexity_bands.csv')
+    args = parser.parse_args()
+
+    bands = ensemble_complexity(load_bound_masters(args.data_dir), args.cryptos, args.samples,
+                                persistence=args.persistence, seed=args.seed)
+    print(bands.filter(like='Cumulative').dropna().tail())
+    bands.to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from binning import adaptive_thresholds, state_labels
+from complexity_engine import build_count_pyramid, define_state_codes, make_state_column, measures_from_counts
+
+# Per-bucket count matrices of several time scales stacked into one array, with the row
+# offset where each scale starts (and the total at the end)
+def _stack_levels(pyramid, time_scales):
+    counts = [pyramid[time_scale].counts.to_numpy() for time_scale in time_scales]
+    return np.concatenate(counts), np.cumsum([0] + [len(level) for level in counts])
+
+def _split_levels(values, offsets, pyramid, time_scales):
+    return {time_scale: pd.Series(values[offsets[i]:offsets[i + 1]], index=pyramid[time_scale].counts.index)
+            for i, time_scale in enumerate(time_scales)}
+
+# Homeostasis of every row of a count array against the row before it: 1 minus the
+# normalised Hamming (total variation) distance between the two state distributions,
+# half the L1 distance of the probabilities, as in Fernández, Maldonado & Gershenson.
+# 1 means the distribution did not change, 0 that the two share no state. Rows marked
+# in `first` (no predecessor) and rows where either distribution is empty are NaN.
+def homeostasis_from_counts(counts, first):
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / totals[:, None]
+    distance = 0.5 * np.abs(probabilities[1:] - probabilities[:-1]).sum(axis=1)
+    homeostasis = np.r_[np.nan, 1 - distance]
+    valid = ~first & (totals > 0) & (np.r_[0.0, totals[:-1]] > 0)
+    return np.where(valid, homeostasis, np.nan)
+
+# Autopoiesis of every row: the complexity of the system's states over the complexity of
+# its environment's states in the same bucket. Above 1 the system is more complex than
+# its environment. NaN where either is empty or the environment has no complexity.
+def autopoiesis_from_counts(system_counts, environment_counts):
+    _, _, system_complexity = measures_from_counts(system_counts)
+    _, _, environment_complexity = measures_from_counts(environment_counts)
+    valid = ((np.asarray(system_counts).sum(axis=1) > 0) & (np.asarray(environment_counts).sum(axis=1) > 0)
+             & (environment_complexity > 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(valid, system_complexity / environment_complexity, np.nan)
+
+# Homeostasis of a state series at every time scale ({scale: Series by bucket end date}).
+# The count matrices of all scales come from one count pyramid and are compared in a
+# single vectorised pass; the first bucket of each scale has nothing to compare against.
+def calculate_homeostasis(states, time_scales):
+    pyramid = build_count_pyramid(states, time_scales)
+    counts, offsets = _stack_levels(pyramid, time_scales)
+    first = np.zeros(len(counts), dtype=bool)
+    first[offsets[:-1]] = True
+    return _split_levels(homeostasis_from_counts(counts, first), offsets, pyramid, time_scales)
+
+# Autopoiesis of a system state series against an environment state series on the same
+# dates, at every time scale in one pass ({scale: Series by bucket end date})
+def calculate_autopoiesis(system_states, environment_states, time_scales):
+    system = build_count_pyramid(system_states, time_scales)
+    environment = build_count_pyramid(environment_states, time_scales)
+    system_counts, offsets = _stack_levels(system, time_scales)
+    environment_counts, _ = _stack_levels(environment, time_scales)
+    return _split_levels(autopoiesis_from_counts(system_counts, environment_counts), offsets, system, time_scales)
+
+# States of any value series from percentiles of its own values, like apply_state_definitions,
+# or from an adaptive binning method of its own values, like apply_adaptive_state_definitions
+def percentile_states(values, percentiles, labels, binning=None):
+    array = values.to_numpy(dtype=float)
+    if binning:
+        thresholds = adaptive_thresholds(array, binning, len(labels))
+        labels = state_labels(len(thresholds) + 1, labels)
+    else:
+        thresholds = np.percentile(array[~np.isnan(array)], percentiles)
+    return make_state_column(define_state_codes(array, thresholds), labels, values.index)
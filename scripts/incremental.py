@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+from complexity_engine import cumulative_state_counts, define_state_codes, make_state_column, measures_from_counts
+from streaming_states import MIN_PERIODS, StreamingThresholds
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from conversion import DATA_DIR, END_DATE, MASTER_FILE, ingest_incremental, rebuild_master
+
+# Downstream outputs kept next to the master CSV and extended on every incremental run
+CUMULATIVE_FILE = 'master_cumulative_complexity.csv'
+COMPLEXITY_STATE_FILE = 'complexity_state.json'
+
+# States and cumulative complexity of new master rows, continuing from the running state
+# counts of each crypto. State thresholds either stay frozen at the last full rebuild or,
+# with a streaming sketch in the state, follow the values seen so far without look-ahead.
+def extend_cumulative_complexity(new_rows, state, cryptos=CRYPTOS, labels=STATE_LABELS):
+    extension = pd.DataFrame({'Date': new_rows['Date']})
+    for crypto in cryptos:
+        crypto_state = state[crypto]
+        values = new_rows[f"{crypto} Transactions per kW"].to_numpy(dtype=float)
+        if 'sketch' in crypto_state:
+            stream = StreamingThresholds.from_dict(crypto_state['sketch'])
+            codes = np.array([stream.classify(value, MIN_PERIODS) for value in values], dtype=np.int8)
+            crypto_state['sketch'] = stream.to_dict()
+        else:
+            codes = define_state_codes(values, crypto_state['thresholds'])
+        counts = cumulative_state_counts(codes, len(labels)) + np.asarray(crypto_state['counts'], dtype=np.int64)
+        _, _, complexity = measures_from_counts(counts)
+        extension[f"{crypto} Transactions per kW State"] = make_state_column(codes, labels, extension.index)
+        extension[f"{crypto} Cumulative Complexity"] = complexity
+        if len(codes):
+            crypto_state['counts'] = counts[-1].tolist()
+    return extension
+
+# The state before any row: zero counts, and either thresholds from the whole master
+# history or an empty streaming sketch
+def initial_complexity_state(master, cryptos=CRYPTOS, percentiles=STATE_PERCENTILES, labels=STATE_LABELS,
+                             streaming=False):
+    state = {}
+    for crypto in cryptos:
+        state[crypto] = {'counts': [0] * len(labels)}
+        if streaming:
+            state[crypto]['sketch'] = StreamingThresholds(percentiles).to_dict()
+        else:
+            values = master[f"{crypto} Transactions per kW"].to_numpy(dtype=float)
+            state[crypto]['thresholds'] = np.percentile(values[~np.isnan(values)], percentiles).tolist()
+    return state
+
+def _save_state(data_dir, state):
+    with open(os.path.join(data_dir, COMPLEXITY_STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+
+# Full rebuild of the master CSV and the downstream cumulative complexity
+def refresh_full(data_dir=DATA_DIR, end_date=END_DATE, streaming=False):
+    master = rebuild_master(data_dir, end_date)
+    state = initial_complexity_state(master, streaming=streaming)
+    extend_cumulative_complexity(master, state).to_csv(os.path.join(data_dir, CUMULATIVE_FILE), index=False)
+    _save_state(data_dir, state)
+    return master
+
+# Daily refresh: work proportional to the rows that arrived since the last run
+def refresh_incremental(data_dir=DATA_DIR, end_date=END_DATE):
+    with open(os.path.join(data_dir, COMPLEXITY_STATE_FILE)) as f:
+        state = json.load(f)
+    new_rows = ingest_incremental(data_dir, end_date)
+    extension = extend_cumulative_complexity(new_rows, state)
+    extension.to_csv(os.path.join(data_dir, CUMULATIVE_FILE), mode='a', header=False, index=False)
+    _save_state(data_dir, state)
+    return new_rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the master CSV and cumulative complexity from the raw exports')
+    parser.add_argument('--full', action='store_true', help='rebuild everything and recompute the state thresholds')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--end-date', default=END_DATE)
+    parser.add_argument('--streaming-thresholds', action='store_true',
+                        help='with --full: classify days with look-ahead-free streaming percentiles')
+    args = parser.parse_args()
+
+    if args.full or not os.path.exists(os.path.join(args.data_dir, COMPLEXITY_STATE_FILE)):
+        master = refresh_full(args.data_dir, args.end_date, args.streaming_thresholds)
+        print(f"Rebuilt {MASTER_FILE} with {len(master)} rows")
+    else:
+        new_rows = refresh_incremental(args.data_dir, args.end_date)
+        print(f"Appended {len(new_rows)} rows to {MASTER_FILE} and {CUMULATIVE_FILE}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import cProfile
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Environment switches for entry points without their own flags: the report path, and a
+# comma-separated list of stage names to capture with the profiler
+REPORT_ENV = 'COMPLEXITY_INSTRUMENT'
+PROFILE_STAGES_ENV = 'COMPLEXITY_PROFILE_STAGES'
+PROFILER_ENV = 'COMPLEXITY_PROFILER'
+
+# Active recorder; None means instrumentation is off and instrumented calls go straight through
+_recorder = None
+
+# Profiler capture of one stage run, written next to the report
+def _cprofile_capture(path):
+    profiler = cProfile.Profile()
+
+    class Capture:
+        def __enter__(self):
+            profiler.enable()
+
+        def __exit__(self, *exc):
+            profiler.disable()
+            profiler.dump_stats(path + '.prof')
+    return Capture()
+
+def _pyinstrument_capture(path):
+    from pyinstrument import Profiler
+    profiler = Profiler()
+
+    class Capture:
+        def __enter__(self):
+            profiler.start()
+
+        def __exit__(self, *exc):
+            profiler.stop()
+            with open(path + '.html', 'w') as f:
+                f.write(profiler.output_html())
+    return Capture()
+
+PROFILERS = {'cprofile': _cprofile_capture, 'pyinstrument': _pyinstrument_capture}
+
+# Per-run stage records. Stages nest; each records wall time, CPU time, rows processed and
+# the peak of traced memory above what was allocated when it started.
+class Recorder:
+    def __init__(self, report_path=None, profile_stages=(), profiler='cprofile', track_memory=True):
+        self.report_path = report_path
+        self.profile_stages = set(profile_stages)
+        self.profiler = PROFILERS[profiler]
+        self.track_memory = track_memory
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.stages = []
+        self._stack = []
+        self._captures = 0
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _profile_path(self, name):
+        self._captures += 1
+        directory = os.path.dirname(os.path.abspath(self.report_path or 'instrumentation.json'))
+        return os.path.join(directory, f"profile-{name.replace(' ', '_').replace('/', '_')}-{self._captures}")
+
+    def run(self, name, func, args, kwargs, base=None):
+        path = '/'.join([frame['name'] for frame in self._stack] + [name])
+        frame = {'name': name, 'segment_peak': 0}
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['segment_peak'] = max(self._stack[-1]['segment_peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_bytes'] = current
+        # Profilers cannot nest; a stage inside a captured stage is covered by the outer capture
+        capturing = any('profile_path' in outer for outer in self._stack)
+        profile_path = self._profile_path(name) if {name, base} & self.profile_stages and not capturing else None
+        if profile_path:
+            frame['profile_path'] = profile_path
+        self._stack.append(frame)
+        capture = self.profiler(profile_path) if profile_path else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            if capture:
+                with capture:
+                    result = func(*args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stack.pop()
+            record = {'stage': name, 'path': path, 'wall_seconds': wall, 'cpu_seconds': cpu}
+            if self.track_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame['segment_peak'])
+                record['peak_bytes'] = peak - frame['start_bytes']
+                if self._stack:
+                    self._stack[-1]['segment_peak'] = max(self._stack[-1]['segment_peak'], peak)
+                tracemalloc.reset_peak()
+            self.stages.append(record)
+        record['rows'] = _rows(args[0] if args else None, result)
+        if profile_path:
+            record['profile'] = profile_path
+        return result
+
+    def report(self):
+        return {'started': self.started.isoformat(timespec='seconds'), 'argv': sys.argv,
+                'python': platform.python_version(), 'total_wall_seconds': time.perf_counter() - self._start,
+                'stages': self.stages}
+
+# Rows processed: the length of the first argument if it is array-like, else of the result
+def _rows(first, result):
+    for value in (first, result):
+        if hasattr(value, 'shape') and len(getattr(value, 'shape')):
+            return int(value.shape[0])
+    return None
+
+# Switch instrumentation on for the rest of the process
+def enable(report_path=None, profile_stages=(), profiler='cprofile', track_memory=True):
+    global _recorder
+    _recorder = Recorder(report_path, profile_stages, profiler, track_memory)
+    return _recorder
+
+# Switch instrumentation on if REPORT_ENV is set; returns whether it is on
+def enable_from_env():
+    report_path = os.environ.get(REPORT_ENV)
+    if report_path:
+        stages = [name for name in os.environ.get(PROFILE_STAGES_ENV, '').split(',') if name]
+        enable(report_path, stages, os.environ.get(PROFILER_ENV, 'cprofile'))
+    return _recorder is not None
+
+# Stop recording and write the JSON report (if a path was given); returns the report
+def disable():
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return None
+    if recorder.track_memory:
+        tracemalloc.stop()
+    report = recorder.report()
+    if recorder.report_path:
+        with open(recorder.report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+# Record every call of the decorated function as a stage. String positional arguments
+# (crypto, time scale) are appended to the stage name; profile_stages may name either.
+# When instrumentation is off the wrapper only checks one global before calling through.
+def instrumented(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return func(*args, **kwargs)
+            details = [arg for arg in args if isinstance(arg, str) and os.sep not in arg]
+            return _recorder.run(' '.join([name] + details), func, args, kwargs, base=name)
+        return wrapper
+    return decorator
+
+# Record a single call as a stage, for code paths that are not separate functions
+def run_stage(name, func, *args, **kwargs):
+    if _recorder is None:
+        return func(*args, **kwargs)
+    return _recorder.run(name, func, args, kwargs)
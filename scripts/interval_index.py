@@ -0,0 +1,172 @@
+import argparse
+import functools
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS
+from complexity_engine import measures_from_counts, prefix_state_counts, state_codes
+from data_preperation import DEFAULT_MASTER_CSV
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'interval_index')
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+
+# Query results kept per open index
+CACHE_SIZE = 4096
+
+def _prefix_file(crypto):
+    return f"{crypto.lower().replace(' ', '_')}_prefix.npy"
+
+# Write the per-chain prefix state counts of a states frame: row i of each chain's array holds
+# the state counts of the first i rows, so the counts of rows [a, b) are prefix[b] - prefix[a].
+# The dates go in one shared int64 array; everything is plain .npy so it loads memory-mapped.
+def build_interval_index(states, cryptos=CRYPTOS, index_dir=DEFAULT_INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'dates.npy'), states.index.values.astype('datetime64[ns]').astype(np.int64))
+    labels = None
+    for crypto in cryptos:
+        state_column = states[f"{crypto} Transactions per kW State"]
+        codes, n_states = state_codes(state_column)
+        prefix = prefix_state_counts(codes, n_states)
+        dtype = np.int32 if len(codes) < np.iinfo(np.int32).max else np.int64
+        np.save(os.path.join(index_dir, _prefix_file(crypto)), prefix.astype(dtype))
+        if labels is None and isinstance(state_column.dtype, pd.CategoricalDtype):
+            labels = [str(label) for label in state_column.cat.categories]
+    with open(os.path.join(index_dir, INDEX_FILE), 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'cryptos': list(cryptos), 'labels': labels,
+                   'rows': len(states), 'first_date': str(states.index[0]), 'last_date': str(states.index[-1])}, f)
+    return IntervalIndex(index_dir)
+
+# Read side of the index: complexity of any [start, end) date range from two binary searches
+# over the dates and one difference of prefix rows. Repeated queries are answered from an
+# LRU cache keyed by the resolved row range, so equivalent date ranges share an entry.
+class IntervalIndex:
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR, cache_size=CACHE_SIZE):
+        with open(os.path.join(index_dir, INDEX_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"Index in {index_dir} has version {self.meta['version']}, expected {INDEX_VERSION}")
+        self.cryptos = self.meta['cryptos']
+        self.dates = np.load(os.path.join(index_dir, 'dates.npy'), mmap_mode='r')
+        self.prefixes = {crypto: np.load(os.path.join(index_dir, _prefix_file(crypto)), mmap_mode='r')
+                         for crypto in self.cryptos}
+        self.labels = self.meta['labels'] or [str(i) for i in range(next(iter(self.prefixes.values())).shape[1])]
+        self._range_measures = functools.lru_cache(maxsize=cache_size)(self._compute)
+
+    # Row range [left, right) covered by the dates [start, end); None leaves a side open
+    def rows(self, start=None, end=None):
+        left = 0 if start is None else int(np.searchsorted(self.dates, pd.Timestamp(start).value, side='left'))
+        right = len(self.dates) if end is None else int(np.searchsorted(self.dates, pd.Timestamp(end).value, side='left'))
+        return left, max(left, right)
+
+    def counts(self, crypto, start=None, end=None):
+        if crypto not in self.prefixes:
+            raise KeyError(f"No chain {crypto!r} in the index (have {', '.join(self.cryptos)})")
+        left, right = self.rows(start, end)
+        prefix = self.prefixes[crypto]
+        return np.asarray(prefix[right], dtype=np.int64) - prefix[left]
+
+    def _compute(self, crypto, left, right):
+        prefix = self.prefixes[crypto]
+        counts = np.asarray(prefix[right], dtype=np.int64) - prefix[left]
+        observations = int(counts.sum())
+        result = {'crypto': crypto, 'observations': observations,
+                  'counts': dict(zip(self.labels, counts.tolist()))}
+        if observations:
+            emergence, self_organization, complexity = measures_from_counts(counts)
+            result.update({'Emergence': float(emergence), 'Self-organization': float(self_organization),
+                           'Complexity': float(complexity)})
+        else:
+            result.update(dict.fromkeys(['Emergence', 'Self-organization', 'Complexity']))
+        return result
+
+    # Emergence, self-organization and complexity of one chain over [start, end), with the
+    # state counts behind them; the measures are None when the range holds no observations
+    def query(self, crypto, start=None, end=None):
+        if crypto not in self.prefixes:
+            raise KeyError(f"No chain {crypto!r} in the index (have {', '.join(self.cryptos)})")
+        left, right = self.rows(start, end)
+        result = dict(self._range_measures(crypto, left, right))
+        # First and last dates actually covered
+        result['start'] = str(pd.Timestamp(int(self.dates[left]))) if right > left else None
+        result['end'] = str(pd.Timestamp(int(self.dates[right - 1]))) if right > left else None
+        return result
+
+    def cache_info(self):
+        return self._range_measures.cache_info()
+
+# Minimal JSON API over one index:
+#   GET /query?crypto=Bitcoin&start=2020-01-01&end=2021-01-01   (start/end optional)
+#   GET /chains
+def make_handler(index):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path == '/chains':
+                self._send(200, {'cryptos': index.cryptos, 'labels': index.labels,
+                                 'first_date': index.meta['first_date'], 'last_date': index.meta['last_date']})
+            elif url.path == '/query':
+                try:
+                    self._send(200, index.query(params['crypto'], params.get('start'), params.get('end')))
+                except KeyError as error:
+                    self._send(404 if 'crypto' in params else 400, {'error': error.args[0]})
+                except ValueError as error:
+                    self._send(400, {'error': str(error)})
+            else:
+                self._send(404, {'error': f"Unknown path {url.path}"})
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+def serve(index, host='127.0.0.1', port=8765):
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    print(f"Serving {index.meta['rows']} rows of {', '.join(index.cryptos)} on http://{host}:{port}/query")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefix-count index for the complexity of arbitrary date ranges')
+    parser.add_argument('command', choices=['build', 'query', 'serve'])
+    parser.add_argument('crypto', nargs='?', help='query: chain name')
+    parser.add_argument('--start', help='query: first date of the range (inclusive)')
+    parser.add_argument('--end', help='query: end of the range (exclusive)')
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--master-csv', default=DEFAULT_MASTER_CSV)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from pipeline import Pipeline
+        index = build_interval_index(Pipeline(args.master_csv, args.cryptos)['states'], args.cryptos, args.index_dir)
+        print(f"Indexed {index.meta['rows']} rows of {', '.join(index.cryptos)} in {args.index_dir}")
+    elif args.command == 'query':
+        if not args.crypto:
+            parser.error('query needs a chain name')
+        print(json.dumps(IntervalIndex(args.index_dir).query(args.crypto, args.start, args.end), indent=2))
+    else:
+        serve(IntervalIndex(args.index_dir, args.cache_size), args.host, args.port)
+
+if __name__ == "__main__":
+    main()
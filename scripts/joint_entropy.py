@@ -0,0 +1,218 @@
+import argparse
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+from complexity_engine import calendar_buckets, rolling_window_starts, state_codes
+from transitions import entropy_bits
+
+STATE_COLUMN = "{crypto} Transactions per kW State"
+
+# Measures of the joint system returned by the calculate_* functions, in order; the
+# pairwise mutual information follows as "{a} / {b} Mutual Information" columns
+JOINT_MEASURES = ['Joint Entropy', 'Joint Emergence', 'Joint Self-organization', 'Joint Complexity',
+                  'Total Correlation']
+
+# Chain pairs whose rolling pair counts (pairs x days x states^2) are held at once
+CHUNK_PAIRS = 64
+
+# Rolling windows sharing one relabelled prefix count array of joint states; bounds the
+# array to (WINDOW_BLOCK + window rows) x (joint states seen in those rows)
+WINDOW_BLOCK = 1024
+
+# State codes of every chain as rows (chains x days, -1 where missing) and the number of
+# states (the largest state count across the chains)
+def chain_state_codes(df, chains, column=STATE_COLUMN):
+    columns = [state_codes(df[column.format(crypto=chain)]) for chain in chains]
+    n_states = max(n for _, n in columns)
+    return np.vstack([codes for codes, _ in columns]).astype(np.int64), n_states
+
+# Joint state of every day over all rows of a code matrix: the mixed-radix combination
+# of the chain states, relabelled densely 0..n_joint-1 in lexicographic order. Days where
+# any chain is missing get -1. Chains are folded in one at a time and the partial codes
+# relabelled before the radix would overflow int64, so any number of chains works and
+# there are never more joint states than days.
+def joint_state_codes(codes, n_states):
+    valid = (codes >= 0).all(axis=0)
+    joint = np.zeros(int(valid.sum()), dtype=np.int64)
+    radix = 1
+    for row in codes[:, valid]:
+        if radix > np.iinfo(np.int64).max // n_states:
+            _, joint = np.unique(joint, return_inverse=True)
+            radix = int(joint.max()) + 1
+        joint = joint * n_states + row
+        radix *= n_states
+    labels, dense = np.unique(joint, return_inverse=True)
+    result = np.full(codes.shape[1], -1, dtype=np.int64)
+    result[valid] = dense
+    return result, len(labels)
+
+# Joint entropy normalised like the marginal measures (by log2 of the number of joint
+# states seen), 1 - E, 4ES, and the total correlation sum H(chain) - H(joint), from the
+# joint entropy, the number of joint states and the summed marginal entropies of the
+# same days. Windows without any joint observation are NaN.
+def _joint_measures(joint_entropy, n_observed, marginal_entropy, total):
+    emergence = np.where(n_observed > 1, joint_entropy / np.log2(np.maximum(n_observed, 2)), 0.0)
+    emergence = np.minimum(emergence, 1.0)
+    self_organization = 1 - emergence
+    complexity = 4 * emergence * self_organization
+    total_correlation = np.maximum(marginal_entropy - joint_entropy, 0.0)
+    measures = [joint_entropy, emergence, self_organization, complexity, total_correlation]
+    return dict(zip(JOINT_MEASURES, (np.where(total > 0, measure, np.nan) for measure in measures)))
+
+# Joint measures of every row of a joint count array (windows x joint states) with the
+# per-chain counts of the same days (chains x windows x states)
+def joint_measures_from_counts(joint_counts, marginal_counts):
+    joint_counts = np.asarray(joint_counts)
+    return _joint_measures(entropy_bits(joint_counts), (joint_counts > 0).sum(axis=-1),
+                           entropy_bits(marginal_counts).sum(axis=0), joint_counts.sum(axis=-1))
+
+# Code of every chain pair on every day (pairs x days): first * n_states + second, -1
+# unless both chains have a state
+def chain_pair_codes(codes, n_states, pairs):
+    first, second = codes[pairs[:, 0]], codes[pairs[:, 1]]
+    return np.where((first >= 0) & (second >= 0), first * n_states + second, -1)
+
+# c * log2(c) of every entry of a non-negative integer count array, by table lookup
+def _count_log_count(counts):
+    values = np.arange(int(counts.max()) + 1 if counts.size else 1, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = np.where(values > 0, values * np.log2(values), 0.0)
+    return table[counts]
+
+# Mutual information in bits of every row of a pair count array (..., n_states^2),
+# from the marginals of the same days; NaN where a row is empty. With integer counts
+# I = (sum c log2 c - sum r log2 r - sum k log2 k + T log2 T) / T over the pair counts c,
+# the first and second chain's state counts r and k and the total T, so every term is a
+# table lookup instead of a logarithm. The marginals and sums are products with 0/1
+# matrices, which run far faster than reductions over such short axes.
+def mutual_info_bits(pair_counts, n_states):
+    pair_states = np.arange(n_states * n_states)
+    first = (pair_states[:, None] // n_states == np.arange(n_states)).astype(float)
+    second = (pair_states[:, None] % n_states == np.arange(n_states)).astype(float)
+    ones = np.ones(n_states)
+    counts = pair_counts.astype(float)
+    first_counts = (counts @ first).astype(np.int64)
+    second_counts = (counts @ second).astype(np.int64)
+    total = first_counts @ ones
+    terms = (_count_log_count(pair_counts) @ np.ones(n_states * n_states) - _count_log_count(first_counts) @ ones
+             - _count_log_count(second_counts) @ ones + _count_log_count(total.astype(np.int64)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, np.maximum(terms / total, 0.0), np.nan)
+
+# Pairwise mutual information columns for every pair of chains; window_counts maps a
+# pair code matrix and its number of states to counts (pairs x windows x states)
+def _mutual_info_columns(codes, n_states, chains, window_counts):
+    pairs = np.array(list(combinations(range(len(chains)), 2)), dtype=np.int64).reshape(-1, 2)
+    columns = {}
+    for start in range(0, len(pairs), CHUNK_PAIRS):
+        chunk = pairs[start:start + CHUNK_PAIRS]
+        counts = window_counts(chain_pair_codes(codes, n_states, chunk), n_states * n_states)
+        for (a, b), values in zip(chunk, mutual_info_bits(counts, n_states)):
+            columns[f"{chains[a]} / {chains[b]} Mutual Information"] = values
+    return columns
+
+# Counts of every row of a code matrix within groups of days (rows x groups x states)
+# from one bincount, like matrix_bucket_counts for any grouping
+def _group_counts(codes, group_ids, n_groups, n_states):
+    rows = codes.shape[0]
+    flat = (np.arange(rows)[:, None] * n_groups + group_ids) * n_states + codes
+    counts = np.bincount(flat[codes >= 0], minlength=rows * n_groups * n_states)
+    return counts.reshape(rows, n_groups, n_states)
+
+def _marginal_codes(codes, joint):
+    return np.where(joint >= 0, codes, -1)
+
+# Joint measures and pairwise mutual information over the whole history of a set of chains
+def calculate_joint_measures(df, chains=CRYPTOS, column=STATE_COLUMN):
+    codes, n_states = chain_state_codes(df, chains, column)
+    joint, n_joint = joint_state_codes(codes, n_states)
+    days = np.zeros(codes.shape[1], dtype=np.int64)
+    joint_counts = _group_counts(joint[None, :], days, 1, n_joint)[0]
+    measures = joint_measures_from_counts(joint_counts, _group_counts(_marginal_codes(codes, joint), days, 1, n_states))
+    measures.update(_mutual_info_columns(codes, n_states, chains, lambda pair_codes, n: _group_counts(pair_codes, days, 1, n)))
+    return pd.Series({name: float(values[0]) for name, values in measures.items()})
+
+# Joint measures and pairwise mutual information of every calendar bucket, indexed by
+# bucket end date (see calendar_buckets); each bucket is one bincount slice
+def calculate_period_joint_measures(df, freq, chains=CRYPTOS, column=STATE_COLUMN):
+    codes, n_states = chain_state_codes(df, chains, column)
+    joint, n_joint = joint_state_codes(codes, n_states)
+    bucket_ids, bucket_ends = calendar_buckets(df.index, freq)
+    n_buckets = len(bucket_ends)
+    joint_counts = _group_counts(joint[None, :], bucket_ids, n_buckets, n_joint)[0]
+    marginal_counts = _group_counts(_marginal_codes(codes, joint), bucket_ids, n_buckets, n_states)
+    measures = joint_measures_from_counts(joint_counts, marginal_counts)
+    measures.update(_mutual_info_columns(codes, n_states, chains,
+                                         lambda pair_codes, n: _group_counts(pair_codes, bucket_ids, n_buckets, n)))
+    return pd.DataFrame(measures, index=pd.DatetimeIndex(bucket_ends, name='Date'))
+
+# Joint entropy and number of joint states seen in every window [left, right). Windows
+# are taken in blocks; within a block the joint codes are relabelled to the states that
+# occur in its rows, so the prefix counts stay small however many joint states exist.
+def _rolling_joint_entropy(joint, left, right, block=WINDOW_BLOCK):
+    entropy = np.zeros(len(right))
+    observed = np.zeros(len(right), dtype=np.int64)
+    for start in range(0, len(right), block):
+        window_left, window_right = left[start:start + block], right[start:start + block]
+        lo, hi = int(window_left.min()), int(window_right.max())
+        segment = joint[lo:hi]
+        rows = np.flatnonzero(segment >= 0)
+        labels, local = np.unique(segment[rows], return_inverse=True)
+        prefix = np.zeros((hi - lo + 1, len(labels)), dtype=np.int32)
+        prefix[rows + 1, local] = 1
+        np.cumsum(prefix, axis=0, out=prefix)
+        counts = prefix[window_right - lo] - prefix[window_left - lo]
+        entropy[start:start + block] = entropy_bits(counts)
+        observed[start:start + block] = (counts > 0).sum(axis=1)
+    return entropy, observed
+
+# Joint measures and pairwise mutual information over a trailing window of `days` days
+# ending at each row; rows whose window reaches before the first date are NaN, as in
+# calculate_rolling_measures
+def calculate_rolling_joint_measures(df, days, chains=CRYPTOS, column=STATE_COLUMN):
+    codes, n_states = chain_state_codes(df, chains, column)
+    joint, _ = joint_state_codes(codes, n_states)
+    left = rolling_window_starts(df.index, days)
+    right = np.arange(1, len(df) + 1)
+
+    # Prefix counts of every row of a code matrix, like matrix_prefix_counts but for
+    # pair codes beyond the int8 range
+    def window_counts(row_codes, n):
+        prefix = np.zeros((row_codes.shape[0], row_codes.shape[1] + 1, n), dtype=np.int32)
+        rows, days = np.nonzero(row_codes >= 0)
+        prefix[rows, days + 1, row_codes[rows, days]] = 1
+        np.cumsum(prefix, axis=1, out=prefix)
+        return prefix[:, right] - prefix[:, left]
+
+    joint_entropy, n_observed = _rolling_joint_entropy(joint, left, right)
+    marginal_counts = window_counts(_marginal_codes(codes, joint), n_states)
+    measures = _joint_measures(joint_entropy, n_observed, entropy_bits(marginal_counts).sum(axis=0),
+                               marginal_counts[0].sum(axis=-1))
+    measures.update(_mutual_info_columns(codes, n_states, chains, window_counts))
+    frame = pd.DataFrame(measures, index=df.index)
+    frame[df.index < df.index[0] + pd.Timedelta(days=days - 1)] = np.nan
+    return frame
+
+def main():
+    from pipeline import Pipeline
+    parser = argparse.ArgumentParser(description='Joint entropy, total correlation and pairwise mutual information across chains')
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--time-scales', nargs='+', default=['W', 'M'])
+    parser.add_argument('--window', type=int, default=365, help='rolling window in days')
+    parser.add_argument('--output', help='CSV with the rolling and period measures')
+    args = parser.parse_args()
+
+    states = Pipeline(cryptos=args.cryptos, percentiles=STATE_PERCENTILES, labels=STATE_LABELS)['states']
+    print(calculate_joint_measures(states, args.cryptos).to_string())
+    if args.output:
+        frames = [calculate_rolling_joint_measures(states, args.window, args.cryptos).add_suffix(f" {args.window}D")]
+        for time_scale in args.time_scales:
+            frames.append(calculate_period_joint_measures(states, time_scale, args.cryptos)
+                          .add_suffix(f" {time_scale}").reindex(states.index))
+        pd.concat(frames, axis=1).to_csv(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from correlation_table import COMPLEXITY_COLUMNS, CRYPTOS, complexity_column
+from significance import mutual_info_from_counts
+
+LAG_COLUMNS = ['Blockchain', 'Complexity Type', 'Lag', 'Observations', 'Pearson Correlation', 'Mutual Information']
+
+# Lags scanned either side of zero, in days
+MAX_LAG = 365
+
+# (lag, t) pairs evaluated together by the mutual information kernel
+CHUNK_ELEMENTS = 4_000_000
+
+# Full linear cross-correlation sum_t a[t] * b[t + lag] for every lag in -max_lag..max_lag,
+# from one zero-padded real FFT per input (the columns of a and b are correlated pairwise)
+def _cross_sums(a, b, max_lag):
+    n = a.shape[0]
+    size = 1 << int(np.ceil(np.log2(2 * n - 1)))
+    full = np.fft.irfft(np.conj(np.fft.rfft(a, size, axis=0)) * np.fft.rfft(b, size, axis=0), size, axis=0)
+    return np.concatenate([full[size - max_lag:], full[:max_lag + 1]]) if max_lag else full[:1]
+
+# Pearson correlation of x[t] with y[t + lag] for every lag in -max_lag..max_lag, over the
+# days where both are present. Missing values are masked, and the masked sums, squares and
+# cross products of every lag come out of one batch of FFTs.
+def lagged_pearson(x, y, max_lag):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    max_lag = min(max_lag, len(x) - 1)
+    x_mask = ~np.isnan(x)
+    y_mask = ~np.isnan(y)
+    # Centring first keeps the sums small relative to the cross products
+    x = np.where(x_mask, x - np.nanmean(x), 0.0)
+    y = np.where(y_mask, y - np.nanmean(y), 0.0)
+    ones_x = x_mask.astype(float)
+    ones_y = y_mask.astype(float)
+    left = np.column_stack([ones_x, x, ones_x, x * x, ones_x, x])
+    right = np.column_stack([ones_y, ones_y, y, ones_y, y * y, y])
+    n, sx, sy, sxx, syy, sxy = _cross_sums(left, right, max_lag).T
+    n = np.rint(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pearson = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    pearson[n < 3] = np.nan
+    return np.arange(-max_lag, max_lag + 1), n.astype(np.int64), pearson
+
+# Equal-width bin codes over the present values (as pd.cut(bins=n_bins)), -1 where missing
+def equal_width_bins(values, n_bins):
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    if present.any():
+        codes[present] = pd.cut(values[present], bins=n_bins, labels=False)
+    return codes
+
+# Binned mutual information (nats) of x[t] with y[t + lag] for every lag. All (lag, t) pairs
+# go through a single 2D bincount keyed by lag row and joint bin, in chunks of lags.
+def lagged_mutual_info(x_bins, y_bins, n_bins, max_lag):
+    n = len(x_bins)
+    max_lag = min(max_lag, n - 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+    t = np.arange(n)
+    chunk = max(1, CHUNK_ELEMENTS // max(n, 1))
+    cells = n_bins * n_bins
+    joint = np.empty((len(lags), n_bins, n_bins), dtype=np.int64)
+    for start in range(0, len(lags), chunk):
+        block = lags[start:start + chunk]
+        shifted = t + block[:, None]
+        inside = (shifted >= 0) & (shifted < n)
+        x_codes = np.broadcast_to(x_bins, shifted.shape)
+        y_codes = y_bins[np.clip(shifted, 0, n - 1)]
+        valid = inside & (x_codes >= 0) & (y_codes >= 0)
+        flat = np.arange(len(block))[:, None] * cells + x_codes * n_bins + y_codes
+        joint[start:start + len(block)] = np.bincount(flat[valid], minlength=len(block) * cells).reshape(-1, n_bins, n_bins)
+    return lags, mutual_info_from_counts(joint)
+
+# Lag profile of one complexity column against one market cap column. A positive lag pairs
+# complexity on day t with market cap on day t + lag, i.e. complexity leading.
+def lag_profile(data, complexity_col, marketcap_col, max_lag=MAX_LAG, n_bins=10):
+    complexity = data[complexity_col].to_numpy(dtype=float)
+    market_cap = data[marketcap_col].to_numpy(dtype=float)
+    lags, observations, pearson = lagged_pearson(complexity, market_cap, max_lag)
+    _, mutual_info = lagged_mutual_info(equal_width_bins(complexity, n_bins), equal_width_bins(market_cap, n_bins),
+                                        n_bins, max_lag)
+    return pd.DataFrame({'Lag': lags, 'Observations': observations,
+                         'Pearson Correlation': pearson, 'Mutual Information': mutual_info})
+
+# Lag profiles of every crypto and complexity type, stacked into one tidy table
+def analyze_lags(data, cryptos, complexity_types=tuple(COMPLEXITY_COLUMNS), max_lag=MAX_LAG, n_bins=10):
+    profiles = []
+    for crypto in cryptos:
+        marketcap_col = f"{crypto.lower()}_market_cap"
+        for complexity_type in complexity_types:
+            profile = lag_profile(data, complexity_column(crypto, complexity_type), marketcap_col, max_lag, n_bins)
+            profile.insert(0, 'Complexity Type', complexity_type)
+            profile.insert(0, 'Blockchain', crypto)
+            profiles.append(profile)
+    return pd.concat(profiles, ignore_index=True)[LAG_COLUMNS]
+
+# Lag of the strongest absolute correlation and of the highest mutual information per profile
+def peak_lags(lag_profiles):
+    rows = []
+    for (crypto, complexity_type), profile in lag_profiles.groupby(['Blockchain', 'Complexity Type'], sort=False):
+        pearson = profile['Pearson Correlation'].abs()
+        best_corr = profile.loc[pearson.idxmax()] if pearson.notna().any() else None
+        best_mi = profile.loc[profile['Mutual Information'].idxmax()]
+        rows.append({'Blockchain': crypto, 'Complexity Type': complexity_type,
+                     'Peak Correlation Lag': best_corr['Lag'] if best_corr is not None else np.nan,
+                     'Peak Pearson Correlation': best_corr['Pearson Correlation'] if best_corr is not None else np.nan,
+                     'Peak Mutual Information Lag': best_mi['Lag'],
+                     'Peak Mutual Information': best_mi['Mutual Information']})
+    return pd.DataFrame(rows)
+
+def main():
+    from pipeline import Pipeline
+
+    parser = argparse.ArgumentParser(description='Scan lagged correlation and mutual information of complexity vs market cap')
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--complexity-types', nargs='+', default=list(COMPLEXITY_COLUMNS), choices=list(COMPLEXITY_COLUMNS))
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG)
+    parser.add_argument('--n-bins', type=int, default=10)
+    parser.add_argument('--output', default='lag_profiles.csv')
+    args = parser.parse_args()
+
+    data = Pipeline(cryptos=args.cryptos)['complexity']
+    profiles = analyze_lags(data, args.cryptos, args.complexity_types, args.max_lag, args.n_bins)
+    profiles.to_csv(args.output, index=False)
+    print(peak_lags(profiles))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from complexity_engine import calendar_buckets, make_state_column, measures_from_counts, rolling_window_starts
+
+VALUE_COLUMN = "{crypto} Transactions per kW"
+
+# Chain-by-day panel: float32 values (chains x days, NaN where missing), the mask of
+# present values, the chain names and the shared date index. Chains that start later
+# simply have a masked prefix.
+ChainMatrix = namedtuple('ChainMatrix', ['values', 'mask', 'chains', 'dates'])
+
+def chain_matrix(df, chains, column=VALUE_COLUMN):
+    values = np.ascontiguousarray(df[[column.format(crypto=chain) for chain in chains]].to_numpy(dtype=np.float32).T)
+    return ChainMatrix(values, ~np.isnan(values), list(chains), df.index)
+
+# Chains x days array back to a date-indexed frame with one column per chain
+def matrix_frame(array, chains, index, column="{crypto}"):
+    return pd.DataFrame(array.T, index=index, columns=[column.format(crypto=chain) for chain in chains])
+
+# Percentiles of the present values of every chain (np.percentile's linear method):
+# one sort along the day axis, then interpolation between order statistics
+def matrix_percentiles(values, mask, percentiles):
+    ordered = np.sort(np.where(mask, values, np.inf).astype(np.float64), axis=1)
+    n = mask.sum(axis=1)[:, None]
+    positions = (n - 1) * np.asarray(percentiles, dtype=float) / 100
+    lower = np.clip(np.floor(positions).astype(np.int64), 0, None)
+    upper = np.clip(lower + 1, None, np.maximum(n - 1, 0))
+    weight = positions - lower
+    low = np.take_along_axis(ordered, lower, axis=1)
+    high = np.take_along_axis(ordered, upper, axis=1)
+    with np.errstate(invalid='ignore'):
+        thresholds = np.where(weight >= 0.5, high - (high - low) * (1 - weight), low + (high - low) * weight)
+    thresholds[n[:, 0] == 0] = np.nan
+    return thresholds
+
+# int8 state codes of every chain against its own thresholds (-1 where masked); same
+# rule as define_state_codes: the number of thresholds at or below the value
+def matrix_state_codes(values, mask, thresholds):
+    with np.errstate(invalid='ignore'):
+        codes = (values[:, :, None] >= thresholds[:, None, :]).sum(axis=2, dtype=np.int8)
+    codes[~mask] = -1
+    return codes
+
+# Prefix counts along the day axis (chains x days + 1 x states): counts of days [a, b)
+# of every chain are prefix[:, b] - prefix[:, a]
+def matrix_prefix_counts(codes, n_states):
+    chains, days = codes.shape
+    prefix = np.zeros((chains, days + 1, n_states), dtype=np.int32)
+    np.cumsum(codes[:, :, None] == np.arange(n_states, dtype=np.int8), axis=1, out=prefix[:, 1:])
+    return prefix
+
+# Days from each chain's first present value onwards
+def _started(mask):
+    return np.logical_or.accumulate(mask, axis=1)
+
+# Emergence, self-organization and complexity of every prefix of every chain
+# (chains x days); NaN before a chain's first observation
+def matrix_cumulative_measures(codes, mask, n_states):
+    prefix = matrix_prefix_counts(codes, n_states)
+    started = _started(mask)
+    return tuple(np.where(started, measure, np.nan) for measure in measures_from_counts(prefix[:, 1:]))
+
+# Measures over a trailing window of `days` days for every chain, from one prefix count
+# array; NaN where the window is empty or reaches before the chain's first observation
+def matrix_rolling_measures(codes, mask, dates, n_states, days):
+    prefix = matrix_prefix_counts(codes, n_states)
+    left = rolling_window_starts(dates, days)
+    counts = prefix[:, 1:] - prefix[:, left]
+    first = np.where(mask.any(axis=1), mask.argmax(axis=1), len(dates))
+    first_dates = np.append(dates.values, np.datetime64('NaT'))[first]
+    with np.errstate(invalid='ignore'):
+        incomplete = dates.values[None, :] < first_dates[:, None] + np.timedelta64(days - 1, 'D')
+    invalid = incomplete | np.isnat(first_dates)[:, None] | (counts.sum(axis=2) == 0)
+    return tuple(np.where(invalid, np.nan, measure) for measure in measures_from_counts(counts))
+
+# Per-bucket state counts of every chain (chains x buckets x states) from one bincount
+def matrix_bucket_counts(codes, dates, n_states, freq):
+    bucket_ids, bucket_ends = calendar_buckets(dates, freq)
+    chains = codes.shape[0]
+    n_buckets = len(bucket_ends)
+    valid = codes >= 0
+    flat = (np.arange(chains)[:, None] * n_buckets + bucket_ids) * n_states + codes
+    counts = np.bincount(flat[valid], minlength=chains * n_buckets * n_states)
+    return counts.reshape(chains, n_buckets, n_states), bucket_ends
+
+# Measures of every calendar bucket of every chain (chains x buckets) and the bucket end
+# dates; buckets without observations are NaN
+def matrix_period_measures(codes, dates, n_states, freq):
+    counts, bucket_ends = matrix_bucket_counts(codes, dates, n_states, freq)
+    empty = counts.sum(axis=2) == 0
+    measures = tuple(np.where(empty, np.nan, measure) for measure in measures_from_counts(counts))
+    return measures, pd.DatetimeIndex(bucket_ends, name='Date')
+
+# Wide counterpart of apply_state_definitions and calculate_and_store_complexity_measures:
+# states, per-period complexity (on the period end dates) and cumulative complexity for
+# every chain, computed as 2D arrays and added to df under the usual column names
+def calculate_wide_complexity(df, chains, percentiles, labels, time_scales):
+    matrix = chain_matrix(df, chains)
+    thresholds = matrix_percentiles(matrix.values, matrix.mask, percentiles)
+    codes = matrix_state_codes(matrix.values, matrix.mask, thresholds)
+    n_states = len(labels)
+
+    periods = {}
+    for time_scale in time_scales:
+        (_, _, complexity), bucket_ends = matrix_period_measures(codes, matrix.dates, n_states, time_scale)
+        periods[time_scale] = matrix_frame(complexity, chains, bucket_ends).reindex(df.index)
+    _, _, cumulative = matrix_cumulative_measures(codes, matrix.mask, n_states)
+
+    columns = {f"{chain} Transactions per kW State": make_state_column(codes[i], labels, df.index)
+               for i, chain in enumerate(chains)}
+    for i, chain in enumerate(chains):
+        for time_scale in time_scales:
+            columns[f"{chain} {time_scale} Complexity"] = periods[time_scale][chain]
+        columns[f"{chain} Cumulative Complexity"] = cumulative[i]
+
+    return pd.concat([df.drop(columns=[name for name in columns if name in df]), pd.DataFrame(columns, index=df.index)],
+                     axis=1)
@@ -0,0 +1,259 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES
+from complexity_engine import (bucket_measures, count_pyramid_from_days, define_state_codes, measures_from_counts,
+                               modal_state_measures)
+from streaming_states import QuantileSketch
+
+# Rows read per chunk; peak memory is set by this, not by the size of the input
+CHUNK_ROWS = 1_000_000
+
+SCALES = ['D', 'W', 'M']
+
+# First-pass sketch accuracy per threshold method; 'exact' uses a finer sketch so that the
+# brackets collected by the refinement pass stay small
+SKETCH_ACCURACY = {'sketch': 0.01, 'exact': 0.001}
+SKETCH_BUCKETS = 100_000
+
+# Most values the exact refinement keeps for one bracket; a bracket holding more is
+# narrowed with a histogram of REFINE_BINS equal-width bins over another pass instead
+MAX_BRACKET_VALUES = 1_000_000
+REFINE_BINS = 4096
+
+# Chunks of (day number, values) from a large CSV of timestamped rows (hourly, per block, ...):
+# day numbers are days since 1970-01-01, values a float32 (rows x cryptos) array
+def read_chunks(csv_path, cryptos, chunk_rows=CHUNK_ROWS, date_column='Date', date_format=None):
+    value_columns = [f"{crypto} Transactions per kW" for crypto in cryptos]
+    reader = pd.read_csv(csv_path, usecols=[date_column] + value_columns,
+                         dtype=dict.fromkeys(value_columns, np.float32), chunksize=chunk_rows)
+    for chunk in reader:
+        timestamps = pd.to_datetime(chunk[date_column], format=date_format).to_numpy()
+        yield timestamps.astype('datetime64[D]').astype(np.int64), chunk[value_columns].to_numpy()
+
+# First pass: one bounded-size quantile sketch per crypto
+def sketch_pass(chunks, n_cryptos, relative_accuracy):
+    sketches = [QuantileSketch(relative_accuracy, SKETCH_BUCKETS) for _ in range(n_cryptos)]
+    for _, values in chunks:
+        for i, sketch in enumerate(sketches):
+            sketch.update_batch(values[:, i])
+    return sketches
+
+# Approximate percentiles read straight from the sketches
+def sketch_thresholds(sketches, percentiles):
+    return [sketch.quantiles(np.asarray(percentiles, dtype=float) / 100) for sketch in sketches]
+
+# One pass of the exact refinement over the open brackets of every crypto. For each
+# bracket (lower, upper]: the count of values at or below lower, the count, minimum and
+# maximum of the values inside, the values themselves while there are at most max_values
+# of them, and for finite brackets a histogram over REFINE_BINS equal-width bins.
+def _refine_pass(chunks, plans, max_values):
+    for plan in plans:
+        for bracket in plan['open']:
+            bracket.update(below=0, inside=0, low=np.inf, high=-np.inf, kept=[])
+            if np.isfinite(bracket['lower']):
+                bracket['edges'] = np.linspace(bracket['lower'], bracket['upper'], REFINE_BINS + 1)
+                bracket['histogram'] = np.zeros(REFINE_BINS, dtype=np.int64)
+    for _, values in chunks:
+        for i, plan in enumerate(plans):
+            column = values[:, i].astype(np.float64)
+            column = column[~np.isnan(column)]
+            for bracket in plan['open']:
+                bracket['below'] += np.count_nonzero(column <= bracket['lower'])
+                inside = column[(column > bracket['lower']) & (column <= bracket['upper'])]
+                if not len(inside):
+                    continue
+                bracket['inside'] += len(inside)
+                bracket['low'] = min(bracket['low'], inside.min())
+                bracket['high'] = max(bracket['high'], inside.max())
+                if bracket['kept'] is not None:
+                    bracket['kept'] = bracket['kept'] + [inside] if bracket['inside'] <= max_values else None
+                if 'edges' in bracket:
+                    bins = np.clip(np.searchsorted(bracket['edges'], inside, side='left') - 1, 0, REFINE_BINS - 1)
+                    bracket['histogram'] += np.bincount(bins, minlength=REFINE_BINS)
+
+# Settle the ranks of every bracket after a pass: read them from the kept values, or from
+# the single value of a bracket whose values are all equal; otherwise narrow the bracket
+# to the histogram bins holding its ranks (or, without a histogram, to the finite range
+# of its values) for the next pass
+def _settle_brackets(plan):
+    still_open = []
+    for bracket in plan['open']:
+        ranks, below = bracket['ranks'], bracket['below']
+        if any(not below <= rank < below + bracket['inside'] for rank in ranks):
+            raise RuntimeError(f"ranks {ranks} fell outside their bracket")
+        if bracket['kept'] is not None:
+            values = np.sort(np.concatenate(bracket['kept']))
+            plan['order_statistics'].update({rank: values[rank - below] for rank in ranks})
+        elif bracket['low'] == bracket['high']:
+            plan['order_statistics'].update(dict.fromkeys(ranks, bracket['low']))
+        elif 'edges' in bracket:
+            ends = below + np.cumsum(bracket['histogram'])
+            by_bin = {}
+            for rank in ranks:
+                by_bin.setdefault(int(np.searchsorted(ends, rank, side='right')), []).append(rank)
+            edges = bracket['edges']
+            still_open += [{'lower': edges[k], 'upper': edges[k + 1], 'ranks': bin_ranks} for k, bin_ranks in by_bin.items()]
+        else:
+            still_open.append({'lower': np.nextafter(bracket['low'], -np.inf), 'upper': bracket['high'], 'ranks': ranks})
+    plan['open'] = still_open
+
+# Exact percentiles (np.percentile's linear method) in bounded memory. The sketches bracket
+# the order statistics each percentile interpolates between; a refinement pass counts the
+# values below each bracket exactly and keeps the values inside it. A bracket holding more
+# than max_values values is narrowed by histogram over further passes until it holds few
+# enough (or only equal values), so at most max_values values are kept per bracket, and
+# there are at most two brackets per percentile and crypto, whatever the input size.
+# chunks is a function returning a fresh chunk iterator for every pass.
+def exact_thresholds(chunks, sketches, percentiles, max_values=MAX_BRACKET_VALUES):
+    plans = []
+    for sketch in sketches:
+        positions = (sketch.count - 1) * np.asarray(percentiles, dtype=float) / 100
+        ranks = np.floor(positions).astype(np.int64)
+        ranks = np.unique(np.r_[ranks, np.minimum(ranks + 1, sketch.count - 1)])
+        lower, upper = sketch.rank_brackets(ranks)
+        brackets = {}
+        for rank, bracket in zip(ranks.tolist(), zip(lower, upper)):
+            brackets.setdefault(bracket, []).append(rank)
+        plans.append({'positions': positions, 'order_statistics': {},
+                      'open': [{'lower': lower, 'upper': upper, 'ranks': bracket_ranks}
+                               for (lower, upper), bracket_ranks in sorted(brackets.items())]})
+
+    while any(plan['open'] for plan in plans):
+        _refine_pass(chunks(), plans, max_values)
+        for plan in plans:
+            _settle_brackets(plan)
+
+    thresholds = []
+    for sketch, plan in zip(sketches, plans):
+        order_statistics = plan['order_statistics']
+        lower_ranks = np.floor(plan['positions']).astype(np.int64)
+        low = np.array([order_statistics[rank] for rank in lower_ranks])
+        high = np.array([order_statistics[min(rank + 1, sketch.count - 1)] for rank in lower_ranks])
+        weight = plan['positions'] - lower_ranks
+        thresholds.append(np.where(weight >= 0.5, high - (high - low) * (1 - weight), low + (high - low) * weight))
+    return thresholds
+
+# Day x state count and first-seen matrices, grown as new days arrive. Memory scales with
+# the number of days covered, not with the number of rows.
+class DayStateCounts:
+    def __init__(self, n_states):
+        self.n_states = n_states
+        self.first_day = 0
+        self.counts = np.zeros((0, n_states), dtype=np.int64)
+        self.first_seen = np.zeros((0, n_states), dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    def _cover(self, low, high):
+        if not len(self.rows):
+            self.first_day = low
+        low, high = min(low, self.first_day), max(high, self.first_day + len(self.rows) - 1)
+        before, after = self.first_day - low, high - (self.first_day + len(self.rows) - 1)
+        if before or after:
+            self.counts = np.pad(self.counts, ((before, after), (0, 0)))
+            self.first_seen = np.pad(self.first_seen, ((before, after), (0, 0)), constant_values=np.iinfo(np.int64).max)
+            self.rows = np.pad(self.rows, (before, after))
+            self.first_day = low
+
+    # Count one chunk's state codes; row_offset is the position of the chunk's first row
+    def add(self, days, codes, row_offset):
+        if not len(days):
+            return
+        self._cover(int(days.min()), int(days.max()))
+        relative = days - self.first_day
+        self.rows += np.bincount(relative, minlength=len(self.rows))
+        valid = np.flatnonzero(codes >= 0)
+        flat = relative[valid] * self.n_states + codes[valid]
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        unique_flat, first_index = np.unique(flat, return_index=True)
+        seen = self.first_seen.reshape(-1)
+        seen[unique_flat] = np.minimum(seen[unique_flat], row_offset + valid[first_index])
+
+    # Count matrix, first-seen matrix and end dates of the days that had rows
+    def day_level(self):
+        present = np.flatnonzero(self.rows)
+        ends = pd.DatetimeIndex((present + self.first_day).astype('datetime64[D]'))
+        return self.counts[present], self.first_seen[present], ends
+
+# Final pass: state codes chunk by chunk, accumulated into per-day counts. With states_path,
+# the int8 codes of every row are also appended there (rows x cryptos, C order; read back
+# with np.fromfile(states_path, np.int8).reshape(-1, len(cryptos))).
+def state_count_pass(chunks, thresholds, n_states, states_path=None):
+    accumulators = [DayStateCounts(n_states) for _ in thresholds]
+    row_offset = 0
+    states_file = open(states_path, 'wb') if states_path else None
+    try:
+        for days, values in chunks:
+            codes = np.column_stack([define_state_codes(values[:, i], crypto_thresholds)
+                                     for i, crypto_thresholds in enumerate(thresholds)])
+            for i, accumulator in enumerate(accumulators):
+                accumulator.add(days, codes[:, i], row_offset)
+            if states_file:
+                states_file.write(np.ascontiguousarray(codes).tobytes())
+            row_offset += len(days)
+    finally:
+        if states_file:
+            states_file.close()
+    return accumulators
+
+# States, day/week/month count pyramid and end-of-day cumulative complexity of a CSV too
+# large for memory. thresholds is 'sketch' (approximate, from a single first pass), 'exact'
+# (one extra refinement pass) or a list of per-crypto threshold arrays (no first pass).
+def process_csv(csv_path, cryptos=CRYPTOS, percentiles=STATE_PERCENTILES, labels=STATE_LABELS, scales=SCALES,
+                thresholds='sketch', chunk_rows=CHUNK_ROWS, date_column='Date', date_format=None, states_path=None):
+    def chunks():
+        return read_chunks(csv_path, cryptos, chunk_rows, date_column, date_format)
+
+    if isinstance(thresholds, str):
+        sketches = sketch_pass(chunks(), len(cryptos), SKETCH_ACCURACY[thresholds])
+        if thresholds == 'exact':
+            thresholds = exact_thresholds(chunks, sketches, percentiles)
+        else:
+            thresholds = sketch_thresholds(sketches, percentiles)
+
+    accumulators = state_count_pass(chunks(), thresholds, len(labels), states_path)
+    results = {}
+    for crypto, crypto_thresholds, accumulator in zip(cryptos, thresholds, accumulators):
+        day_counts, day_first_seen, day_ends = accumulator.day_level()
+        _, _, cumulative = measures_from_counts(np.cumsum(day_counts, axis=0))
+        results[crypto] = {'thresholds': np.asarray(crypto_thresholds),
+                           'pyramid': count_pyramid_from_days(day_counts, day_first_seen, day_ends, scales),
+                           'cumulative': pd.Series(cumulative, index=pd.DatetimeIndex(day_ends, name='Date'))}
+    return results
+
+# Complexity of the modal-state distribution and mean bucket complexity per crypto and scale
+def summarize(results):
+    rows = []
+    for crypto, result in results.items():
+        for scale, level in result['pyramid'].items():
+            emergence, self_org, complexity = modal_state_measures(level)
+            rows.append({'Crypto': crypto, 'Time Scale': scale, 'Emergence': emergence,
+                         'Self-organization': self_org, 'Complexity': complexity,
+                         'Mean Bucket Complexity': bucket_measures(level)['Complexity'].mean()})
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunked complexity measures for intraday data too large for memory')
+    parser.add_argument('csv_path')
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--scales', nargs='+', default=SCALES)
+    parser.add_argument('--thresholds', default='sketch', choices=list(SKETCH_ACCURACY))
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--date-column', default='Date')
+    parser.add_argument('--date-format', default=None)
+    parser.add_argument('--states-output', help='raw int8 state codes of every row (rows x cryptos)')
+    parser.add_argument('--output', help='CSV of the per-scale summary')
+    args = parser.parse_args()
+
+    results = process_csv(args.csv_path, args.cryptos, scales=args.scales, thresholds=args.thresholds,
+                          chunk_rows=args.chunk_rows, date_column=args.date_column, date_format=args.date_format,
+                          states_path=args.states_output)
+    summary = summarize(results)
+    print(summary)
+    if args.output:
+        summary.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
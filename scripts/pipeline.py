@@ -0,0 +1,159 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+from binning import METHODS as BINNING_METHODS
+from state_calculations import STATE_LABELS, STATE_PERCENTILES, apply_adaptive_state_definitions, apply_state_definitions
+from complexity import CRYPTOS, TIME_SCALES, calculate_complexity_measures
+from complexity_store import TIME_SCALES as STORE_TIME_SCALES, calculate_and_store_complexity_measures
+from result_cache import DEFAULT_CACHE_DIR, ResultCache, cache_key
+import instrumentation
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from conversion import build_component_frame, raw_files
+
+# Stage graph: each stage lists the stages whose results it takes as inputs
+STAGES = {
+    'master': (),
+    'states': ('master',),
+    'scale_complexities': ('states',),
+    'complexity': ('states',),
+    'correlations': ('complexity',),
+}
+
+# Parameters that determine each cacheable stage's result (stages not listed are never cached)
+CACHED_STAGE_PARAMS = {
+    'master': (),
+    'states': ('cryptos', 'percentiles', 'labels', 'binning'),
+    'complexity': ('cryptos', 'percentiles', 'labels', 'binning', 'store_time_scales', 'transitions',
+                   'homeostasis'),
+}
+
+# Lazily evaluated stage graph: a stage runs on first access, after its inputs, and is
+# memoized for the lifetime of the pipeline. Stages never modify their inputs in place.
+class Pipeline:
+    def __init__(self, master_csv=DEFAULT_MASTER_CSV, cryptos=CRYPTOS, percentiles=STATE_PERCENTILES,
+                 labels=STATE_LABELS, time_scales=TIME_SCALES, store_time_scales=STORE_TIME_SCALES,
+                 complexity_type='monthly', n_resamples=0, processes=None, cache=None, transitions=False,
+                 binning=None, homeostasis=False, data_dir=None):
+        self.master_csv = master_csv
+        self.cryptos = list(cryptos)
+        self.percentiles = list(percentiles)
+        self.labels = list(labels)
+        self.time_scales = list(time_scales)
+        self.store_time_scales = list(store_time_scales)
+        self.complexity_type = complexity_type
+        self.n_resamples = n_resamples
+        self.processes = processes
+        self.cache = cache
+        self.transitions = transitions
+        self.binning = binning
+        self.homeostasis = homeostasis
+        # Raw exports behind the master (for autopoiesis); by default the master's directory
+        self.data_dir = data_dir or os.path.dirname(os.path.abspath(master_csv))
+        self._results = {}
+
+    def __getitem__(self, stage):
+        if stage not in self._results:
+            key = self._cache_key(stage)
+            result = self.cache.get(key) if key else None
+            if result is None:
+                inputs = [self[dependency] for dependency in STAGES[stage]]
+                result = instrumentation.run_stage(stage, getattr(self, f"_{stage}"), *inputs)
+                if key:
+                    self.cache.put(key, result)
+            self._results[stage] = result
+        return self._results[stage]
+
+    def _cache_key(self, stage):
+        if self.cache is None or stage not in CACHED_STAGE_PARAMS:
+            return None
+        params = {name: getattr(self, name) for name in CACHED_STAGE_PARAMS[stage]}
+        inputs = [self.master_csv]
+        # Autopoiesis reads the raw transactions and energy next to the master
+        if stage == 'complexity' and self.homeostasis:
+            inputs += [os.path.join(self.data_dir, name) for name in raw_files(self.data_dir)]
+        return cache_key(stage, inputs, **params)
+
+    def _master(self):
+        return load_and_prepare_data(self.master_csv)
+
+    # binning names an adaptive method (binning.METHODS) used instead of the percentiles
+    def _states(self, master):
+        if self.binning:
+            return apply_adaptive_state_definitions(master.copy(), self.cryptos, self.binning, self.labels)
+        return apply_state_definitions(master.copy(), self.cryptos, self.percentiles, self.labels)
+
+    def _scale_complexities(self, states):
+        return {crypto: calculate_complexity_measures(states, crypto, self.time_scales) for crypto in self.cryptos}
+
+    # homeostasis=True adds homeostasis and, from the raw sources, autopoiesis columns
+    def _complexity(self, states):
+        components = build_component_frame(self.data_dir) if self.homeostasis else None
+        return calculate_and_store_complexity_measures(states.copy(), self.cryptos, self.store_time_scales,
+                                                       self.transitions, self.homeostasis, components,
+                                                       self.percentiles, self.labels, self.binning)
+
+    def _correlations(self, complexity):
+        from correlation_table import analyze_correlations
+        return analyze_correlations(complexity, self.cryptos, self.complexity_type, self.n_resamples, self.processes)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the cryptoeconomic complexity pipeline up to the requested output')
+    parser.add_argument('command', choices=['states', 'complexity', 'correlations', 'plots'])
+    parser.add_argument('--master-csv', default=DEFAULT_MASTER_CSV)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--complexity-type', default='monthly', choices=['weekly', 'monthly', 'cumulative'])
+    parser.add_argument('--output', help='CSV for states/complexity, PNG for correlations')
+    parser.add_argument('--output-dir', help='plots: write every figure here (headless, in parallel) instead of showing them')
+    parser.add_argument('--transitions', action='store_true',
+                        help='complexity: add Markov transition complexity and entropy rate columns')
+    parser.add_argument('--homeostasis', action='store_true',
+                        help='complexity: add homeostasis and autopoiesis (energy vs transactions) columns')
+    parser.add_argument('--data-dir', help='raw exports for --homeostasis (default: the master CSV directory)')
+    parser.add_argument('--binning', choices=BINNING_METHODS,
+                        help='data-driven state thresholds per chain instead of the fixed percentiles')
+    parser.add_argument('--n-resamples', type=int, default=0, help='bootstrap/permutation resamples for correlations')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--cache', action='store_true', help='reuse stage results from the on-disk cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--instrument', metavar='REPORT', help='write per-stage time, CPU, memory and rows to this JSON file')
+    parser.add_argument('--profile-stage', action='append', default=[],
+                        help='capture this stage (e.g. states, resample, load_csv) with the profiler')
+    parser.add_argument('--profiler', default='cprofile', choices=list(instrumentation.PROFILERS))
+    args = parser.parse_args()
+
+    if args.instrument:
+        instrumentation.enable(args.instrument, args.profile_stage, args.profiler)
+    else:
+        instrumentation.enable_from_env()
+
+    pipeline = Pipeline(master_csv=args.master_csv, cryptos=args.cryptos, complexity_type=args.complexity_type,
+                        n_resamples=args.n_resamples, processes=args.processes,
+                        cache=ResultCache(args.cache_dir) if args.cache else None, transitions=args.transitions,
+                        binning=args.binning, homeostasis=args.homeostasis, data_dir=args.data_dir)
+
+    if args.command in ('states', 'complexity'):
+        result = pipeline[args.command]
+        if args.command == 'complexity':
+            print(pd.DataFrame(pipeline['scale_complexities']))
+        print(result.head())
+        if args.output:
+            result.to_csv(args.output)
+    elif args.command == 'correlations':
+        from correlation_table import export_correlation_table
+        export_correlation_table(pipeline['correlations'], args.output or 'correlation_table.png')
+    else:
+        from plots import plot_all, render_all
+        if args.output_dir:
+            render_all(pipeline['states'], pipeline['scale_complexities'], args.output_dir, pipeline.cryptos,
+                       args.processes)
+        else:
+            plot_all(pipeline['states'], pipeline['scale_complexities'], pipeline.cryptos)
+    instrumentation.disable()
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,179 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from data_preperation import data
-from state_calculations import data_with_states
-from complexity import calculate_emergence, calculate_self_organization, calculate_complexity, CRYPTOS, complexity_results
+from complexity_engine import anchored_window_bounds, calculate_cumulative_measures, calculate_window_complexity
+from complexity import CRYPTOS
 
-def plot_complexity_measures(complexities, crypto, color):
-    plt.figure(figsize=(8, 6))
+# Longest series drawn as is; longer ones are decimated to about this many points
+MAX_POINTS = 2000
+
+COLORS = ['orange', 'blue']
+
+# Shape-preserving decimation (min/max per bucket): split the values into equal buckets and
+# keep each bucket's first, last, minimum and maximum positions, so peaks and troughs survive
+def _decimation_positions(values, max_points):
+    n = len(values)
+    n_buckets = max(1, max_points // 4)
+    length = -(-n // n_buckets)
+    padded = np.full(n_buckets * length, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(n_buckets, length)
+    starts = np.arange(n_buckets) * length
+    positions = np.concatenate([starts, np.minimum(starts + length - 1, n - 1),
+                                starts + np.where(np.isnan(padded), np.inf, padded).argmin(axis=1),
+                                starts + np.where(np.isnan(padded), -np.inf, padded).argmax(axis=1)])
+    return np.unique(positions[positions < n])
+
+def decimate(series, max_points=MAX_POINTS):
+    if len(series) <= max_points:
+        return series
+    return series.iloc[_decimation_positions(series.to_numpy(dtype=float), max_points)]
+
+# Decimate the columns of a frame onto one shared index: the union of each column's kept
+# positions (with the point budget split between the columns), so every row keeps all columns
+def decimate_frame(frame, max_points=MAX_POINTS):
+    if len(frame) <= max_points:
+        return frame
+    budget = max(1, max_points // frame.shape[1])
+    positions = [_decimation_positions(frame[column].to_numpy(dtype=float), budget) for column in frame]
+    return frame.iloc[np.unique(np.concatenate(positions))]
+
+# Show the figure interactively, or write it to path and release it
+def _finish(fig, path=None):
+    fig.tight_layout()
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+        plt.close(fig)
+
+def draw_complexity_measures(complexities, crypto, color, path=None):
+    fig = plt.figure(figsize=(8, 6))
     plt.bar(complexities.keys(), complexities.values(), color=color)
     plt.xlabel('Time Scale')
     plt.ylabel('Complexity')
     plt.title(f'Complexity Measures for {crypto} Transactions per Watt at Different Time Scales')
-    plt.tight_layout()
-    plt.show()
+    _finish(fig, path)
 
-def plot_cumulative_complexity(df, crypto, color):
-    cumulative_complexity = calculate_cumulative_complexity(df, crypto)
-    plt.figure(figsize=(12, 6))
+def draw_cumulative_complexity(cumulative_complexity, crypto, color, path=None):
+    cumulative_complexity = decimate(cumulative_complexity)
+    fig = plt.figure(figsize=(12, 6))
     plt.plot(cumulative_complexity, color=color, label=crypto)
     plt.xlabel('Date')
     plt.ylabel('Cumulative Complexity')
     plt.title(f'Cumulative Complexity for {crypto} Transactions per Watt')
     plt.legend()
-    plt.tight_layout()
-    plt.show()
+    _finish(fig, path)
+
+# Smoothed weekly or monthly complexity; period is 'Weekly' or 'Monthly'
+def draw_period_complexity(period_complexity, crypto, color, period, path=None):
+    smoothed_complexity = decimate(apply_ema(period_complexity['Complexity'], span=12))
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(smoothed_complexity.index, smoothed_complexity, color=color, label=crypto)
+    plt.xlabel('Date')
+    plt.ylabel(f'{period} Complexity (Smoothed)')
+    plt.title(f'{period} Complexity for {crypto} Transactions per Watt (Smoothed)')
+    plt.legend()
+    _finish(fig, path)
+
+def draw_period_complexity_marketcap(period_complexity_marketcap, crypto, color, period, path=None):
+    smoothed = decimate_frame(period_complexity_marketcap.assign(
+        Complexity=apply_ema(period_complexity_marketcap['Complexity'], span=12)))  # Apply smoothing to complexity
+    smoothed_complexity, market_cap = smoothed['Complexity'], smoothed['Market Cap']
+
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+    ax2 = ax1.twinx()
+
+    ax1.plot(smoothed_complexity.index, smoothed_complexity, color=color, label=f"{crypto} Complexity (Smoothed)")  # Use smoothed complexity
+    ax2.plot(market_cap.index, market_cap, color='green', label=f"{crypto} Market Cap")
+
+    ax1.set_xlabel('Date')
+    ax1.set_ylabel(f'{period} Complexity (Smoothed)')  # Update y-label
+    ax2.set_ylabel('Market Cap')
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    plt.title(f"{period} Complexity (Smoothed) and Market Cap for {crypto}")  # Update title
+    _finish(fig, path)
+
+def draw_cumulative_complexity_marketcap(cumulative_complexity_marketcap, crypto, color, path=None):
+    decimated = decimate_frame(cumulative_complexity_marketcap[['Complexity', 'Market Cap']])
+    complexity, market_cap = decimated['Complexity'], decimated['Market Cap']
+
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+    ax2 = ax1.twinx()
+
+    ax1.plot(complexity.index, complexity, color=color, label=f"{crypto} Complexity")
+    ax2.plot(market_cap.index, market_cap, color='green', label=f"{crypto} Market Cap")
+
+    ax1.set_xlabel('Date')
+    ax1.set_ylabel('Cumulative Complexity')
+    ax2.set_ylabel('Market Cap')
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    plt.title(f"Cumulative Complexity and Market Cap for {crypto}")
+    _finish(fig, path)
+
+def plot_complexity_measures(complexities, crypto, color):
+    draw_complexity_measures(complexities, crypto, color)
+
+def plot_cumulative_complexity(df, crypto, color):
+    draw_cumulative_complexity(calculate_cumulative_complexity(df, crypto), crypto, color)
 
 def calculate_cumulative_complexity(df, crypto):
     state_column = f"{crypto} Transactions per kW State"
-    cumulative_complexity = []
-    
-    for i in range(len(df)):
-        data_slice = df.iloc[:i+1][state_column]
-        state_probs = data_slice.value_counts(normalize=True)
-        emergence = calculate_emergence(state_probs)
-        self_org = calculate_self_organization(emergence)
-        complexity = calculate_complexity(emergence, self_org)
-        cumulative_complexity.append(complexity)
-    
-    return pd.Series(cumulative_complexity, index=df.index)
+    _, _, cumulative_complexity = calculate_cumulative_measures(df[state_column])
+    return cumulative_complexity
+
+# Weekly windows: the inclusive spans between consecutive Sundays of the index range
+def weekly_windows(index):
+    if not len(index):
+        return pd.DatetimeIndex([]), pd.DatetimeIndex([])
+    weeks = pd.date_range(start=index.min(), end=index.max(), freq='W')
+    return weeks[:-1], weeks[1:]
+
+# Monthly windows: the first to the last day of every month of the index range
+def monthly_windows(index):
+    if not len(index):
+        return pd.DatetimeIndex([]), pd.DatetimeIndex([])
+    months = pd.period_range(start=index.min(), end=index.max(), freq='M')
+    return months.start_time, months.end_time.normalize()
+
+# Mean of every window [left, right) of a series, skipping NaN, from prefix sums
+def window_means(values, left, right):
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    sums = np.r_[0.0, np.cumsum(np.where(valid, values, 0.0))]
+    counts = np.r_[0, np.cumsum(valid)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (sums[right] - sums[left]) / (counts[right] - counts[left])
+
+# Complexity of each window whose start and end dates are both rows of df, as the original
+# loops did, reporting how many windows that drops; keep_partial=True keeps those windows
+# too, over the rows they do have. A window without any state has complexity 0, as an
+# empty distribution has no emergence.
+def calculate_window_complexity_frame(df, crypto, windows, keep_partial=False):
+    state_column = f"{crypto} Transactions per kW State"
+    complexity, dropped = calculate_window_complexity(df[state_column], *windows, keep_partial)
+    if dropped:
+        print(f"{crypto}: skipped {dropped} of {len(windows[0])} windows whose first or last day has no row")
+    return complexity.fillna(0.0).to_frame('Complexity')
+
+# Mean market cap of the same windows
+def calculate_window_market_cap(df, marketcap_col, windows, keep_partial=False):
+    left, right, _ = anchored_window_bounds(df.index, *windows, keep_partial)
+    return window_means(df[marketcap_col], left, right)
 
 def plot_weekly_complexity(df, crypto, color):
     weekly_complexity = calculate_weekly_complexity(df, crypto)
     if not weekly_complexity.empty:
-        smoothed_complexity = apply_ema(weekly_complexity['Complexity'], span=12)
-        
-        plt.figure(figsize=(12, 6))
-        plt.plot(weekly_complexity.index, smoothed_complexity, color=color, label=crypto)
-        plt.xlabel('Date')
-        plt.ylabel('Weekly Complexity (Smoothed)')
-        plt.title(f'Weekly Complexity for {crypto} Transactions per Watt (Smoothed)')
-        plt.legend()
-        plt.tight_layout()
-        plt.show()
+        draw_period_complexity(weekly_complexity, crypto, color, 'Weekly')
 
-def calculate_weekly_complexity(df, crypto):
-    state_column = f"{crypto} Transactions per kW State"
-    weekly_complexity = []
-    
-    start_date = df.index.min()
-    end_date = df.index.max()
-    weeks = pd.date_range(start=start_date, end=end_date, freq='W')
-    
-    for week_start, week_end in zip(weeks[:-1], weeks[1:]):
-        if week_start in df.index and week_end in df.index:
-            data_slice = df.loc[week_start:week_end][state_column]
-            if not data_slice.empty:
-                state_probs = data_slice.value_counts(normalize=True)
-                emergence = calculate_emergence(state_probs)
-                self_org = calculate_self_organization(emergence)
-                complexity = calculate_complexity(emergence, self_org)
-            else:
-                complexity = np.nan
-            weekly_complexity.append({'Date': week_end, 'Complexity': complexity})
-    
-    if weekly_complexity:
-        weekly_complexity_df = pd.DataFrame(weekly_complexity, columns=['Date', 'Complexity']).set_index('Date')
-        return weekly_complexity_df
-    else:
-        return pd.DataFrame()
+def calculate_weekly_complexity(df, crypto, keep_partial=False):
+    return calculate_window_complexity_frame(df, crypto, weekly_windows(df.index), keep_partial)
 
 def apply_ema(data, span):
     return data.ewm(span=span, adjust=False).mean()
@@ -85,170 +181,115 @@ def apply_ema(data, span):
 def plot_monthly_complexity(df, crypto, color):
     monthly_complexity = calculate_monthly_complexity(df, crypto)
     if not monthly_complexity.empty:
-        smoothed_complexity = apply_ema(monthly_complexity['Complexity'], span=12)
-        
-        plt.figure(figsize=(12, 6))
-        plt.plot(monthly_complexity.index, smoothed_complexity, color=color, label=crypto)
-        plt.xlabel('Date')
-        plt.ylabel('Monthly Complexity (Smoothed)')
-        plt.title(f'Monthly Complexity for {crypto} Transactions per Watt (Smoothed)')
-        plt.legend()
-        plt.tight_layout()
-        plt.show()
+        draw_period_complexity(monthly_complexity, crypto, color, 'Monthly')
 
-def calculate_monthly_complexity(df, crypto):
-    state_column = f"{crypto} Transactions per kW State"
-    monthly_complexity = []
-    
-    for month_start, month_end in zip(df.resample('MS').first().index, df.resample('M').last().index):
-        if month_start in df.index and month_end in df.index:
-            data_slice = df.loc[month_start:month_end][state_column]
-            state_probs = data_slice.value_counts(normalize=True)
-            emergence = calculate_emergence(state_probs)
-            self_org = calculate_self_organization(emergence)
-            complexity = calculate_complexity(emergence, self_org)
-            monthly_complexity.append({'Date': month_end, 'Complexity': complexity})
-    
-    if monthly_complexity:
-        monthly_complexity_df = pd.DataFrame(monthly_complexity, columns=['Date', 'Complexity']).set_index('Date')
-        return monthly_complexity_df
-    else:
-        return pd.DataFrame()
+def calculate_monthly_complexity(df, crypto, keep_partial=False):
+    return calculate_window_complexity_frame(df, crypto, monthly_windows(df.index), keep_partial)
 
 def plot_weekly_complexity_marketcap(df, crypto, color):
     marketcap_col = f"{crypto.lower()}_market_cap"
     weekly_complexity_marketcap = calculate_weekly_complexity_marketcap(df, crypto, marketcap_col)
-    
     if not weekly_complexity_marketcap.empty:
-        smoothed_complexity = apply_ema(weekly_complexity_marketcap['Complexity'], span=12)  # Apply smoothing to complexity
-        
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        ax2 = ax1.twinx()
-        
-        ax1.plot(weekly_complexity_marketcap.index, smoothed_complexity, color=color, label=f"{crypto} Complexity (Smoothed)")  # Use smoothed complexity
-        ax2.plot(weekly_complexity_marketcap.index, weekly_complexity_marketcap['Market Cap'], color='green', label=f"{crypto} Market Cap")
-        
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel('Weekly Complexity (Smoothed)')  # Update y-label
-        ax2.set_ylabel('Market Cap')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-        plt.title(f"Weekly Complexity (Smoothed) and Market Cap for {crypto}")  # Update title
-        plt.tight_layout()
-        plt.show()
+        draw_period_complexity_marketcap(weekly_complexity_marketcap, crypto, color, 'Weekly')
 
-def calculate_weekly_complexity_marketcap(df, crypto, marketcap_col):
-    state_column = f"{crypto} Transactions per kW State"
-    weekly_complexity_marketcap = []
-    
-    start_date = df.index.min()
-    end_date = df.index.max()
-    weeks = pd.date_range(start=start_date, end=end_date, freq='W')
-    
-    for week_start, week_end in zip(weeks[:-1], weeks[1:]):
-        if week_start in df.index and week_end in df.index:
-            data_slice = df.loc[week_start:week_end][[state_column, marketcap_col]]
-            if not data_slice.empty:
-                state_probs = data_slice[state_column].value_counts(normalize=True)
-                emergence = calculate_emergence(state_probs)
-                self_org = calculate_self_organization(emergence)
-                complexity = calculate_complexity(emergence, self_org)
-                market_cap = data_slice[marketcap_col].mean()
-                weekly_complexity_marketcap.append({'Date': week_end, 'Complexity': complexity, 'Market Cap': market_cap})
-    
-    if weekly_complexity_marketcap:
-        weekly_complexity_marketcap_df = pd.DataFrame(weekly_complexity_marketcap, columns=['Date', 'Complexity', 'Market Cap']).set_index('Date')
-        return weekly_complexity_marketcap_df
-    else:
-        return pd.DataFrame()
+def calculate_weekly_complexity_marketcap(df, crypto, marketcap_col, keep_partial=False):
+    windows = weekly_windows(df.index)
+    weekly_complexity_marketcap = calculate_window_complexity_frame(df, crypto, windows, keep_partial)
+    weekly_complexity_marketcap['Market Cap'] = calculate_window_market_cap(df, marketcap_col, windows, keep_partial)
+    return weekly_complexity_marketcap
 
 def plot_monthly_complexity_marketcap(df, crypto, color):
     marketcap_col = f"{crypto.lower()}_market_cap"
     monthly_complexity_marketcap = calculate_monthly_complexity_marketcap(df, crypto, marketcap_col)
-    
     if not monthly_complexity_marketcap.empty:
-        smoothed_complexity = apply_ema(monthly_complexity_marketcap['Complexity'], span=12)  # Apply smoothing to complexity
-        
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        ax2 = ax1.twinx()
-        
-        ax1.plot(monthly_complexity_marketcap.index, smoothed_complexity, color=color, label=f"{crypto} Complexity (Smoothed)")  # Use smoothed complexity
-        ax2.plot(monthly_complexity_marketcap.index, monthly_complexity_marketcap['Market Cap'], color='green', label=f"{crypto} Market Cap")
-        
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel('Monthly Complexity (Smoothed)')  # Update y-label
-        ax2.set_ylabel('Market Cap')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-        plt.title(f"Monthly Complexity (Smoothed) and Market Cap for {crypto}")  # Update title
-        plt.tight_layout()
-        plt.show()
+        draw_period_complexity_marketcap(monthly_complexity_marketcap, crypto, color, 'Monthly')
 
-def calculate_monthly_complexity_marketcap(df, crypto, marketcap_col):
-    state_column = f"{crypto} Transactions per kW State"
-    monthly_complexity_marketcap = []
-    
-    for month_start, month_end in zip(df.resample('MS').first().index, df.resample('M').last().index):
-        if month_start in df.index and month_end in df.index:
-            data_slice = df.loc[month_start:month_end][[state_column, marketcap_col]]
-            state_probs = data_slice[state_column].value_counts(normalize=True)
-            emergence = calculate_emergence(state_probs)
-            self_org = calculate_self_organization(emergence)
-            complexity = calculate_complexity(emergence, self_org)
-            market_cap = data_slice[marketcap_col].mean()
-            monthly_complexity_marketcap.append({'Date': month_end, 'Complexity': complexity, 'Market Cap': market_cap})
-    
-    if monthly_complexity_marketcap:
-        monthly_complexity_marketcap_df = pd.DataFrame(monthly_complexity_marketcap, columns=['Date', 'Complexity', 'Market Cap']).set_index('Date')
-        return monthly_complexity_marketcap_df
-    else:
-        return pd.DataFrame()
+def calculate_monthly_complexity_marketcap(df, crypto, marketcap_col, keep_partial=False):
+    windows = monthly_windows(df.index)
+    monthly_complexity_marketcap = calculate_window_complexity_frame(df, crypto, windows, keep_partial)
+    monthly_complexity_marketcap['Market Cap'] = calculate_window_market_cap(df, marketcap_col, windows, keep_partial)
+    return monthly_complexity_marketcap
 
 def plot_cumulative_complexity_marketcap(df, crypto, color):
     marketcap_col = f"{crypto.lower()}_market_cap"
     cumulative_complexity_marketcap = calculate_cumulative_complexity_marketcap(df, crypto, marketcap_col)
-    
     if not cumulative_complexity_marketcap.empty:
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        ax2 = ax1.twinx()
-        
-        ax1.plot(cumulative_complexity_marketcap.index, cumulative_complexity_marketcap['Complexity'], color=color, label=f"{crypto} Complexity")
-        ax2.plot(cumulative_complexity_marketcap.index, cumulative_complexity_marketcap['Market Cap'], color='green', label=f"{crypto} Market Cap")
-        
-        ax1.set_xlabel('Date')
-        ax1.set_ylabel('Cumulative Complexity')
-        ax2.set_ylabel('Market Cap')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-        plt.title(f"Cumulative Complexity and Market Cap for {crypto}")
-        plt.tight_layout()
-        plt.show()
+        draw_cumulative_complexity_marketcap(cumulative_complexity_marketcap, crypto, color)
 
 def calculate_cumulative_complexity_marketcap(df, crypto, marketcap_col):
     state_column = f"{crypto} Transactions per kW State"
-    cumulative_complexity_marketcap = []
-    
-    for i in range(len(df)):
-        data_slice = df.iloc[:i+1][[state_column, marketcap_col]]
-        state_probs = data_slice[state_column].value_counts(normalize=True)
-        emergence = calculate_emergence(state_probs)
-        self_org = calculate_self_organization(emergence)
-        complexity = calculate_complexity(emergence, self_org)
-        market_cap = data_slice[marketcap_col].iloc[-1]  # Use the last market cap value instead of the mean
-        cumulative_complexity_marketcap.append({'Date': df.index[i], 'Complexity': complexity, 'Market Cap': market_cap})
-    
-    if cumulative_complexity_marketcap:
-        cumulative_complexity_marketcap_df = pd.DataFrame(cumulative_complexity_marketcap, columns=['Date', 'Complexity', 'Market Cap']).set_index('Date')
+
+    if len(df):
+        _, _, complexity = calculate_cumulative_measures(df[state_column])
+        # The market cap on each row is the last value of its prefix
+        cumulative_complexity_marketcap_df = pd.DataFrame({'Complexity': complexity, 'Market Cap': df[marketcap_col]})
+        cumulative_complexity_marketcap_df.index.name = 'Date'
         return cumulative_complexity_marketcap_df
     else:
         return pd.DataFrame()
 
-# Plotting
-for crypto, color in zip(CRYPTOS, ['orange', 'blue']):
-    plot_complexity_measures(complexity_results[crypto], crypto, color)
-    plot_cumulative_complexity(data_with_states, crypto, color)
-    plot_weekly_complexity(data_with_states, crypto, color)
-    plot_monthly_complexity(data_with_states, crypto, color)
-    plot_weekly_complexity_marketcap(data, crypto, color)
-    plot_monthly_complexity_marketcap(data, crypto, color)
-    plot_cumulative_complexity_marketcap(data, crypto, color)
\ No newline at end of file
+# Plot every figure for each cryptocurrency; df must already carry the state columns
+def plot_all(df, complexity_results, cryptos=CRYPTOS):
+    for crypto, color in zip(cryptos, COLORS):
+        plot_complexity_measures(complexity_results[crypto], crypto, color)
+        plot_cumulative_complexity(df, crypto, color)
+        plot_weekly_complexity(df, crypto, color)
+        plot_monthly_complexity(df, crypto, color)
+        if f"{crypto.lower()}_market_cap" in df:
+            plot_weekly_complexity_marketcap(df, crypto, color)
+            plot_monthly_complexity_marketcap(df, crypto, color)
+            plot_cumulative_complexity_marketcap(df, crypto, color)
+
+# Draw calls for every figure of one crypto, as (figure name, draw function name, data,
+# extra arguments). Weekly, monthly and cumulative complexity are computed once and shared
+# by the plain and market cap figures; long cumulative series are decimated here, before
+# they are sent to a worker (complexity and market cap together, on one shared index).
+# Market cap figures need the crypto's market cap column.
+def figure_tasks(df, complexity_results, crypto, color):
+    state_column = f"{crypto} Transactions per kW State"
+    marketcap_col = f"{crypto.lower()}_market_cap"
+    weeks, months = weekly_windows(df.index), monthly_windows(df.index)
+    weekly = calculate_window_complexity_frame(df, crypto, weeks)
+    monthly = calculate_window_complexity_frame(df, crypto, months)
+    _, _, cumulative = calculate_cumulative_measures(df[state_column])
+
+    tasks = [('complexity_measures', 'draw_complexity_measures', dict(complexity_results[crypto]), ()),
+             ('cumulative', 'draw_cumulative_complexity', decimate(cumulative), ()),
+             ('weekly', 'draw_period_complexity', weekly, ('Weekly',)),
+             ('monthly', 'draw_period_complexity', monthly, ('Monthly',))]
+    if marketcap_col in df:
+        tasks += [('weekly_marketcap', 'draw_period_complexity_marketcap',
+                   weekly.assign(**{'Market Cap': calculate_window_market_cap(df, marketcap_col, weeks)}), ('Weekly',)),
+                  ('monthly_marketcap', 'draw_period_complexity_marketcap',
+                   monthly.assign(**{'Market Cap': calculate_window_market_cap(df, marketcap_col, months)}), ('Monthly',)),
+                  ('cumulative_marketcap', 'draw_cumulative_complexity_marketcap',
+                   decimate_frame(pd.DataFrame({'Complexity': cumulative, 'Market Cap': df[marketcap_col]})), ())]
+    return [(f"{crypto.lower()}_{name}", draw, data, (crypto, color) + extra) for name, draw, data, extra in tasks]
+
+def _use_agg():
+    plt.switch_backend('Agg')
+
+def _render(task):
+    draw, data, args, path = task
+    globals()[draw](data, *args, path=path)
+    return path
+
+# Write every figure to output_dir without a display: the Agg backend, independent figures
+# spread over worker processes (processes=1 renders in this process)
+def render_all(df, complexity_results, output_dir, cryptos=CRYPTOS, processes=None, fmt='png'):
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for crypto, color in zip(cryptos, itertools.cycle(COLORS)):
+        for name, draw, data, args in figure_tasks(df, complexity_results, crypto, color):
+            tasks.append((draw, data, args, os.path.join(output_dir, f"{name}.{fmt}")))
+    if processes == 1:
+        _use_agg()
+        return [_render(task) for task in tasks]
+    with ProcessPoolExecutor(processes, initializer=_use_agg) as pool:
+        return list(pool.map(_render, tasks))
+
+if __name__ == "__main__":
+    from pipeline import Pipeline
+
+    pipeline = Pipeline()
+    plot_all(pipeline['states'], pipeline['scale_complexities'], pipeline.cryptos)
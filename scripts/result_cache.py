@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout or any cached computation changes meaning
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.environ.get(
+    'COMPLEXITY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'cryptoeconomic-complexity'))
+DEFAULT_MAX_BYTES = 1 << 30
+MANIFEST = 'manifest.json'
+
+# Content hash of the input files and the parameters that produced a result
+def cache_key(stage, input_paths, **params):
+    digest = hashlib.sha256(f"{CACHE_VERSION}:{stage}".encode())
+    for path in input_paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return f"{stage}-{digest.hexdigest()[:32]}"
+
+# Arrays to write for one column ({suffix: array}), plus the manifest entry needed to
+# rebuild it. Object columns are stored as strings with a mask of their missing values.
+def _encode_column(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return {'': np.asarray(values.cat.codes)}, {'kind': 'categorical', 'categories': list(values.cat.categories)}
+    if values.dtype == object:
+        missing = values.isna().to_numpy()
+        return {'': np.asarray(values.where(~missing, ''), dtype=str), '_mask': missing}, {'kind': 'string'}
+    return {'': np.asarray(values)}, {'kind': 'array'}
+
+def _decode_column(load, stem, spec):
+    array = load(f"{stem}.npy")
+    if spec['kind'] == 'categorical':
+        return pd.Categorical.from_codes(array, categories=spec['categories'])
+    if spec['kind'] == 'string':
+        strings = array.astype(object)
+        strings[load(f"{stem}_mask.npy")] = None
+        return strings
+    return array
+
+def _save_column(directory, stem, values):
+    arrays, spec = _encode_column(values)
+    for suffix, array in arrays.items():
+        np.save(os.path.join(directory, f"{stem}{suffix}.npy"), array)
+    return spec
+
+# Content-addressed store of DataFrames as one .npy file per column, loaded memory-mapped
+class ResultCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self._entry_dir(key), MANIFEST))
+
+    def get(self, key):
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        os.utime(manifest_path)  # the manifest mtime records the last access
+        load = lambda name: np.load(os.path.join(self._entry_dir(key), name), mmap_mode='r')
+        index = pd.Index(_decode_column(load, 'index', manifest['index']), name=manifest['index_name'])
+        columns = {column['name']: _decode_column(load, column['stem'], column)
+                   for column in manifest['columns']}
+        return pd.DataFrame(columns, index=index, copy=False)
+
+    def put(self, key, df):
+        tmp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_dir)
+        index_spec = _save_column(tmp_dir, 'index', df.index.to_series())
+        columns = []
+        for i, name in enumerate(df.columns):
+            spec = _save_column(tmp_dir, f"col_{i:04d}", df[name])
+            spec.update(name=name, stem=f"col_{i:04d}")
+            columns.append(spec)
+        manifest = {'key': key, 'created': time.time(), 'rows': len(df),
+                    'index': index_spec, 'index_name': df.index.name, 'columns': columns}
+        with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        os.replace(tmp_dir, self._entry_dir(key))
+        self.evict(keep=key)
+
+    def entries(self):
+        rows = []
+        for key in os.listdir(self.root):
+            manifest_path = os.path.join(self._entry_dir(key), MANIFEST)
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            size = sum(entry.stat().st_size for entry in os.scandir(self._entry_dir(key)))
+            rows.append({'Key': key, 'Rows': manifest['rows'], 'Columns': len(manifest['columns']),
+                         'Bytes': size, 'Created': pd.to_datetime(manifest['created'], unit='s'),
+                         'Last Access': pd.to_datetime(os.path.getmtime(manifest_path), unit='s')})
+        entries = pd.DataFrame(rows, columns=['Key', 'Rows', 'Columns', 'Bytes', 'Created', 'Last Access'])
+        return entries.sort_values('Last Access', ascending=False, ignore_index=True)
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def evict(self, keep=None):
+        entries = self.entries()
+        total = entries['Bytes'].sum()
+        for _, entry in entries[::-1].iterrows():
+            if total <= self.max_bytes:
+                break
+            if entry['Key'] != keep:
+                self.clear([entry['Key']])
+                total -= entry['Bytes']
+
+    def clear(self, keys=None):
+        keys = os.listdir(self.root) if keys is None else keys
+        for key in keys:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the complexity result cache')
+    parser.add_argument('command', choices=['list', 'clear'])
+    parser.add_argument('keys', nargs='*', help='entries to clear (default: all)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache_dir)
+    if args.command == 'list':
+        entries = cache.entries()
+        print(entries.to_string(index=False) if len(entries) else 'Cache is empty')
+        print(f"\nTotal: {entries['Bytes'].sum() / 1e6:.1f} MB in {args.cache_dir}")
+    else:
+        cache.clear(args.keys or None)
+
+if __name__ == "__main__":
+    main()
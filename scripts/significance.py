@@ -0,0 +1,153 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+STATISTICS = ['Pearson', 'Spearman', 'Mutual Information']
+
+# Resamples evaluated together; bounds the (resamples x observations) working arrays
+CHUNK_ELEMENTS = 2_000_000
+
+# Default block length for daily series: n^(1/3), at least 2
+def default_block_length(n):
+    return max(2, int(round(n ** (1 / 3))))
+
+# Moving-block bootstrap: each row draws random block starts; the last block is cut short
+# so that every row has n observations
+def block_bootstrap_starts(n, n_resamples, block_length, rng):
+    n_blocks = -(-n // block_length)
+    return rng.integers(0, n - block_length + 1, size=(n_resamples, n_blocks))
+
+def block_bootstrap_indices(starts, n, block_length):
+    return (starts[:, :, None] + np.arange(block_length)).reshape(len(starts), -1)[:, :n]
+
+# Block permutation: each row reorders the whole blocks, keeping within-block
+# autocorrelation; a trailing partial block stays in place
+def block_permutation_orders(n, n_resamples, block_length, rng):
+    return np.argsort(rng.random((n_resamples, n // block_length)), axis=1)
+
+def block_permutation_indices(orders, n, block_length):
+    idx = (orders[:, :, None] * block_length + np.arange(block_length)).reshape(len(orders), -1)
+    tail = np.broadcast_to(np.arange(idx.shape[1], n), (len(orders), n - idx.shape[1]))
+    return np.hstack([idx, tail])
+
+# Dense rank (0-based id of the distinct value) of every observation and the number of values
+def _dense_ids(values):
+    unique, ids = np.unique(values, return_inverse=True)
+    return ids, len(unique)
+
+def rowwise_pearson(x, y):
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x * y).sum(axis=1) / np.sqrt((x * x).sum(axis=1) * (y * y).sum(axis=1))
+
+# Mutual information (nats) of a stack of joint bin-count tables (rows x bins x bins)
+def mutual_info_from_counts(joint):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        joint = joint / joint.sum(axis=(1, 2), keepdims=True)
+        marginals = joint.sum(axis=2, keepdims=True) * joint.sum(axis=1, keepdims=True)
+        terms = np.where(joint > 0, joint * np.log(joint / marginals), 0.0)
+    return terms.sum(axis=(1, 2))
+
+# Mutual information (nats) of every row pair of bin codes, from one bincount
+def rowwise_mutual_info(x_bins, y_bins, n_bins):
+    rows = x_bins.shape[0]
+    flat = (np.arange(rows)[:, None] * n_bins * n_bins + x_bins * n_bins + y_bins).ravel()
+    return mutual_info_from_counts(np.bincount(flat, minlength=rows * n_bins * n_bins).reshape(rows, n_bins, n_bins))
+
+# Average ranks within every resample row without sorting: value_ids are the dense ranks of
+# the original values, so a row's ranks follow from how often it drew each distinct value
+def rowwise_resample_ranks(value_ids, n_values, idx):
+    rows = idx.shape[0]
+    drawn = value_ids[idx]
+    counts = np.bincount((np.arange(rows)[:, None] * n_values + drawn).ravel(),
+                         minlength=rows * n_values).reshape(rows, n_values).astype(np.float32)
+    value_ranks = np.cumsum(counts, axis=1) - (counts - 1) / 2
+    return np.take_along_axis(value_ranks, drawn, axis=1)
+
+# Pearson correlation of every bootstrap row from block sums of the centred moments:
+# a row's sums are the sums over its blocks, read from prefix sums by block start
+def bootstrap_pearson(x, y, starts, block_length):
+    n = len(x)
+    x = x - x.mean()
+    y = y - y.mean()
+    prefix = np.vstack([np.zeros(5), np.cumsum(np.column_stack([x, y, x * x, y * y, x * y]), axis=0)])
+    last_length = n - (starts.shape[1] - 1) * block_length
+    moments = (prefix[starts[:, :-1] + block_length] - prefix[starts[:, :-1]]).sum(axis=1)
+    moments += prefix[starts[:, -1] + last_length] - prefix[starts[:, -1]]
+    sx, sy, sxx, syy, sxy = moments.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+
+# Pearson correlation of x with every block permutation of y: means and variances do not
+# change, and the cross term is a sum of entries of the block-by-block product matrix
+def permutation_pearson(x, y, orders, block_length):
+    x = x - x.mean()
+    y = y - y.mean()
+    n_full = orders.shape[1] * block_length
+    cross = x[:n_full].reshape(-1, block_length) @ y[:n_full].reshape(-1, block_length).T
+    sxy = cross[np.arange(orders.shape[1]), orders].sum(axis=1) + x[n_full:] @ y[n_full:]
+    return sxy / np.sqrt((x @ x) * (y @ y))
+
+# Pearson, Spearman and MI for a batch of resamples. Bootstrap rows are re-ranked (they
+# contain duplicates); permutations only move y, so its precomputed ranks are reused.
+def resampled_statistics(kind, arrays, draws, block_length):
+    x, y, x_rank, y_rank, x_bins, y_bins, n_bins = arrays
+    n = len(x)
+    if kind == 'bootstrap':
+        idx = block_bootstrap_indices(draws, n, block_length)
+        spearman = rowwise_pearson(rowwise_resample_ranks(*_dense_ids(x), idx),
+                                   rowwise_resample_ranks(*_dense_ids(y), idx))
+        return (bootstrap_pearson(x, y, draws, block_length), spearman,
+                rowwise_mutual_info(x_bins[idx], y_bins[idx], n_bins))
+    idx = block_permutation_indices(draws, n, block_length)
+    return (permutation_pearson(x, y, draws, block_length),
+            permutation_pearson(x_rank, y_rank, draws, block_length),
+            rowwise_mutual_info(np.broadcast_to(x_bins, idx.shape), y_bins[idx], n_bins))
+
+def _run_chunk(task):
+    kind, arrays, n_resamples, block_length, seed = task
+    rng = np.random.default_rng(seed)
+    make_draws = block_bootstrap_starts if kind == 'bootstrap' else block_permutation_orders
+    draws = make_draws(len(arrays[0]), n_resamples, block_length, rng)
+    return kind, np.column_stack(resampled_statistics(kind, arrays, draws, block_length))
+
+# Block-bootstrap confidence intervals and block-permutation p-values for Pearson,
+# Spearman and binned mutual information. Resamples are generated as batched index arrays
+# in chunks; chunks have fixed seeds, so results do not depend on the number of processes.
+def correlation_significance(x, y, x_bins, y_bins, n_bins=10, n_resamples=10000, block_length=None,
+                             confidence=0.95, seed=0, processes=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    block_length = block_length or default_block_length(n)
+    arrays = (x, y, stats.rankdata(x), stats.rankdata(y), np.asarray(x_bins), np.asarray(y_bins), n_bins)
+    observed = np.array([stats.pearsonr(x, y)[0], stats.spearmanr(x, y)[0],
+                         rowwise_mutual_info(arrays[4][None], arrays[5][None], n_bins)[0]])
+
+    chunk = max(1, CHUNK_ELEMENTS // max(n, 1))
+    sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(2 * len(sizes))
+    tasks = [(kind, arrays, size, block_length, seeds[2 * i + (kind == 'permutation')])
+             for i, size in enumerate(sizes) for kind in ('bootstrap', 'permutation')]
+    if processes and processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+    bootstrap = np.vstack([values for kind, values in results if kind == 'bootstrap'])
+    permutation = np.vstack([values for kind, values in results if kind == 'permutation'])
+
+    alpha = (1 - confidence) / 2
+    low, high = np.nanquantile(bootstrap, [alpha, 1 - alpha], axis=0)
+    # Correlations are tested two-sided, mutual information one-sided
+    exceed = np.abs(permutation) >= np.abs(observed)
+    p_values = (1 + exceed.sum(axis=0)) / (1 + len(permutation))
+
+    summary = {}
+    for i, statistic in enumerate(STATISTICS):
+        summary[f"{statistic} CI Low"] = low[i]
+        summary[f"{statistic} CI High"] = high[i]
+        summary[f"{statistic} Permutation p-value"] = p_values[i]
+    return summary
@@ -1,27 +1,40 @@
 import pandas as pd
 import numpy as np
-from data_preperation import data
-
-def define_states(value, percentiles, labels):
-    for i, percentile in enumerate(percentiles):
-        if value < percentile:
-            return labels[i]
-    return labels[-1]
+from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+from binning import adaptive_thresholds, state_labels
+from complexity_engine import define_state_codes, make_state_column
+from instrumentation import instrumented
 
+@instrumented('states')
 def apply_state_definitions(df, cryptos, percentiles, labels):
     for crypto in cryptos:
         crypto_column = f"{crypto} Transactions per kW"
         state_column = f"{crypto} Transactions per kW State"
-        crypto_df = df[crypto_column].dropna()
-        percentile_values = np.percentile(crypto_df, percentiles)
-        df[state_column] = crypto_df.apply(lambda x: define_states(x, percentile_values, labels))
+        values = df[crypto_column].to_numpy(dtype=float)
+        percentile_values = np.percentile(values[~np.isnan(values)], percentiles)
+        codes = define_state_codes(values, percentile_values)
+        df[state_column] = make_state_column(codes, labels, df.index)
+    return df
+
+# Drop-in alternative to apply_state_definitions with data-driven thresholds per chain
+# (see binning.METHODS); the labels are used when a chain ends up with that many states
+@instrumented('states')
+def apply_adaptive_state_definitions(df, cryptos, method, labels, **binning_args):
+    for crypto in cryptos:
+        crypto_column = f"{crypto} Transactions per kW"
+        state_column = f"{crypto} Transactions per kW State"
+        values = df[crypto_column].to_numpy(dtype=float)
+        thresholds = adaptive_thresholds(values, method, len(labels), **binning_args)
+        codes = define_state_codes(values, thresholds)
+        df[state_column] = make_state_column(codes, state_labels(len(thresholds) + 1, labels), df.index)
     return df
 
-# Example usage
 CRYPTOS = ['Bitcoin', 'Ethereum']
 STATE_PERCENTILES = [10, 30, 70, 90]
 STATE_LABELS = ['Very Low', 'Low', 'High', 'Very High', 'Extremely High']
 
-# Assuming you have loaded the data into a DataFrame called 'data'
-data_with_states = apply_state_definitions(data, CRYPTOS, STATE_PERCENTILES, STATE_LABELS)
-print(data_with_states.head())
\ No newline at end of file
+if __name__ == "__main__":
+    # Example usage
+    data = load_and_prepare_data(DEFAULT_MASTER_CSV)
+    data_with_states = apply_state_definitions(data, CRYPTOS, STATE_PERCENTILES, STATE_LABELS)
+    print(data_with_states.head())
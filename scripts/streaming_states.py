@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from complexity_engine import make_state_column
+
+# Values at or below this are counted as zero by QuantileSketch
+MIN_POSITIVE = 1e-12
+
+# Observations needed before expanding-window states are assigned
+MIN_PERIODS = 30
+
+# Bounded-memory quantile sketch with relative accuracy (DDSketch-style): values are counted
+# in logarithmic buckets whose width is set by relative_accuracy, so any quantile is returned
+# within that relative error whatever the order or range of the stream. Updates are O(1);
+# once there are more than max_buckets buckets the lowest ones are merged.
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0  # bucket key of counts[0]
+        self.zero_count = 0
+        self.count = 0
+
+    def update(self, x):
+        self.count += 1
+        if x <= MIN_POSITIVE:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(x) / self._log_gamma)
+        if not self.counts.size:
+            self.counts = np.zeros(1, dtype=np.int64)
+            self.offset = key
+        elif key < self.offset:
+            self.counts = np.concatenate([np.zeros(self.offset - key, dtype=np.int64), self.counts])
+            self.offset = key
+        elif key >= self.offset + self.counts.size:
+            self.counts = np.concatenate([self.counts, np.zeros(key - self.offset - self.counts.size + 1, dtype=np.int64)])
+        self.counts[key - self.offset] += 1
+        self._collapse()
+
+    # Vectorised update with a whole array of values; NaN values are skipped
+    def update_batch(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        positive = values > MIN_POSITIVE
+        self.zero_count += int(len(values) - positive.sum())
+        keys = np.ceil(np.log(values[positive]) / self._log_gamma).astype(np.int64)
+        if not keys.size:
+            return
+        low, high = int(keys.min()), int(keys.max())
+        if self.counts.size:
+            low, high = min(low, self.offset), max(high, self.offset + self.counts.size - 1)
+        counts = np.zeros(high - low + 1, dtype=np.int64)
+        counts[self.offset - low:self.offset - low + self.counts.size] = self.counts
+        counts += np.bincount(keys - low, minlength=counts.size)
+        self.counts, self.offset = counts, low
+        self._collapse()
+
+    # Merge the lowest buckets once there are more than max_buckets
+    def _collapse(self):
+        excess = self.counts.size - self.max_buckets
+        if excess > 0:
+            self.counts[excess] += self.counts[:excess].sum()
+            self.counts = self.counts[excess:]
+            self.offset += excess
+
+    # Value range (lower, upper] certain to hold the value of each 0-based rank: its bucket
+    # widened by one bucket either side against rounding in the key computation. Ranks among
+    # the zero values give (-inf, MIN_POSITIVE]; the lowest bucket, which may hold merged
+    # buckets, extends down to -inf.
+    def rank_brackets(self, ranks):
+        ranks = np.asarray(ranks) - self.zero_count
+        buckets = np.minimum(np.searchsorted(np.cumsum(self.counts), ranks, side='right'), self.counts.size - 1)
+        lower = np.where((ranks < 0) | (buckets == 0), -np.inf, self.gamma ** (self.offset + buckets - 2))
+        upper = np.where(ranks < 0, MIN_POSITIVE, self.gamma ** (self.offset + buckets + 1))
+        return lower, upper
+
+    # Quantiles (fractions in [0, 1]) ranked like np.percentile's linear method
+    def quantiles(self, qs):
+        if not self.count:
+            return np.full(len(qs), np.nan)
+        ranks = np.asarray(qs) * (self.count - 1) - self.zero_count
+        buckets = np.searchsorted(np.cumsum(self.counts), ranks, side='right')
+        values = 2 * self.gamma ** (self.offset + np.minimum(buckets, self.counts.size - 1)) / (self.gamma + 1)
+        return np.where(ranks < 0, 0.0, values)
+
+    def to_dict(self):
+        return {'relative_accuracy': self.relative_accuracy, 'max_buckets': self.max_buckets,
+                'counts': self.counts.tolist(), 'offset': self.offset,
+                'zero_count': self.zero_count, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state['relative_accuracy'], state['max_buckets'])
+        sketch.counts = np.array(state['counts'], dtype=np.int64)
+        sketch.offset = state['offset']
+        sketch.zero_count = state['zero_count']
+        sketch.count = state['count']
+        return sketch
+
+# Online state thresholds: the percentiles of every value seen so far, from one sketch
+class StreamingThresholds:
+    def __init__(self, percentiles, relative_accuracy=0.01):
+        self.percentiles = list(percentiles)
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    @property
+    def count(self):
+        return self.sketch.count
+
+    @property
+    def thresholds(self):
+        return self.sketch.quantiles(np.asarray(self.percentiles) / 100)
+
+    def update(self, value):
+        if not np.isnan(value):
+            self.sketch.update(value)
+
+    # Add a value, then return its state code under the thresholds known so far
+    def classify(self, value, min_periods=1):
+        self.update(value)
+        if np.isnan(value) or self.count < min_periods:
+            return -1
+        return int(np.searchsorted(self.thresholds, value, side='right'))
+
+    def to_dict(self):
+        return {'percentiles': self.percentiles, 'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        thresholds = cls(state['percentiles'])
+        thresholds.sketch = QuantileSketch.from_dict(state['sketch'])
+        return thresholds
+
+# Look-ahead-free state codes: each value is classified with the percentiles of the values
+# up to and including it. 'sketch' streams through a QuantileSketch in a single pass;
+# 'exact' uses exact expanding percentiles. Rows before min_periods observations get -1.
+def expanding_state_codes(values, percentiles, min_periods=MIN_PERIODS, method='sketch'):
+    values = pd.Series(values, dtype=float)
+    if method == 'exact':
+        expanding = values.dropna().expanding(min_periods=min_periods)
+        thresholds = np.column_stack([expanding.quantile(percentile / 100) for percentile in percentiles])
+        codes = np.full(len(values), -1, dtype=np.int8)
+        observed = values.notna().to_numpy()
+        ready = ~np.isnan(thresholds[:, 0])
+        observed_codes = (values.dropna().to_numpy()[:, None] >= thresholds).sum(axis=1).astype(np.int8)
+        codes[np.flatnonzero(observed)[ready]] = observed_codes[ready]
+        return codes
+    stream = StreamingThresholds(percentiles)
+    return np.array([stream.classify(value, min_periods) for value in values.to_numpy()], dtype=np.int8)
+
+# Drop-in alternative to apply_state_definitions without look-ahead
+def apply_expanding_state_definitions(df, cryptos, percentiles, labels, min_periods=MIN_PERIODS, method='sketch'):
+    for crypto in cryptos:
+        crypto_column = f"{crypto} Transactions per kW"
+        state_column = f"{crypto} Transactions per kW State"
+        codes = expanding_state_codes(df[crypto_column], percentiles, min_periods, method)
+        df[state_column] = make_state_column(codes, labels, df.index)
+    return df
@@ -0,0 +1,222 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from complexity import CRYPTOS, STATE_PERCENTILES, TIME_SCALES
+from complexity_engine import calendar_buckets, define_state_codes
+from multichain import matrix_percentiles, matrix_state_codes
+from significance import block_permutation_indices, block_permutation_orders, default_block_length
+
+# Null models:
+# - 'shuffle': random permutation of the days (no temporal structure at all)
+# - 'block-shuffle': permutation of whole blocks of days, keeping short-range structure
+# - 'phase-randomized': Fourier surrogate with the power spectrum (linear autocorrelation)
+#   of the log series and random phases; states come from each surrogate's own percentiles
+# - 'aaft': amplitude-adjusted Fourier transform (Theiler et al.), the original values
+#   reordered to follow a phase-randomized Gaussian version of the series
+SURROGATES = ['shuffle', 'block-shuffle', 'phase-randomized', 'aaft']
+
+N_SURROGATES = 10000
+
+# Measures of every chain and time scale: the scale measures of complexity.py (from the
+# distribution of modal states across buckets) and the mean complexity of the buckets
+MEASURES = ['Emergence', 'Self-organization', 'Complexity', 'Mean Bucket Complexity']
+
+RESULT_COLUMNS = ['Crypto', 'Surrogate', 'Time Scale', 'Measure', 'Observed', 'Null Mean', 'Null Std',
+                  'z-score', 'p-value']
+
+# Surrogates generated and measured together; bounds the (surrogates x days) working arrays
+CHUNK_ELEMENTS = 2_000_000
+
+# Rows of Fourier surrogates of x (surrogates x n): the amplitudes of x's spectrum with
+# uniformly random phases; the mean (and the Nyquist term of even n) keep their phase
+def phase_randomized(x, n_surrogates, rng):
+    n = len(x)
+    spectrum = np.fft.rfft(x - x.mean())
+    phases = rng.uniform(0, 2 * np.pi, size=(n_surrogates, len(spectrum)))
+    phases[:, 0] = 0
+    if n % 2 == 0:
+        phases[:, -1] = 0
+    return np.fft.irfft(np.abs(spectrum) * np.exp(1j * phases), n=n) + x.mean()
+
+# Rank of every element within its row
+def _rowwise_ranks(values):
+    ranks = np.empty(values.shape, dtype=np.int64)
+    np.put_along_axis(ranks, np.argsort(values, axis=1), np.arange(values.shape[1]), axis=1)
+    return ranks
+
+# AAFT orderings (surrogates x n): index into the sorted values for every day. A Gaussian
+# series with the ranks of x is phase-randomized and x's sorted values are laid out in the
+# rank order of the result, so each surrogate is a permutation of the original values.
+def aaft_orders(x, n_surrogates, rng):
+    gaussian = np.sort(rng.standard_normal(len(x)))[_rowwise_ranks(x[None, :])[0]]
+    return _rowwise_ranks(phase_randomized(gaussian, n_surrogates, rng))
+
+# State codes of a batch of surrogates of one chain's observed days (surrogates x n).
+# Percentile states depend only on the ranks, so surrogates that permute the original
+# values (all but the phase-randomized ones) permute the original codes directly.
+def surrogate_codes(kind, values, codes, n_surrogates, rng, percentiles, block_length):
+    n = len(values)
+    if kind == 'shuffle':
+        return codes[rng.permuted(np.broadcast_to(np.arange(n), (n_surrogates, n)), axis=1)]
+    if kind == 'block-shuffle':
+        orders = block_permutation_orders(n, n_surrogates, block_length, rng)
+        return codes[block_permutation_indices(orders, n, block_length)]
+    if kind == 'aaft':
+        return np.sort(codes)[aaft_orders(values, n_surrogates, rng)]
+    if kind == 'phase-randomized':
+        surrogates = phase_randomized(np.log(values), n_surrogates, rng)
+        mask = np.ones(surrogates.shape, dtype=bool)
+        return matrix_state_codes(surrogates, mask, matrix_percentiles(surrogates, mask, percentiles))
+    raise ValueError(f"Unknown surrogate {kind!r} (expected one of {SURROGATES})")
+
+# Emergence, self-organization and complexity of every row of an integer count array
+# (..., n_states), as measures_from_counts but with c * log2(c) looked up in a table and
+# the sums over the short state axis done as products with a vector of ones
+def _measures_from_int_counts(counts):
+    values = np.arange(int(counts.max()) + 1, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = np.where(values > 0, values * np.log2(values), 0.0)
+    ones = np.ones(counts.shape[-1])
+    totals = counts @ ones
+    observed = (counts > 0) @ ones
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = np.log2(totals) - (table[counts] @ ones) / totals
+        emergence = np.where(observed > 1, entropy / np.log2(np.maximum(observed, 2)), 0.0)
+    self_organization = 1 - emergence
+    return emergence, self_organization, 4 * emergence * self_organization
+
+# Day of the previous occurrence of every day's state in its row (-1 if none); a day is the
+# first of its state in a bucket when that occurrence falls before the bucket starts
+def _previous_occurrence(codes, n_states):
+    days = np.arange(codes.shape[1])
+    previous = np.full(codes.shape, -1, dtype=np.int64)
+    for state in range(n_states):
+        is_state = codes == state
+        last_seen = np.maximum.accumulate(np.where(is_state, days, -1), axis=1)
+        previous[:, 1:] = np.where(is_state[:, 1:], last_seen[:, :-1], previous[:, 1:])
+    return previous
+
+# Scale measures of every row of a code matrix (rows x days, all observed) for one
+# bucketing: per-bucket counts from one bincount, the modal state of every bucket (ties go
+# to the state seen first in the bucket, as in modal_states), then the measures of the
+# modal state distribution and the mean bucket complexity. Returns (rows x 4).
+def batch_scale_measures(codes, previous, bucket_ids, bucket_starts, n_states):
+    rows, n = codes.shape
+    n_buckets = len(bucket_starts)
+    row_ids = np.arange(rows)[:, None]
+    if n_buckets == n:
+        # One day per bucket: the modal state is the day's state and no bucket has complexity
+        modal, bucket_complexity = codes, np.zeros(rows)
+    else:
+        flat = (row_ids * n_buckets + bucket_ids) * n_states + codes
+        counts = np.bincount(flat.ravel(), minlength=rows * n_buckets * n_states).reshape(rows, n_buckets, n_states)
+        first = previous < bucket_starts[bucket_ids]
+        first_seen = np.full(rows * n_buckets * n_states, n, dtype=np.int64)
+        first_seen[flat[first]] = np.broadcast_to(np.arange(n), (rows, n))[first]
+        first_seen = first_seen.reshape(counts.shape)
+
+        is_max = (counts == counts.max(axis=2, keepdims=True)) & (counts > 0)
+        modal = np.where(is_max, first_seen, np.iinfo(np.int64).max).argmin(axis=2)
+        bucket_complexity = _measures_from_int_counts(counts)[2].mean(axis=1)
+    modal_counts = np.bincount((row_ids * n_states + modal).ravel(), minlength=rows * n_states)
+    emergence, self_organization, complexity = _measures_from_int_counts(modal_counts.reshape(rows, n_states))
+    return np.column_stack([emergence, self_organization, complexity, bucket_complexity])
+
+# Measures of a code matrix at every bucketing (rows x scales x measures)
+def batch_measures(codes, bucketings, n_states):
+    previous = _previous_occurrence(codes, n_states)
+    return np.stack([batch_scale_measures(codes, previous, bucket_ids, bucket_starts, n_states)
+                     for bucket_ids, bucket_starts in bucketings], axis=1)
+
+def _run_chunk(task):
+    kind, values, codes, bucketings, n_states, n_surrogates, percentiles, block_length, seed = task
+    rng = np.random.default_rng(seed)
+    batch = surrogate_codes(kind, values, codes, n_surrogates, rng, percentiles, block_length)
+    return batch_measures(batch, bucketings, n_states)
+
+# Bucket number of every observed day and the first observed day of every bucket; only
+# buckets with observations exist, as in build_count_pyramid
+def _bucketing(dates, time_scale):
+    bucket_ids, _ = calendar_buckets(dates, time_scale)
+    _, dense = np.unique(bucket_ids, return_inverse=True)
+    return dense, np.flatnonzero(np.r_[True, dense[1:] != dense[:-1]])
+
+# Observed measures, surrogate null distributions, z-scores and two-sided empirical
+# p-values for every chain, surrogate kind, time scale and measure. Surrogates of a chain
+# are its observed days only (missing days stay missing) and are generated in chunks with
+# seeds spawned in a fixed order, so results do not depend on the number of processes.
+def surrogate_significance(df, cryptos=CRYPTOS, kinds=SURROGATES, n_surrogates=N_SURROGATES,
+                           time_scales=TIME_SCALES, percentiles=STATE_PERCENTILES, block_length=None,
+                           seed=0, processes=None):
+    tasks, observed, keys = [], {}, []
+    chain_seeds = np.random.SeedSequence(seed).spawn(len(cryptos))
+    for crypto, chain_seed in zip(cryptos, chain_seeds):
+        values = df[f"{crypto} Transactions per kW"].to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        values = values[present]
+        codes = define_state_codes(values, np.percentile(values, percentiles)).astype(np.int64)
+        n_states = len(percentiles) + 1
+        dates = df.index[present]
+        bucketings = [_bucketing(dates, time_scale) for time_scale in time_scales]
+        observed[crypto] = batch_measures(codes[None, :], bucketings, n_states)[0]
+
+        chunk = max(1, CHUNK_ELEMENTS // len(values))
+        sizes = [min(chunk, n_surrogates - start) for start in range(0, n_surrogates, chunk)]
+        for kind, kind_seed in zip(kinds, chain_seed.spawn(len(kinds))):
+            for size, chunk_seed in zip(sizes, kind_seed.spawn(len(sizes))):
+                tasks.append((kind, values, codes, bucketings, n_states, size, percentiles,
+                              block_length or default_block_length(len(values)), chunk_seed))
+                keys.append((crypto, kind))
+
+    if processes and processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+
+    rows = []
+    for crypto in cryptos:
+        for kind in kinds:
+            null = np.concatenate([result for key, result in zip(keys, results) if key == (crypto, kind)])
+            mean, std = null.mean(axis=0), null.std(axis=0)
+            deviation = np.abs(observed[crypto] - mean)
+            # Deviations within rounding of the observed one count as reaching it
+            exceed = (np.abs(null - mean) >= deviation - 1e-12).sum(axis=0)
+            # Measures the null model cannot change (e.g. daily buckets under a permutation)
+            # have a spread of rounding error only and no z-score
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z_scores = np.where(std > 1e-12, (observed[crypto] - mean) / std, np.nan)
+            p_values = (1 + exceed) / (1 + len(null))
+            for i, time_scale in enumerate(time_scales):
+                for j, measure in enumerate(MEASURES):
+                    rows.append([crypto, kind, time_scale, measure, observed[crypto][i, j], mean[i, j],
+                                 std[i, j], z_scores[i, j], p_values[i, j]])
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+def main():
+    from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+    parser = argparse.ArgumentParser(description='Surrogate null models for the significance of the complexity measures')
+    parser.add_argument('--master-csv', default=DEFAULT_MASTER_CSV)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--surrogates', nargs='+', default=SURROGATES, choices=SURROGATES)
+    parser.add_argument('--n-surrogates', type=int, default=N_SURROGATES)
+    parser.add_argument('--time-scales', nargs='+', default=TIME_SCALES)
+    parser.add_argument('--block-length', type=int, help='block-shuffle block length in days (default n^(1/3))')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', help='CSV with one row per chain, surrogate, time scale and measure')
+    args = parser.parse_args()
+
+    results = surrogate_significance(load_and_prepare_data(args.master_csv), args.cryptos, args.surrogates,
+                                     args.n_surrogates, args.time_scales, block_length=args.block_length,
+                                     seed=args.seed, processes=args.processes)
+    with pd.option_context('display.width', 200, 'display.max_rows', None):
+        print(results[results['Measure'] == 'Complexity'].to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from binning import METHODS as BINNING_METHODS, adaptive_thresholds
+from complexity import CRYPTOS, STATE_LABELS, STATE_PERCENTILES, TIME_SCALES
+from complexity_engine import (bucket_measures, build_count_pyramid, define_state_codes, make_state_column,
+                               modal_state_measures)
+from data_preperation import DEFAULT_MASTER_CSV, load_and_prepare_data
+
+# Each configuration is a percentile set ('Percentiles') or an adaptive method ('Binning');
+# the other column is empty
+RESULT_COLUMNS = ['Config', 'Crypto', 'Percentiles', 'Binning', 'States', 'Time Scale',
+                  'Emergence', 'Self-organization', 'Complexity', 'Mean Bucket Complexity']
+
+# Evenly spaced percentile cut points giving n_states states
+def percentiles_for_states(n_states):
+    return [round(100.0 * i / n_states, 6) for i in range(1, n_states)]
+
+# Every combination of crypto and state definition; all time scales of a configuration
+# are evaluated together from one count pyramid. Adaptive binnings (binning.METHODS) are
+# added per crypto; the entropy method once for every n_states (default: one per label).
+def expand_grid(cryptos=CRYPTOS, percentiles=(STATE_PERCENTILES,), n_states=(), time_scales=TIME_SCALES,
+                binnings=()):
+    definitions = [{'percentiles': [float(p) for p in definition]} for definition in percentiles]
+    definitions += [{'percentiles': percentiles_for_states(n)} for n in n_states]
+    for method in binnings:
+        counts = (list(n_states) or [len(STATE_LABELS)]) if method == 'entropy' else [None]
+        definitions += [{'binning': method, 'n_states': count} for count in counts]
+    return [{'crypto': crypto, **definition, 'time_scales': list(time_scales)}
+            for crypto, definition in itertools.product(cryptos, definitions)]
+
+def config_id(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+# Per-process view of the shared values matrix (days x cryptos), attached once per worker
+_shared = {}
+
+def _attach(shm_name, shape, columns, dates):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    values.flags.writeable = False
+    _shared.update(shm=shm, values=values, columns=columns, index=pd.DatetimeIndex(dates, name='Date'))
+
+def _detach():
+    shm = _shared.pop('shm', None)
+    _shared.clear()
+    if shm is not None:
+        shm.close()
+
+# Tidy result rows (one per time scale) for a single configuration
+def run_config(config):
+    values = _shared['values'][:, _shared['columns'].index(config['crypto'])]
+    if 'binning' in config:
+        thresholds = adaptive_thresholds(values, config['binning'], config['n_states'] or len(STATE_LABELS))
+        percentiles, binning = None, config['binning']
+    else:
+        thresholds = np.percentile(values[~np.isnan(values)], config['percentiles'])
+        percentiles, binning = '-'.join(f"{p:g}" for p in config['percentiles']), None
+    labels = list(range(len(thresholds) + 1))
+    states = make_state_column(define_state_codes(values, thresholds), labels, _shared['index'])
+    pyramid = build_count_pyramid(states, config['time_scales'])
+    rows = []
+    for scale in config['time_scales']:
+        emergence, self_org, complexity = modal_state_measures(pyramid[scale])
+        rows.append([config_id(config), config['crypto'], percentiles, binning, len(labels), scale, emergence, self_org,
+                     complexity, bucket_measures(pyramid[scale])['Complexity'].mean()])
+    return rows
+
+# Configurations whose rows are all present in the checkpoint
+def _completed(checkpoint_path, configs):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return set()
+    done = pd.read_csv(checkpoint_path, usecols=['Config'], on_bad_lines='skip')['Config'].value_counts()
+    return {config_id(config) for config in configs if done.get(config_id(config), 0) >= len(config['time_scales'])}
+
+# Run every configuration across a process pool. The transactions-per-kW columns live in
+# one shared memory block that workers map read-only, so tasks carry only their config.
+# Rows are appended to checkpoint_path as each configuration finishes; rerunning with the
+# same checkpoint skips configurations already recorded there. Only the rows of the
+# requested configs are returned, whatever else the checkpoint holds.
+def run_sweep(df, configs, checkpoint_path=None, processes=None, chunksize=8):
+    done = _completed(checkpoint_path, configs)
+    pending = [config for config in configs if config_id(config) not in done]
+    cryptos = sorted({config['crypto'] for config in configs})
+    matrix = np.ascontiguousarray(df[[f"{crypto} Transactions per kW" for crypto in cryptos]].to_numpy(dtype=np.float64))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+    np.ndarray(matrix.shape, dtype=np.float64, buffer=shm.buf)[:] = matrix
+    initargs = (shm.name, matrix.shape, cryptos, df.index.values)
+    checkpoint = None
+    if checkpoint_path:
+        new_file = not os.path.exists(checkpoint_path)
+        checkpoint = open(checkpoint_path, 'a')
+        if new_file:
+            checkpoint.write(','.join(RESULT_COLUMNS) + '\n')
+    pool = None
+    results = []
+    try:
+        if processes == 1:
+            _attach(*initargs)
+            completed = map(run_config, pending)
+        else:
+            pool = Pool(processes, initializer=_attach, initargs=initargs)
+            completed = pool.imap_unordered(run_config, pending, chunksize)
+        for rows in completed:
+            results.extend(rows)
+            if checkpoint:
+                pd.DataFrame(rows).to_csv(checkpoint, header=False, index=False)
+                checkpoint.flush()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _detach()
+        if checkpoint:
+            checkpoint.close()
+        shm.close()
+        shm.unlink()
+
+    if checkpoint_path:
+        table = pd.read_csv(checkpoint_path, on_bad_lines='skip', dtype={'Percentiles': str, 'Binning': str})
+        table = table[table['Config'].isin({config_id(config) for config in configs})]
+        return table.drop_duplicates(['Config', 'Time Scale'], keep='last').reset_index(drop=True)
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep state definitions, time scales and cryptos in parallel')
+    parser.add_argument('--master-csv', default=DEFAULT_MASTER_CSV)
+    parser.add_argument('--cryptos', nargs='+', default=CRYPTOS)
+    parser.add_argument('--percentiles', nargs='*', default=[','.join(map(str, STATE_PERCENTILES))],
+                        help='comma-separated percentile sets, e.g. 10,30,70,90 5,25,75,95')
+    parser.add_argument('--n-states', nargs='*', type=int, default=[], help='state counts with evenly spaced percentiles')
+    parser.add_argument('--binning', nargs='*', default=[], choices=BINNING_METHODS,
+                        help='adaptive state binnings to add, e.g. entropy bayesian-blocks bic')
+    parser.add_argument('--time-scales', nargs='+', default=TIME_SCALES)
+    parser.add_argument('--checkpoint', default='sweep_results.csv')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    percentiles = [[float(p) for p in definition.split(',')] for definition in args.percentiles]
+    configs = expand_grid(args.cryptos, percentiles, args.n_states, args.time_scales, args.binning)
+    results = run_sweep(load_and_prepare_data(args.master_csv), configs, args.checkpoint, args.processes)
+    print(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+from complexity_engine import StateHistogram, calendar_buckets, rolling_window_starts, state_codes
+
+# Measures returned by markov_measures_from_counts, in order
+MARKOV_MEASURES = ['Conditional Entropy', 'Entropy Rate', 'Transition Emergence',
+                   'Transition Self-organization', 'Transition Complexity']
+
+# Squarings of the lazy transition matrix when solving for the stationary distribution;
+# 64 squarings cover 2**64 steps, far beyond the mixing time of any chain seen here
+MAX_SQUARINGS = 64
+
+# Code of every transition between consecutive rows, prev * n_states + next, placed at the
+# row the transition ends on (row 0 and transitions touching a missing state get -1)
+def pair_codes(codes, n_states):
+    codes = np.asarray(codes, dtype=np.int64)
+    pairs = np.full(len(codes), -1, dtype=np.int64)
+    if len(codes) > 1:
+        prev, following = codes[:-1], codes[1:]
+        pairs[1:] = np.where((prev >= 0) & (following >= 0), prev * n_states + following, -1)
+    return pairs
+
+# Transition count matrix (n_states x n_states, rows = from, columns = to) in one bincount
+def transition_counts(codes, n_states):
+    pairs = pair_codes(codes, n_states)
+    return np.bincount(pairs[pairs >= 0], minlength=n_states * n_states).reshape(n_states, n_states)
+
+# Row-normalised transition probabilities; rows of states never left are NaN
+def transition_matrix(counts):
+    counts = np.asarray(counts, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return counts / counts.sum(axis=-1, keepdims=True)
+
+# Entropy in bits of every row of a (..., k) count array; empty rows give 0
+def entropy_bits(counts):
+    totals = counts.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probabilities = counts / totals
+        terms = np.where(counts > 0, probabilities * np.log2(probabilities), 0.0)
+    return -terms.sum(axis=-1)
+
+# Stationary distribution of every (..., n, n) stochastic matrix, started from `start`.
+# The lazy chain (P + I) / 2 has the same stationary distributions but is aperiodic, and
+# repeated squaring reaches its limit in a few dozen matrix products. For a reducible chain
+# the result is the limit reached from `start`.
+def stationary_distribution(matrix, start):
+    n = matrix.shape[-1]
+    lazy = (matrix + np.eye(n)) / 2
+    for _ in range(MAX_SQUARINGS):
+        squared = lazy @ lazy
+        # Renormalise: rounding in the row sums would otherwise compound with every squaring
+        squared /= squared.sum(axis=-1, keepdims=True)
+        converged = np.abs(squared - lazy).max() < 1e-13
+        lazy = squared
+        if converged:
+            break
+    return np.einsum('...i,...ij->...j', start, lazy)
+
+# Markov measures of every (..., n_states, n_states) transition count array:
+# - conditional entropy H(next | prev) in bits, from the empirical pair frequencies
+# - entropy rate in bits, the row entropies weighted by the stationary distribution of the
+#   estimated transition matrix (states never left are treated as absorbing)
+# - transition emergence, self-organization and complexity: the conditional entropy
+#   normalised by log2 of the number of states seen in the transitions, then 1 - E and 4ES
+# Arrays without any transition give NaN throughout.
+def markov_measures_from_counts(counts):
+    counts = np.asarray(counts, dtype=float)
+    n = counts.shape[-1]
+    outgoing = counts.sum(axis=-1)
+    total = outgoing.sum(axis=-1)
+    joint_entropy = entropy_bits(counts.reshape(counts.shape[:-2] + (n * n,)))
+    conditional_entropy = np.maximum(joint_entropy - entropy_bits(outgoing), 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        matrix = np.where(outgoing[..., None] > 0, counts / outgoing[..., None], np.eye(n))
+        start = outgoing / total[..., None]
+    start = np.where(total[..., None] > 0, start, 1.0 / n)
+    entropy_rate = (stationary_distribution(matrix, start) * entropy_bits(counts)).sum(axis=-1)
+
+    observed = ((outgoing > 0) | (counts.sum(axis=-2) > 0)).sum(axis=-1)
+    emergence = np.where(observed > 1, conditional_entropy / np.log2(np.maximum(observed, 2)), 0.0)
+    emergence = np.minimum(emergence, 1.0)
+    self_organization = 1 - emergence
+    complexity = 4 * emergence * self_organization
+    measures = [conditional_entropy, entropy_rate, emergence, self_organization, complexity]
+    return tuple(np.where(total > 0, measure, np.nan) for measure in measures)
+
+# Transition matrix (labelled by state) and Markov measures of a whole state series
+def calculate_transition_measures(states):
+    codes, n_states = state_codes(states)
+    counts = transition_counts(codes, n_states)
+    labels = states.cat.categories if isinstance(states.dtype, pd.CategoricalDtype) else range(n_states)
+    matrix = pd.DataFrame(transition_matrix(counts), index=labels, columns=labels)
+    measures = {name: float(value) for name, value in zip(MARKOV_MEASURES, markov_measures_from_counts(counts))}
+    return matrix, measures
+
+# Prefix transition counts with a leading zero row: the transitions ending on rows [a, b)
+# are prefix[b] - prefix[a], each row holding a flattened n_states x n_states count matrix
+def prefix_transition_counts(codes, n_states):
+    pairs = pair_codes(codes, n_states)
+    counts = np.zeros((len(pairs) + 1, n_states * n_states), dtype=np.int64)
+    valid = np.flatnonzero(pairs >= 0)
+    counts[valid + 1, pairs[valid]] = 1
+    return np.cumsum(counts, axis=0, out=counts)
+
+def _measure_frame(counts, n_states, index):
+    measures = markov_measures_from_counts(counts.reshape(len(counts), n_states, n_states))
+    return pd.DataFrame(dict(zip(MARKOV_MEASURES, measures)), index=index)
+
+# Markov measures of every prefix of a state series (the transitions up to each row)
+def calculate_cumulative_transition_measures(states):
+    codes, n_states = state_codes(states)
+    prefix = prefix_transition_counts(codes, n_states)
+    return _measure_frame(prefix[1:], n_states, states.index)
+
+# Markov measures over a trailing window of `days` days ending at each row. Only
+# transitions with both rows inside the window count, so the window [left, right) holds
+# the transitions ending on rows left + 1 .. right - 1. Rows whose window reaches before
+# the first date are NaN, as in calculate_rolling_measures.
+def calculate_rolling_transition_measures(states, days):
+    codes, n_states = state_codes(states)
+    prefix = prefix_transition_counts(codes, n_states)
+    right = np.arange(1, len(states) + 1)
+    left = np.minimum(rolling_window_starts(states.index, days) + 1, right)
+    measures = _measure_frame(prefix[right] - prefix[left], n_states, states.index)
+    measures[states.index < states.index[0] + pd.Timedelta(days=days - 1)] = np.nan
+    return measures
+
+# Markov measures of every calendar bucket, from the transitions within the bucket,
+# indexed by bucket end date (see calendar_buckets)
+def calculate_period_transition_measures(states, freq):
+    codes, n_states = state_codes(states)
+    pairs = pair_codes(codes, n_states)
+    bucket_ids, bucket_ends = calendar_buckets(states.index, freq)
+    within = np.r_[False, bucket_ids[1:] == bucket_ids[:-1]] & (pairs >= 0)
+    flat = bucket_ids[within] * n_states * n_states + pairs[within]
+    counts = np.bincount(flat, minlength=len(bucket_ends) * n_states * n_states)
+    return _measure_frame(counts.reshape(len(bucket_ends), -1), n_states, pd.DatetimeIndex(bucket_ends, name='Date'))
+
+# Streaming transition counts: add or remove one transition at a time and read the
+# conditional entropy and transition measures back in O(1). H(next | prev) is
+# (sum r log2 r - sum c log2 c) / total over row totals r and pair counts c, and both
+# sums are kept up to date incrementally.
+class TransitionHistogram:
+    def __init__(self, n_states):
+        self.n_states = n_states
+        self.counts = np.zeros((n_states, n_states), dtype=np.int64)
+        self.outgoing = np.zeros(n_states, dtype=np.int64)
+        self.touches = np.zeros(n_states, dtype=np.int64)
+        self.total = 0
+        self.observed = 0
+        self._pair_clogc = 0.0
+        self._row_clogc = 0.0
+
+    def _update(self, prev, following, step):
+        clogc = StateHistogram._clogc
+        self._pair_clogc += clogc(self.counts[prev, following] + step) - clogc(self.counts[prev, following])
+        self._row_clogc += clogc(self.outgoing[prev] + step) - clogc(self.outgoing[prev])
+        self.counts[prev, following] += step
+        self.outgoing[prev] += step
+        self.total += step
+        for state in {prev, following}:
+            before = self.touches[state] > 0
+            self.touches[state] += step
+            self.observed += int(self.touches[state] > 0) - int(before)
+
+    def add(self, prev, following):
+        if prev >= 0 and following >= 0:
+            self._update(prev, following, 1)
+
+    def remove(self, prev, following):
+        if prev >= 0 and following >= 0:
+            self._update(prev, following, -1)
+
+    @property
+    def conditional_entropy(self):
+        if not self.total:
+            return np.nan
+        return max((self._row_clogc - self._pair_clogc) / self.total, 0.0)
+
+    @property
+    def emergence(self):
+        if not self.total:
+            return np.nan
+        if self.observed < 2:
+            return 0.0
+        return min(self.conditional_entropy / np.log2(self.observed), 1.0)
+
+    @property
+    def self_organization(self):
+        return 1 - self.emergence
+
+    @property
+    def complexity(self):
+        return 4 * self.emergence * self.self_organization